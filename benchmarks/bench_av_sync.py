@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Lip-sync benchmark for the per-session media clock under load.
+
+Runs several concurrent sessions through WebSocketTestReceiver in real time
+(20ms voice chunks every 20ms) with the avatar renderer enabled, and a video
+sink that burns --sink-ms of CPU per frame as a stand-in for encoding or
+handing the frame to the publisher. Reports the A/V skew the media clock
+measured, the share of video frames within the ±40ms target, and how many
+frames it dropped or duplicated to hold that.
+
+Usage:
+    python benchmarks/bench_av_sync.py [--sessions 1 --sessions 8] [--seconds 5] [--sink-ms 2]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from bench_dispatch import ReplayWebSocket  # noqa: E402
+from media_clock import MAX_SKEW_MS  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+CHUNK_MS = 20
+SAMPLE_RATE = 16000
+
+
+def build_messages(seconds, quality):
+    """Init followed by speech-like voice chunks covering the given duration"""
+    init = json.dumps({"command": "init", "avatar_id": "bench", "quality": quality,
+                       "version": "v1", "video_encoding": "H264"})
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    pcm = (np.abs(np.sin(2 * np.pi * 3 * t)) * 16000 * np.sin(2 * np.pi * 180 * t)).astype("<i2").tobytes()
+    chunk_bytes = SAMPLE_RATE * CHUNK_MS // 1000 * 2
+    voice = [
+        json.dumps({"command": "voice", "audio": base64.b64encode(pcm[i:i + chunk_bytes]).decode("utf-8"),
+                    "sampleRate": SAMPLE_RATE, "encoding": "PCM16", "event_id": "bench"})
+        for i in range(0, len(pcm), chunk_bytes)
+    ]
+    return [init] + voice + [json.dumps({"command": "voice_end"})]
+
+
+class RealtimeReplayWebSocket(ReplayWebSocket):
+    """Replays voice chunks at the rate a live sender would produce them"""
+
+    async def _iterate(self):
+        start = time.monotonic()
+        for index, message in enumerate(self.messages):
+            delay = start + index * CHUNK_MS / 1000 - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield message
+        # Let the jitter buffer play out before disconnecting
+        await asyncio.sleep(0.3)
+
+
+async def measure(sessions, seconds, sink_ms, quality, output_dir):
+    def video_sink(client_id, frame, timestamp_ns):
+        deadline = time.perf_counter() + sink_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+
+    receiver = WebSocketTestReceiver(
+        output_wav_file=os.path.join(output_dir, "bench_av_sync.wav"),
+        video_frame_sink=video_sink,
+    )
+    receiver.save_audio = lambda *args, **kwargs: None
+    messages = build_messages(seconds, quality)
+    await asyncio.gather(*(receiver.handle_client(RealtimeReplayWebSocket(messages)) for _ in range(sessions)))
+    receiver.loop_lag.stop()
+
+    clocks = list(receiver.av_sync_stats.values())
+    stamped = sum(s["video_frames_stamped"] for s in clocks)
+    dropped = sum(s["video_frames_dropped"] for s in clocks)
+    measured = stamped + dropped
+    within = sum(s["av_within_target_pct"] * (s["video_frames_stamped"] + s["video_frames_dropped"])
+                 for s in clocks) / measured if measured else 100.0
+    return {
+        "sessions": sessions,
+        "sink_ms": sink_ms,
+        "video_frames": stamped,
+        "av_offset_ms_avg": sum(s["av_offset_ms"] for s in clocks) / len(clocks),
+        "av_skew_p99_abs_ms": max(s["av_skew_p99_abs_ms"] for s in clocks),
+        "av_within_target_pct": within,
+        "video_frames_dropped": dropped,
+        "video_frames_duplicated": sum(s["video_frames_duplicated"] for s in clocks),
+        "loop_lag_ms_max": receiver.loop_lag.stats()["loop_lag_ms_max"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark A/V skew of the media clock under load")
+    parser.add_argument("--sessions", type=int, action="append")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--sink-ms", type=float, default=2.0, help="CPU burned per video frame in the sink")
+    parser.add_argument("--quality", default="medium")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for sessions in args.sessions or [1, 4, 8, 16]:
+            results.append(asyncio.run(measure(sessions, args.seconds, args.sink_ms, args.quality, output_dir)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'sessions':>8} {'frames':>7} {'offset ms':>10} {'p99 |skew|':>11} "
+          f"{f'<={MAX_SKEW_MS}ms %':>9} {'dropped':>8} {'duplicated':>11} {'loop lag max':>13}")
+    for r in results:
+        print(f"{r['sessions']:>8} {r['video_frames']:>7} {r['av_offset_ms_avg']:>10.1f} "
+              f"{r['av_skew_p99_abs_ms']:>11} {r['av_within_target_pct']:>9.1f} {r['video_frames_dropped']:>8} "
+              f"{r['video_frames_duplicated']:>11} {r['loop_lag_ms_max']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
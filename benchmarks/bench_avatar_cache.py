@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-frame benchmark for the avatar asset cache.
+
+For each quality preset, measures the time from "init" to the first rendered
+frame (load the avatar's sprites, create the renderer, render one frame):
+
+  cold    nothing cached: the assets are built and written to the cache
+  warm    the cache file exists (e.g. warmed on /session/start by another
+          process) and only has to be mapped
+  hot     this process already has the assets mapped
+  nocache the renderer's built-in sprites, built from scratch, as before
+
+Usage:
+    python benchmarks/bench_avatar_cache.py [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from avatar_cache import AvatarCache  # noqa: E402
+from avatar_renderer import AvatarRenderer, QUALITY_PRESETS, build_procedural_sprites  # noqa: E402
+
+
+def first_frame_ms(load, quality):
+    start = time.perf_counter()
+    renderer = AvatarRenderer.for_quality(quality, 16000, load())
+    renderer.render(0)
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(quality, repeat):
+    width, height, _ = QUALITY_PRESETS[quality]
+    timings = {"cold": [], "warm": [], "hot": [], "nocache": []}
+    for index in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            avatar_id = f"bench-{index}"
+            builder = AvatarCache(directory)
+            timings["cold"].append(first_frame_ms(lambda: builder.get(avatar_id, quality), quality))
+            # A fresh cache object stands in for another worker process
+            worker = AvatarCache(directory)
+            timings["warm"].append(first_frame_ms(lambda: worker.get(avatar_id, quality), quality))
+            timings["hot"].append(first_frame_ms(lambda: worker.get(avatar_id, quality), quality))
+            timings["nocache"].append(first_frame_ms(lambda: build_procedural_sprites(width, height), quality))
+    result = {"quality": quality, "resolution": f"{width}x{height}"}
+    for name, values in timings.items():
+        result[f"{name}_ms"] = statistics.median(values)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time to first frame with the avatar cache")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = [measure(quality, args.repeat) for quality in QUALITY_PRESETS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'quality':>8} {'resolution':>11} {'nocache ms':>11} {'cold ms':>9} {'warm ms':>9} {'hot ms':>8}")
+    for r in results:
+        print(f"{r['quality']:>8} {r['resolution']:>11} {r['nocache_ms']:>11.2f} {r['cold_ms']:>9.2f} "
+              f"{r['warm_ms']:>9.2f} {r['hot_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
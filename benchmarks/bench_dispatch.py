@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Message-rate benchmark for WebSocketTestReceiver.handle_client.
+
+Drives the receiver's dispatch loop with pre-built 'voice' messages (no network)
+and reports messages per second on a single core for 20ms and 500ms chunks.
+
+Usage:
+    python benchmarks/bench_dispatch.py [--messages 20000] [--sample-rate 24000]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+CHUNK_DURATIONS_MS = [20, 500]
+
+
+class ReplayWebSocket:
+    """Minimal stand-in for a server connection that yields pre-built messages"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.remote_address = ("127.0.0.1", 0)
+        self.request_headers = {"authorization": "Bearer bench"}
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+
+
+def build_messages(count, chunk_ms, sample_rate):
+    """Build an init message followed by count voice messages"""
+    init = json.dumps({
+        "command": "init",
+        "avatar_id": "bench",
+        "quality": "high",
+        "version": "v1",
+        "video_encoding": "H264",
+    })
+    chunk = os.urandom(sample_rate * chunk_ms // 1000 * 2)
+    audio = base64.b64encode(chunk).decode("utf-8")
+    voice = [
+        json.dumps({
+            "command": "voice",
+            "audio": audio,
+            "sampleRate": sample_rate,
+            "encoding": "PCM16",
+            "event_id": str(uuid.uuid4()),
+        })
+        for _ in range(count)
+    ]
+    return [init] + voice
+
+
+async def measure(chunk_ms, count, sample_rate, output_dir):
+    """Return messages per second for one chunk duration"""
+    receiver = WebSocketTestReceiver(output_wav_file=os.path.join(output_dir, f"bench_{chunk_ms}ms.wav"))
+    # Keep the save step out of the measurement
+    receiver.save_audio = lambda *args, **kwargs: None
+    websocket = ReplayWebSocket(build_messages(count, chunk_ms, sample_rate))
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await receiver.handle_client(websocket)
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {
+        "chunk_ms": chunk_ms,
+        "messages": count,
+        "msgs_per_sec": count / wall,
+        "msgs_per_cpu_sec": count / cpu if cpu else float("inf"),
+        "audio_x_realtime": count * chunk_ms / 1000 / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the receiver dispatch hot path")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=int, default=24000)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    # Measure the dispatch path, not the log handler
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for chunk_ms in CHUNK_DURATIONS_MS:
+            count = args.messages if chunk_ms <= 100 else max(1, args.messages // 10)
+            results.append(asyncio.run(measure(chunk_ms, count, args.sample_rate, output_dir)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'chunk':>8} {'messages':>10} {'msgs/s':>12} {'msgs/cpu-s':>12} {'x realtime':>12}")
+    for r in results:
+        print(f"{r['chunk_ms']:>6}ms {r['messages']:>10} {r['msgs_per_sec']:>12.0f} "
+              f"{r['msgs_per_cpu_sec']:>12.0f} {r['audio_x_realtime']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
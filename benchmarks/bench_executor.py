@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Event-loop responsiveness benchmark for the receiver executor stage.
+
+Feeds chunks through WebSocketTestReceiver with a deliberately CPU-heavy
+chunk processor and reports event-loop lag and peak pool queue depth for
+the inline, thread and process executor modes.
+
+Usage:
+    python benchmarks/bench_executor.py [--chunks 200] [--work-ms 5]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from bench_dispatch import ReplayWebSocket, build_messages  # noqa: E402
+from executor_stage import EXECUTOR_MODES  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver, create_executor  # noqa: E402
+
+WORK_MS = 5
+
+
+def heavy_processor(audio_base64):
+    """Decode, then burn roughly WORK_MS of CPU to stand in for resampling/rendering"""
+    audio = base64.b64decode(audio_base64)
+    deadline = time.perf_counter() + WORK_MS / 1000
+    while time.perf_counter() < deadline:
+        pass
+    return audio
+
+
+class PacedReplayWebSocket(ReplayWebSocket):
+    """Replays messages with a small gap so the loop has idle time to measure"""
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+            await asyncio.sleep(0.001)
+
+
+async def measure(mode, chunks, output_dir):
+    executor = create_executor(mode)
+    receiver = WebSocketTestReceiver(
+        output_wav_file=os.path.join(output_dir, f"bench_{mode}.wav"),
+        executor=executor,
+        chunk_processor=heavy_processor,
+    )
+    receiver.save_audio = lambda *args, **kwargs: None
+    receiver.loop_lag.interval = 0.005
+    websocket = PacedReplayWebSocket(build_messages(chunks, 20, 24000))
+
+    start = time.perf_counter()
+    await receiver.handle_client(websocket)
+    wall = time.perf_counter() - start
+    stats = receiver.stats()
+    receiver.loop_lag.stop()
+    if executor is not None:
+        executor.shutdown()
+    return {
+        "mode": mode,
+        "chunks": chunks,
+        "wall_s": round(wall, 3),
+        "loop_lag_ms_avg": stats["loop_lag_ms_avg"],
+        "loop_lag_ms_max": stats["loop_lag_ms_max"],
+        "max_queue_depth": stats.get("executor_max_queue_depth", 0),
+    }
+
+
+def main():
+    global WORK_MS
+    parser = argparse.ArgumentParser(description="Benchmark event-loop lag per executor mode")
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--work-ms", type=float, default=WORK_MS)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    WORK_MS = args.work_ms
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = [asyncio.run(measure(mode, args.chunks, output_dir)) for mode in EXECUTOR_MODES]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':>8} {'chunks':>8} {'wall s':>8} {'lag avg ms':>11} {'lag max ms':>11} {'max queue':>10}")
+    for r in results:
+        print(f"{r['mode']:>8} {r['chunks']:>8} {r['wall_s']:>8.3f} {r['loop_lag_ms_avg']:>11.2f} "
+              f"{r['loop_lag_ms_max']:>11.2f} {r['max_queue_depth']:>10}")
+
+
+if __name__ == "__main__":
+    main()
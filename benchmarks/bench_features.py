@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Cost benchmark for the streaming lip-sync feature extractor.
+
+Feeds speech-like PCM16 audio to StreamingFeatureExtractor in 20ms and 500ms
+chunks and reports CPU microseconds per 10ms hop and how many realtime
+sessions one core could analyse.
+
+Usage:
+    python benchmarks/bench_features.py [--seconds 30] [--sample-rate 16000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from feature_extractor import StreamingFeatureExtractor, HOP_MS  # noqa: E402
+
+CHUNK_DURATIONS_MS = [20, 500]
+
+
+def build_audio(sample_rate, seconds):
+    """Voiced tone with a syllable envelope, alternating with noise bursts"""
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    voiced = np.sin(2 * np.pi * 140 * t) + 0.5 * np.sin(2 * np.pi * 280 * t)
+    noise = np.random.default_rng(0).normal(0, 0.3, len(t))
+    envelope = np.abs(np.sin(2 * np.pi * 2.5 * t))
+    signal = np.where((t * 2.5).astype(int) % 4 == 3, noise, voiced) * envelope * 12000
+    return np.clip(signal, -32768, 32767).astype("<i2").tobytes()
+
+
+def measure(audio, chunk_ms, sample_rate, seconds):
+    """Return per-hop cost for one chunk duration"""
+    extractor = StreamingFeatureExtractor(sample_rate)
+    chunk_bytes = sample_rate * chunk_ms // 1000 * 2
+    chunks = [audio[i:i + chunk_bytes] for i in range(0, len(audio), chunk_bytes)]
+
+    start = time.process_time()
+    for chunk in chunks:
+        extractor.process(chunk)
+    cpu = time.process_time() - start
+    hops = extractor.hops_processed
+    return {
+        "chunk_ms": chunk_ms,
+        "hops": hops,
+        "us_per_hop": cpu / hops * 1e6,
+        "sessions_per_core": seconds / cpu if cpu else float("inf"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lip-sync feature extractor")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    audio = build_audio(args.sample_rate, args.seconds)
+    results = [measure(audio, chunk_ms, args.sample_rate, args.seconds) for chunk_ms in CHUNK_DURATIONS_MS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'chunk':>8} {'hops':>8} {f'us/{HOP_MS}ms hop':>14} {'sessions/core':>14}")
+    for r in results:
+        print(f"{r['chunk_ms']:>6}ms {r['hops']:>8} {r['us_per_hop']:>14.1f} {r['sessions_per_core']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Frame transport benchmark: shared-memory frame ring versus the publisher pipe.
+
+Pushes I420 video frames to a stand-in consumer process for each quality
+preset, two ways:
+
+  pipe  PublisherIPC -> fake_child.py: every frame crosses the pipe inside a
+        FlatBuffers message and is reassembled by the child
+  ring  FrameRing -> ring_consumer.py: every frame is copied once into a
+        shared-memory slot and only a 24-byte control record crosses the pipe
+
+and reports frames/s plus producer and consumer CPU time per frame.
+
+Usage:
+    python benchmarks/bench_frame_ring.py [--seconds 3] [--quality medium]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from avatar_renderer import QUALITY_PRESETS, i420_size  # noqa: E402
+from frame_ring import FrameRing  # noqa: E402
+from publisher_ipc import PublisherIPC, child_args  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RECORDS_PER_WRITE = 4
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def result(transport, quality, frames, wall, producer_cpu, consumer_cpu, received):
+    width, height, _ = QUALITY_PRESETS[quality]
+    return {
+        "transport": transport,
+        "quality": quality,
+        "resolution": f"{width}x{height}",
+        "frames": frames,
+        "frames_per_sec": frames / wall,
+        "producer_us_per_frame": producer_cpu / frames * 1e6,
+        "consumer_us_per_frame": consumer_cpu / frames * 1e6,
+        "total_us_per_frame": (producer_cpu + consumer_cpu) / frames * 1e6,
+        "lost": received != frames,
+    }
+
+
+async def measure_pipe(quality, seconds):
+    width, height, fps = QUALITY_PRESETS[quality]
+    frame = bytes(i420_size(width, height))
+    final = {}
+
+    def on_status(name, message, info):
+        if name == "DISCONNECTED" and info:
+            final.update(json.loads(info))
+
+    args = child_args("bench", "bench", "1", width=width, height=height, frame_rate=fps)
+    ipc = PublisherIPC([sys.executable, os.path.join(BENCH_DIR, "fake_child.py")] + args, on_status=on_status)
+    await ipc.start()
+
+    child_cpu_start = children_cpu()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    frames = 0
+    while time.perf_counter() - start < seconds:
+        ipc.send_video(frame, frames)
+        frames += 1
+        await ipc.drain()
+        if frames % 4 == 0:
+            await asyncio.sleep(0)
+    await ipc.close()
+    wall = time.perf_counter() - start
+    producer_cpu = time.process_time() - cpu_start
+    return result("pipe", quality, frames, wall, producer_cpu, children_cpu() - child_cpu_start,
+                  final.get("video_frames"))
+
+
+def measure_ring(quality, seconds):
+    width, height, _ = QUALITY_PRESETS[quality]
+    frame_size = i420_size(width, height)
+    frame = bytes(frame_size)
+    ring = FrameRing(frame_size)
+
+    child_cpu_start = children_cpu()
+    consumer = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "ring_consumer.py"), ring.name, "--frame-size", str(frame_size)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    control = consumer.stdin.fileno()
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    frames = 0
+    records = []
+    while time.perf_counter() - start < seconds:
+        record = ring.write(frame, frames, timeout=0)
+        if record is None:
+            # Ring full: hand over what is pending and give the consumer a moment
+            if records:
+                os.write(control, b"".join(records))
+                records = []
+            time.sleep(0.0002)
+            continue
+        records.append(record)
+        frames += 1
+        if len(records) >= RECORDS_PER_WRITE:
+            os.write(control, b"".join(records))
+            records = []
+    if records:
+        os.write(control, b"".join(records))
+    consumer.stdin.close()
+    counts = json.loads(consumer.stdout.read())
+    consumer.wait()
+    wall = time.perf_counter() - start
+    producer_cpu = time.process_time() - cpu_start
+    ring.close()
+    return result("ring", quality, frames, wall, producer_cpu, children_cpu() - child_cpu_start, counts["frames"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared-memory frame ring against the pipe path")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--quality", choices=list(QUALITY_PRESETS), action="append")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = []
+    for quality in args.quality or list(QUALITY_PRESETS):
+        results.append(asyncio.run(measure_pipe(quality, args.seconds)))
+        results.append(measure_ring(quality, args.seconds))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'transport':>9} {'resolution':>11} {'frames/s':>10} {'producer us':>12} {'consumer us':>12} "
+          f"{'total us':>10} {'lost':>5}")
+    for r in results:
+        print(f"{r['transport']:>9} {r['resolution']:>11} {r['frames_per_sec']:>10.0f} "
+              f"{r['producer_us_per_frame']:>12.1f} {r['consumer_us_per_frame']:>12.1f} "
+              f"{r['total_us_per_frame']:>10.1f} {str(r['lost']):>5}")
+
+
+if __name__ == "__main__":
+    main()
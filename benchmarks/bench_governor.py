@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Load governor benchmark: quality-tier degradation under CPU pressure.
+
+Runs --sessions concurrent real-time sessions (as in bench_av_sync.py)
+through WebSocketTestReceiver, all asking for --quality, half of them with
+init priority 1 and half with 0. The video sink burns --sink-ns-per-byte of
+CPU per frame byte, a stand-in for encoding that costs more at higher
+resolutions. The receiver runs with the load governor off and then on.
+
+Reports the share of video frames the media clocks dropped for missing the
+lip-sync window, p99 A/V skew, event-loop lag, the governor's steps, and the
+share of session time spent at each tier by priority.
+
+Usage:
+    python benchmarks/bench_governor.py [--sessions 8] [--seconds 15] [--quality high] [--sink-ns-per-byte 4]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from bench_av_sync import RealtimeReplayWebSocket, build_messages  # noqa: E402
+from load_governor import TIERS  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+
+async def measure(governed, sessions, seconds, quality, sink_ns_per_byte, output_dir):
+    def video_sink(client_id, frame, timestamp_ns):
+        deadline = time.perf_counter() + len(frame) * sink_ns_per_byte / 1e9
+        while time.perf_counter() < deadline:
+            pass
+
+    receiver = WebSocketTestReceiver(output_wav_file=os.path.join(output_dir, "bench_governor.wav"),
+                                     video_frame_sink=video_sink, load_governor=governed)
+    receiver.save_audio = lambda *args, **kwargs: None
+
+    # Each session's tier changes as (time, tier), from the governor's add and apply
+    history = {}
+    if governed:
+        governor = receiver.governor
+        add, apply = governor.add, governor.apply
+
+        def record_add(session):
+            history[session] = [(time.monotonic(), session.quality)]
+            add(session)
+
+        def record_apply(session, quality):
+            if not apply(session, quality):
+                return False
+            history[session].append((time.monotonic(), quality))
+            return True
+        governor.add, governor.apply = record_add, record_apply
+
+    messages = build_messages(seconds, quality)
+    prioritised = [json.dumps(dict(json.loads(messages[0]), priority=1))] + messages[1:]
+    await asyncio.gather(*(receiver.handle_client(RealtimeReplayWebSocket(prioritised if index % 2 else messages))
+                           for index in range(sessions)))
+    end = time.monotonic()
+    receiver.loop_lag.stop()
+    if governed:
+        receiver.governor.stop()
+
+    tier_seconds = {priority: dict.fromkeys(TIERS, 0.0) for priority in (0, 1)}
+    for session, changes in history.items():
+        for (since, tier), (until, _) in zip(changes, changes[1:] + [(end, None)]):
+            tier_seconds[session.priority][tier] += until - since
+
+    clocks = list(receiver.av_sync_stats.values())
+    stamped = sum(s["video_frames_stamped"] for s in clocks)
+    dropped = sum(s["video_frames_dropped"] for s in clocks)
+    stats = receiver.stats()
+    return {
+        "governor": governed,
+        "sessions": sessions,
+        "video_frames": stamped,
+        "late_frames_pct": 100 * dropped / (stamped + dropped) if stamped + dropped else 0.0,
+        "av_skew_p99_abs_ms": max(s["av_skew_p99_abs_ms"] for s in clocks),
+        "loop_lag_ms_avg": stats["loop_lag_ms_avg"],
+        "loop_lag_ms_max": stats["loop_lag_ms_max"],
+        "steps_down": stats.get("governor_steps_down", 0),
+        "steps_up": stats.get("governor_steps_up", 0),
+        "tier_share_pct": {
+            priority: {tier: round(100 * value / sum(seconds.values()), 1) for tier, value in seconds.items()}
+            for priority, seconds in tier_seconds.items() if sum(seconds.values())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quality-tier degradation under CPU pressure")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--quality", default="high")
+    parser.add_argument("--sink-ns-per-byte", type=float, default=4.0, help="CPU burned per video frame byte")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for governed in (False, True):
+            results.append(asyncio.run(measure(governed, args.sessions, args.seconds, args.quality,
+                                               args.sink_ns_per_byte, output_dir)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'governor':>8} {'frames':>7} {'late %':>7} {'p99 |skew|':>11} {'lag avg':>8} {'lag max':>8} "
+          f"{'down':>5} {'up':>4}  time per tier, priority 0 | priority 1")
+    for r in results:
+        shares = " | ".join(" ".join(f"{tier} {share:.0f}%" for tier, share in tiers.items())
+                            for tiers in r["tier_share_pct"].values()) or "-"
+        print(f"{'on' if r['governor'] else 'off':>8} {r['video_frames']:>7} {r['late_frames_pct']:>7.1f} "
+              f"{r['av_skew_p99_abs_ms']:>11} {r['loop_lag_ms_avg']:>8.1f} {r['loop_lag_ms_max']:>8.1f} "
+              f"{r['steps_down']:>5} {r['steps_up']:>4}  {shares}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Heartbeat benchmark: releasing half-open connections, and round trips of live ones.
+
+Runs WebSocketTestReceiver on a local port with --live connections streaming
+20ms voice chunks in real time and --half-open connections that send init
+and --audio-seconds of audio, then go silent and stop reading their socket,
+as a peer that vanished without closing would. They answer no pings.
+
+The receiver runs with its heartbeat (--interval, --timeout) and with no
+heartbeat or keepalive at all. Reports the time from the half-open peers
+going silent until the receiver released their sessions, the bytes those
+sessions held, the live connections' ping round trips, and whether any live
+connection was reaped.
+
+Usage:
+    python benchmarks/bench_heartbeat.py [--live 8] [--half-open 4] [--interval 1] [--timeout 1]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from websocket_audio_sender import build_voice_message  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+CHUNK_MS = 20
+SAMPLE_RATE = 16000
+
+
+async def stream_live(uri, init, chunk, stop):
+    async with websockets.connect(uri, ping_interval=None) as websocket:
+        await websocket.send(init)
+        start = time.monotonic()
+        index = 0
+        while not stop.is_set():
+            await websocket.send(chunk)
+            index += 1
+            await asyncio.sleep(max(0.0, start + index * CHUNK_MS / 1000 - time.monotonic()))
+
+
+async def go_half_open(uri, init, chunk, audio_seconds):
+    """Send init and audio, then stop reading and sending; returns the connection to keep it open"""
+    websocket = await websockets.connect(uri, ping_interval=None)
+    await websocket.send(init)
+    for _ in range(int(audio_seconds * 1000 / CHUNK_MS)):
+        await websocket.send(chunk)
+    websocket.transport.pause_reading()
+    return websocket
+
+
+async def measure(heartbeat, live, half_open, audio_seconds, interval, timeout, window, output_dir):
+    receiver = WebSocketTestReceiver(output_wav_file=os.path.join(output_dir, "bench_heartbeat.wav"),
+                                     heartbeat_interval=interval if heartbeat else None,
+                                     heartbeat_timeout=timeout, idle_timeout=None)
+    receiver.save_audio = lambda *args, **kwargs: None
+    # With no heartbeat, switch off the library's keepalive pings too
+    server = await websockets.serve(receiver.handle_client, "127.0.0.1", 0,
+                                    **(receiver.serve_options() if heartbeat else {"ping_interval": None}))
+    uri = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    init = json.dumps({"command": "init", "avatar_id": "bench", "quality": "low", "version": "v1",
+                       "video_encoding": "H264"})
+    chunk = build_voice_message(bytes(SAMPLE_RATE * CHUNK_MS // 1000 * 2), SAMPLE_RATE)[1]
+    stop = asyncio.Event()
+    streams = [asyncio.create_task(stream_live(uri, init, chunk, stop)) for _ in range(live)]
+    silent = [await go_half_open(uri, init, chunk, audio_seconds) for _ in range(half_open)]
+    silent_at = time.monotonic()
+
+    # Time until the receiver holds only the live connections again
+    released_s = None
+    while time.monotonic() - silent_at < window:
+        receiver.memory_accountant.check()
+        if receiver.active_connections <= live:
+            released_s = time.monotonic() - silent_at
+            break
+        await asyncio.sleep(0.01)
+    held_bytes = receiver.memory_accountant.node_bytes
+    stats = receiver.stats()
+
+    stop.set()
+    # A live connection the receiver reaped ends with ConnectionClosed
+    outcomes = await asyncio.gather(*streams, return_exceptions=True)
+    for websocket in silent:
+        websocket.transport.abort()
+    server.close()
+    await server.wait_closed()
+    receiver.loop_lag.stop()
+    return {
+        "heartbeat": heartbeat,
+        "live": live,
+        "half_open": half_open,
+        "released_s": released_s,
+        "bytes_held_after": held_bytes,
+        "reaped_sessions": stats.get("reaped_sessions", 0),
+        "reclaimed_bytes": stats.get("reclaimed_bytes", 0),
+        "live_reaped": sum(isinstance(outcome, Exception) for outcome in outcomes),
+        "rtt_ms_avg": stats.get("heartbeat_rtt_ms_avg"),
+        "rtt_ms_max": stats.get("heartbeat_rtt_ms_max"),
+        "late_pongs": stats.get("heartbeat_late_pongs", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark heartbeat reaping of half-open connections")
+    parser.add_argument("--live", type=int, default=8, help="Connections streaming real-time audio")
+    parser.add_argument("--half-open", type=int, default=4, help="Connections that go silent and stop reading")
+    parser.add_argument("--audio-seconds", type=float, default=10.0, help="Audio each half-open peer sends first")
+    parser.add_argument("--interval", type=float, default=1.0, help="Heartbeat interval in seconds")
+    parser.add_argument("--timeout", type=float, default=1.0, help="Heartbeat timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    # Long enough for two heartbeats to fail
+    window = 2 * (args.interval + args.timeout) + 1
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for heartbeat in (False, True):
+            results.append(asyncio.run(measure(heartbeat, args.live, args.half_open, args.audio_seconds,
+                                               args.interval, args.timeout, window, output_dir)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'heartbeat':>9} {'released':>9} {'held after':>11} {'reaped':>7} {'reclaimed':>10} "
+          f"{'live reaped':>12} {'rtt avg ms':>11} {'rtt max ms':>11} {'late':>5}")
+    for r in results:
+        released = f"{r['released_s']:.2f}s" if r["released_s"] is not None else f">{window:.0f}s"
+        rtt_avg = f"{r['rtt_ms_avg']:.2f}" if r["rtt_ms_avg"] is not None else "-"
+        rtt_max = f"{r['rtt_ms_max']:.2f}" if r["rtt_ms_max"] is not None else "-"
+        print(f"{'on' if r['heartbeat'] else 'off':>9} {released:>9} {r['bytes_held_after']:>11} "
+              f"{r['reaped_sessions']:>7} {r['reclaimed_bytes']:>10} {r['live_reaped']:>12} {rtt_avg:>11} "
+              f"{rtt_max:>11} {r['late_pongs']:>5}")
+
+
+if __name__ == "__main__":
+    main()
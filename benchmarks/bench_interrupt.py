@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Interrupt latency benchmark: voice_interrupt behind a saturated audio backlog.
+
+Runs WebSocketTestReceiver on a local port with a chunk processor that costs
+--work-ms of CPU per chunk, so audio arrives faster than the receiver can
+process it. Each trial opens a connection, sends init, floods --backlog-ms of
+20ms voice chunks and then a voice_interrupt. It measures the time from
+sending the interrupt to the receiver's interrupt_sink call.
+
+The receiver runs twice per executor mode: with control messages on the
+priority lane (the default) and with them processed in turn behind the
+queued audio (priority_control=False). The report also gives the queued
+chunks each interrupt dropped without processing them.
+
+Usage:
+    python benchmarks/bench_interrupt.py [--backlog-ms 5000] [--work-ms 2] [--trials 10]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from websocket_audio_sender import build_voice_message  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver, create_executor  # noqa: E402
+
+CHUNK_MS = 20
+SAMPLE_RATE = 24000
+WORK_MS = 2.0
+EXECUTOR_MODES = ("inline", "thread")
+
+
+def heavy_processor(audio_base64):
+    """Decode, then burn roughly WORK_MS of CPU to stand in for resampling/rendering"""
+    audio = base64.b64decode(audio_base64)
+    deadline = time.perf_counter() + WORK_MS / 1000
+    while time.perf_counter() < deadline:
+        pass
+    return audio
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def wait_for(condition, timeout=120):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.005)
+
+
+async def measure(mode, priority, backlog_ms, trials, output_dir):
+    executor = create_executor(mode)
+    handled = {}
+
+    def interrupt_sink(client_id, event_id):
+        handled[event_id] = time.perf_counter()
+
+    receiver = WebSocketTestReceiver(output_wav_file=os.path.join(output_dir, "bench.wav"), executor=executor,
+                                     chunk_processor=heavy_processor, interrupt_sink=interrupt_sink,
+                                     priority_control=priority)
+    receiver.save_audio = lambda *args, **kwargs: None
+    server = await websockets.serve(receiver.handle_client, "127.0.0.1", 0)
+    uri = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    init = json.dumps({"command": "init", "avatar_id": "bench", "quality": "low", "version": "v1",
+                       "video_encoding": "H264"})
+    chunk = bytes(SAMPLE_RATE * CHUNK_MS // 1000 * 2)
+    voice = [build_voice_message(chunk, SAMPLE_RATE)[1] for _ in range(backlog_ms // CHUNK_MS)]
+
+    latencies = []
+    preempted_before = receiver.chunks_preempted
+    for trial in range(trials):
+        event_id = f"interrupt-{trial}"
+        async with websockets.connect(uri) as websocket:
+            await websocket.send(init)
+            for message in voice:
+                await websocket.send(message)
+            sent_at = time.perf_counter()
+            await websocket.send(json.dumps({"command": "voice_interrupt", "event_id": event_id}))
+            await wait_for(lambda: event_id in handled)
+        latencies.append((handled[event_id] - sent_at) * 1000)
+        await wait_for(lambda: receiver.active_connections == 0)
+
+    server.close()
+    await server.wait_closed()
+    receiver.loop_lag.stop()
+    if executor is not None:
+        executor.shutdown()
+    return {
+        "mode": mode,
+        "priority": priority,
+        "backlog_ms": backlog_ms,
+        "trials": trials,
+        "interrupt_ms_p50": percentile(latencies, 0.5),
+        "interrupt_ms_p99": percentile(latencies, 0.99),
+        "interrupt_ms_max": max(latencies),
+        "chunks_preempted_per_trial": (receiver.chunks_preempted - preempted_before) / trials,
+    }
+
+
+def main():
+    global WORK_MS
+    parser = argparse.ArgumentParser(description="Benchmark voice_interrupt latency behind queued audio")
+    parser.add_argument("--backlog-ms", type=int, default=5000, help="Audio sent ahead of each interrupt")
+    parser.add_argument("--work-ms", type=float, default=WORK_MS, help="CPU cost of processing one chunk")
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    WORK_MS = args.work_ms
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for mode in EXECUTOR_MODES:
+            for priority in (False, True):
+                results.append(asyncio.run(measure(mode, priority, args.backlog_ms, args.trials, output_dir)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'executor':>8} {'control':>9} {'backlog ms':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'preempted':>10}")
+    for r in results:
+        control = "priority" if r["priority"] else "in order"
+        print(f"{r['mode']:>8} {control:>9} {r['backlog_ms']:>10} {r['interrupt_ms_p50']:>8.1f} "
+              f"{r['interrupt_ms_p99']:>8.1f} {r['interrupt_ms_max']:>8.1f} {r['chunks_preempted_per_trial']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
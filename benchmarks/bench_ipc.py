@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Sustained throughput benchmark for the publisher IPC pipe.
+
+Starts benchmarks/fake_child.py through PublisherIPC and pushes I420 video
+frames plus matching 10ms PCM16 audio frames as fast as the pipe accepts
+them, then reports frames/s, MB/s and samples per writev call. The child's
+counts are checked against what was sent.
+
+Usage:
+    python benchmarks/bench_ipc.py [--seconds 5] [--quality medium]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from avatar_renderer import QUALITY_PRESETS, i420_size  # noqa: E402
+from publisher_ipc import PublisherIPC, child_args  # noqa: E402
+
+FAKE_CHILD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_child.py")
+SAMPLE_RATE = 16000
+
+
+async def measure(quality, seconds):
+    """Return pipe throughput for one quality preset"""
+    width, height, fps = QUALITY_PRESETS[quality]
+    video = bytes(i420_size(width, height))
+    audio = bytes(SAMPLE_RATE // 100 * 2)
+    # Audio frames per video frame, so the mix matches a live session
+    audio_per_video = max(1, 100 // fps)
+
+    final = {}
+
+    def on_status(name, message, info):
+        if name == "DISCONNECTED" and info:
+            final.update(json.loads(info))
+
+    args = child_args("bench", "bench", "1", width=width, height=height, frame_rate=fps, sample_rate=SAMPLE_RATE)
+    ipc = PublisherIPC([sys.executable, FAKE_CHILD] + args, on_status=on_status)
+    await ipc.start()
+
+    frames = 0
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        timestamp_ns = frames * 1_000_000_000 // fps
+        for _ in range(audio_per_video):
+            ipc.send_audio(audio, timestamp_ns)
+        ipc.send_video(video, timestamp_ns)
+        frames += 1
+        await ipc.drain()
+        if frames % 8 == 0:
+            # Let the loop run the scheduled flush
+            await asyncio.sleep(0)
+    await ipc.close()
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    stats = ipc.stats()
+    samples = stats["publisher_audio_frames"] + stats["publisher_video_frames"]
+    return {
+        "quality": quality,
+        "resolution": f"{width}x{height}",
+        "video_frames_per_sec": frames / wall,
+        "realtime_sessions": frames / wall / fps,
+        "mb_per_sec": stats["publisher_bytes_written"] / wall / 1e6,
+        "parent_cpu_percent": 100 * cpu / wall,
+        "samples_per_writev": samples / max(stats["publisher_writev_calls"], 1),
+        "blocked_writes": stats["publisher_blocked_writes"],
+        "child_video_frames": final.get("video_frames"),
+        "child_audio_frames": final.get("audio_frames"),
+        "lost": (final.get("video_frames") != frames
+                 or final.get("audio_frames") != stats["publisher_audio_frames"]
+                 or final.get("bad_video_frames", 0) != 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the publisher IPC pipe against a stand-in child")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--quality", choices=list(QUALITY_PRESETS), action="append")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = [asyncio.run(measure(quality, args.seconds)) for quality in args.quality or list(QUALITY_PRESETS)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'quality':>8} {'resolution':>11} {'frames/s':>10} {'sessions':>9} {'MB/s':>8} "
+          f"{'cpu %':>7} {'samples/writev':>15} {'lost':>5}")
+    for r in results:
+        print(f"{r['quality']:>8} {r['resolution']:>11} {r['video_frames_per_sec']:>10.0f} "
+              f"{r['realtime_sessions']:>9.1f} {r['mb_per_sec']:>8.0f} {r['parent_cpu_percent']:>7.0f} "
+              f"{r['samples_per_writev']:>15.1f} {str(r['lost']):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Connection cost benchmark: one WebSocket per session versus multiplexed streams.
+
+Runs WebSocketTestReceiver on a local port and drives --sessions avatar
+sessions at it in two ways:
+
+  per-session   one connection per session, each sending its own init
+  multiplexed   one connection whose init declares every session as a
+                stream; voice messages carry stream_id (see stream_mux.py)
+
+For each it reports the sockets the receiver holds, the CPU time and wall
+time to connect and initialise every session (the WebSocket handshakes, plus
+TLS with --tls), the RSS growth per session once all are connected, and the
+CPU per voice message while each session streams --chunks chunks. Each mode
+runs in a fresh process, and client and receiver share it, so CPU and memory
+cover both ends.
+
+Usage:
+    python benchmarks/bench_multiplex.py [--sessions 500] [--chunks 5] [--tls]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from load_harness import rss_bytes  # noqa: E402
+from websocket_audio_sender import build_voice_message  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+CHUNK_MS = 100
+SAMPLE_RATE = 16000
+CONNECT_CONCURRENCY = 50
+MODES = ("per-session", "multiplexed")
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def make_tls_contexts(directory):
+    """Server and client SSL contexts for a throwaway self-signed localhost certificate"""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                   check=True, capture_output=True)
+    server = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server.load_cert_chain(cert, key)
+    client = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    client.load_verify_locations(cert)
+    return server, client
+
+
+def init_message(**fields):
+    return json.dumps(dict({"command": "init", "avatar_id": "bench", "quality": "low", "version": "v1",
+                            "video_encoding": "H264"}, **fields))
+
+
+async def connect_per_session(uri, sessions, client_ssl):
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def open_one(index):
+        async with semaphore:
+            websocket = await websockets.connect(uri, ssl=client_ssl)
+            await websocket.send(init_message())
+            return websocket
+
+    connections = await asyncio.gather(*(open_one(index) for index in range(sessions)))
+    # (connection, stream_id) per session
+    return connections, [(websocket, None) for websocket in connections]
+
+
+async def connect_multiplexed(uri, sessions, client_ssl):
+    websocket = await websockets.connect(uri, ssl=client_ssl)
+    await websocket.send(init_message(streams=[{"stream_id": f"s{index}"} for index in range(sessions)]))
+    return [websocket], [(websocket, f"s{index}") for index in range(sessions)]
+
+
+async def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def measure(mode, sessions, chunks, tls_dir):
+    server_ssl = client_ssl = None
+    if tls_dir is not None:
+        server_ssl, client_ssl = make_tls_contexts(tls_dir)
+    with tempfile.TemporaryDirectory() as directory:
+        receiver = WebSocketTestReceiver(output_wav_file=os.path.join(directory, "bench.wav"))
+        receiver.save_audio = lambda *args, **kwargs: None
+        server = await websockets.serve(receiver.handle_client, "127.0.0.1", 0, ssl=server_ssl, max_queue=None)
+        port = server.sockets[0].getsockname()[1]
+        uri = f"{'wss' if tls_dir else 'ws'}://localhost:{port}"
+
+        gc.collect()
+        fds_before, rss_before = open_fds(), rss_bytes()
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        connect = connect_multiplexed if mode == "multiplexed" else connect_per_session
+        connections, targets = await connect(uri, sessions, client_ssl)
+
+        def initialised():
+            return receiver.connection_count == len(connections) and (
+                mode != "multiplexed" or receiver.streams_opened == sessions)
+
+        await wait_for(initialised)
+        setup_cpu = time.process_time() - cpu_start
+        setup_wall = time.perf_counter() - wall_start
+        gc.collect()
+        fds, rss_connected = open_fds(), rss_bytes()
+
+        chunk = bytes(SAMPLE_RATE * CHUNK_MS // 1000 * 2)
+        messages = [(websocket, build_voice_message(chunk, SAMPLE_RATE, stream_id)[1])
+                    for _ in range(chunks) for websocket, stream_id in targets]
+        received_before = receiver.messages_received
+        cpu_start = time.process_time()
+        for websocket, message in messages:
+            await websocket.send(message)
+        await wait_for(lambda: receiver.messages_received - received_before >= len(messages))
+        stream_cpu = time.process_time() - cpu_start
+
+        for websocket in connections:
+            await websocket.close()
+        await wait_for(lambda: receiver.active_connections == 0)
+        server.close()
+        await server.wait_closed()
+        receiver.loop_lag.stop()
+
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "tls": tls_dir is not None,
+        "receiver_sockets": len(connections),
+        "fds_opened": fds - fds_before if fds is not None else None,
+        "setup_cpu_ms": setup_cpu * 1000,
+        "setup_wall_ms": setup_wall * 1000,
+        "rss_per_session_kb": (rss_connected - rss_before) / sessions / 1024,
+        "cpu_us_per_message": stream_cpu / len(messages) * 1e6 if messages else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare one WebSocket per session with multiplexed streams")
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--chunks", type=int, default=5, help="Voice chunks each session streams after init")
+    parser.add_argument("--tls", action="store_true", help="Connect over TLS with a self-signed certificate")
+    parser.add_argument("--mode", choices=MODES, help="Run one mode in this process (used internally)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    if args.mode:
+        with tempfile.TemporaryDirectory() as tls_dir:
+            print(json.dumps(asyncio.run(measure(args.mode, args.sessions, args.chunks,
+                                                 tls_dir if args.tls else None))))
+        return
+
+    results = []
+    for mode in MODES:
+        command = [sys.executable, os.path.abspath(__file__), "--mode", mode,
+                   "--sessions", str(args.sessions), "--chunks", str(args.chunks)]
+        if args.tls:
+            command.append("--tls")
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':>12} {'sessions':>8} {'sockets':>8} {'fds':>6} {'setup cpu ms':>13} {'setup wall ms':>14} "
+          f"{'KB/session':>11} {'us/msg':>8}")
+    for r in results:
+        fds = r["fds_opened"] if r["fds_opened"] is not None else "-"
+        print(f"{r['mode']:>12} {r['sessions']:>8} {r['receiver_sockets']:>8} {fds:>6} {r['setup_cpu_ms']:>13.1f} "
+              f"{r['setup_wall_ms']:>14.1f} {r['rss_per_session_kb']:>11.1f} {r['cpu_us_per_message']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
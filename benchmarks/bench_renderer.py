@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Frame-rate benchmark for the CPU reference avatar renderer.
+
+Feeds 10ms PCM16 frames (as the receiver's playout does) into AvatarRenderer
+for each quality preset and reports rendered frames per CPU second and how
+many sessions one core could keep at the preset's frame rate.
+
+Usage:
+    python benchmarks/bench_renderer.py [--seconds 20] [--sample-rate 16000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from avatar_renderer import AvatarRenderer, QUALITY_PRESETS  # noqa: E402
+
+FRAME_MS = 10
+
+
+def build_audio_frames(sample_rate, seconds):
+    """Speech-like test audio: a tone with a syllable-rate envelope, split into 10ms frames"""
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    envelope = np.abs(np.sin(2 * np.pi * 3 * t)) * 16000
+    pcm = (envelope * np.sin(2 * np.pi * 180 * t)).astype("<i2").tobytes()
+    frame_bytes = sample_rate * FRAME_MS // 1000 * 2
+    return [pcm[i:i + frame_bytes] for i in range(0, len(pcm), frame_bytes)]
+
+
+def measure(quality, audio_frames, sample_rate):
+    """Return frame throughput for one quality preset"""
+    width, height, fps = QUALITY_PRESETS[quality]
+    renderer = AvatarRenderer(width, height, fps, sample_rate)
+    # Build the sprites outside the measurement
+    renderer.render(0)
+
+    rendered = 0
+    start = time.process_time()
+    for frame in audio_frames:
+        renderer.feed(frame)
+        while renderer.render_next() is not None:
+            rendered += 1
+    cpu = time.process_time() - start
+    frames_per_cpu_sec = rendered / cpu if cpu else float("inf")
+    return {
+        "quality": quality,
+        "resolution": f"{width}x{height}",
+        "fps": fps,
+        "frames": rendered,
+        "frames_per_cpu_sec": frames_per_cpu_sec,
+        "sessions_per_core": frames_per_cpu_sec / fps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the avatar renderer")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    audio_frames = build_audio_frames(args.sample_rate, args.seconds)
+    results = [measure(quality, audio_frames, args.sample_rate) for quality in QUALITY_PRESETS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'quality':>8} {'resolution':>11} {'fps':>5} {'frames':>8} {'frames/cpu-s':>13} {'sessions/core':>14}")
+    for r in results:
+        print(f"{r['quality']:>8} {r['resolution']:>11} {r['fps']:>5} {r['frames']:>8} "
+              f"{r['frames_per_cpu_sec']:>13.0f} {r['sessions_per_core']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
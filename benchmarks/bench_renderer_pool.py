@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Renderer worker pool benchmark: time to first frame and load under real-time sessions.
+
+Time to first frame opens --opens sessions one after another and times each
+from open to its first rendered frame:
+
+  process  a new process per session (spawn start method), which imports
+           the renderer, builds its sprites and renders
+  pool     a session on a RendererPool that was forked and warmed up before
+           the first open (its one-off warm-up time is reported separately)
+
+The load run plays --sessions concurrent real-time sessions (as in
+bench_av_sync.py) through WebSocketTestReceiver, rendering inline on the
+event loop and then on the pool. It reports the A/V skew the media clock
+measured, event-loop lag, and each pool worker's utilisation and sessions.
+
+Usage:
+    python benchmarks/bench_renderer_pool.py [--workers 2] [--opens 5] [--sessions 8] [--seconds 5]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from bench_av_sync import RealtimeReplayWebSocket, build_messages  # noqa: E402
+from renderer_pool import RendererPool  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def render_first_frame(quality, connection):
+    from avatar_renderer import AvatarRenderer
+
+    renderer = AvatarRenderer.for_quality(quality, SAMPLE_RATE)
+    renderer.feed(bytes(SAMPLE_RATE * 2 // renderer.fps))
+    renderer.render_next()
+    connection.send(True)
+
+
+def process_first_frame_ms(quality):
+    """Start a process for one session and time it to its first frame"""
+    context = multiprocessing.get_context("spawn")
+    parent, child = context.Pipe()
+    start = time.perf_counter()
+    process = context.Process(target=render_first_frame, args=(quality, child))
+    process.start()
+    parent.recv()
+    elapsed = (time.perf_counter() - start) * 1000
+    process.join()
+    return elapsed
+
+
+async def pool_first_frame_ms(pool, quality, avatar_id):
+    """Open one session on the pool and time it to its first frame"""
+    first = asyncio.get_running_loop().create_future()
+    start = time.perf_counter()
+    session = pool.open(quality, SAMPLE_RATE, avatar_id)
+    session.on_frame = lambda frame, pts_ns: first.done() or first.set_result(time.perf_counter())
+    session.feed(bytes(SAMPLE_RATE * 2 // session.fps))
+    elapsed = (await first - start) * 1000
+    session.close()
+    return elapsed
+
+
+async def measure_first_frames(pool, quality, opens):
+    return [await pool_first_frame_ms(pool, quality, f"avatar-{index % 2}") for index in range(opens)]
+
+
+async def measure_load(pool, sessions, seconds, quality, output_dir):
+    receiver = WebSocketTestReceiver(output_wav_file=os.path.join(output_dir, "bench_renderer_pool.wav"),
+                                     video_frame_sink=lambda client_id, frame, timestamp_ns: None,
+                                     renderer_pool=pool)
+    receiver.save_audio = lambda *args, **kwargs: None
+    messages = build_messages(seconds, quality)
+    workers = None
+    if pool is not None:
+        async def sample_workers():
+            # Utilisation while the sessions are live, just before they finish
+            await asyncio.sleep(seconds - pool.rebalance_interval / 2)
+            return pool.worker_stats()
+        workers = asyncio.create_task(sample_workers())
+    await asyncio.gather(*(receiver.handle_client(RealtimeReplayWebSocket(messages)) for _ in range(sessions)))
+    receiver.loop_lag.stop()
+
+    clocks = list(receiver.av_sync_stats.values())
+    return {
+        "renderer": "pool" if pool is not None else "inline",
+        "sessions": sessions,
+        "video_frames": sum(s["video_frames_stamped"] for s in clocks),
+        "video_frames_dropped": sum(s["video_frames_dropped"] for s in clocks),
+        "av_offset_ms_avg": sum(s["av_offset_ms"] for s in clocks) / len(clocks),
+        "av_skew_p99_abs_ms": max(s["av_skew_p99_abs_ms"] for s in clocks),
+        "loop_lag_ms_avg": receiver.loop_lag.stats()["loop_lag_ms_avg"],
+        "loop_lag_ms_max": receiver.loop_lag.stats()["loop_lag_ms_max"],
+        "workers": await workers if workers is not None else None,
+    }
+
+
+def summarise(label, times):
+    times = sorted(times)
+    return {"renderer": label, "opens": len(times), "first_frame_ms_p50": times[len(times) // 2],
+            "first_frame_ms_max": times[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pre-forked renderer worker pool")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--opens", type=int, default=5, help="Sessions opened one at a time for time to first frame")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent real-time sessions for the load run")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--quality", default="medium")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    first_frames = [summarise("process", [process_first_frame_ms(args.quality) for _ in range(args.opens)])]
+    start = time.perf_counter()
+    pool = RendererPool(workers=args.workers)
+    pool.wait_ready()
+    warm_ms = (time.perf_counter() - start) * 1000
+    first_frames.append(summarise("pool", asyncio.run(measure_first_frames(pool, args.quality, args.opens))))
+
+    load = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        load.append(asyncio.run(measure_load(None, args.sessions, args.seconds, args.quality, output_dir)))
+        load.append(asyncio.run(measure_load(pool, args.sessions, args.seconds, args.quality, output_dir)))
+    pool_stats = pool.stats()
+    pool.close()
+
+    if args.json:
+        print(json.dumps({"pool_warm_ms": warm_ms, "first_frame": first_frames, "load": load,
+                          "pool": pool_stats}, indent=2))
+        return
+
+    print(f"Pool of {args.workers} workers forked and warmed in {warm_ms:.0f}ms")
+    print(f"{'renderer':>8} {'opens':>6} {'first frame p50 ms':>19} {'max ms':>8}")
+    for r in first_frames:
+        print(f"{r['renderer']:>8} {r['opens']:>6} {r['first_frame_ms_p50']:>19.1f} {r['first_frame_ms_max']:>8.1f}")
+    print()
+    print(f"{'renderer':>8} {'sessions':>8} {'frames':>7} {'dropped':>8} {'offset ms':>10} {'p99 |skew|':>11} "
+          f"{'loop lag avg':>13} {'loop lag max':>13}")
+    for r in load:
+        print(f"{r['renderer']:>8} {r['sessions']:>8} {r['video_frames']:>7} {r['video_frames_dropped']:>8} "
+              f"{r['av_offset_ms_avg']:>10.1f} {r['av_skew_p99_abs_ms']:>11} {r['loop_lag_ms_avg']:>13.1f} "
+              f"{r['loop_lag_ms_max']:>13.1f}")
+    print()
+    print(f"{'worker':>6} {'pid':>7} {'warm ms':>8} {'utilisation':>12} {'sessions':>9} {'frames':>7}")
+    for w in load[-1]["workers"]:
+        print(f"{w['worker']:>6} {w['pid']:>7} {w['warm_ms']:>8.0f} {w['utilisation']:>12.2f} {w['sessions']:>9} "
+              f"{w['frames']:>7}")
+    print(f"Affinity hits {pool_stats['renderer_pool_affinity_hits']} of "
+          f"{pool_stats['renderer_pool_sessions_opened']} opens, {pool_stats['renderer_pool_migrations']} migrations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the receiver's streaming resampler.
+
+Pushes 20ms PCM16 chunks through AudioFormatTracker.convert (decode, resample,
+encode) for the common sender rates and reports how many realtime streams one
+core could sustain.
+
+Usage:
+    python benchmarks/bench_resampler.py [--seconds 30] [--chunk-ms 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from resampler import AudioFormatTracker  # noqa: E402
+
+RATE_PAIRS = [(24000, 16000), (48000, 16000), (44100, 16000), (16000, 48000)]
+
+
+def build_chunks(sample_rate, seconds, chunk_ms):
+    """Split a tone-plus-noise signal into PCM16 chunks"""
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    signal = 8000 * np.sin(2 * np.pi * 440 * t) + np.random.default_rng(0).normal(0, 500, len(t))
+    pcm = np.clip(signal, -32768, 32767).astype("<i2").tobytes()
+    chunk_bytes = sample_rate * chunk_ms // 1000 * 2
+    return [pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)]
+
+
+def measure(input_rate, output_rate, seconds, chunk_ms):
+    """Return realtime factor and per-chunk cost for one rate pair"""
+    tracker = AudioFormatTracker(target_rate=output_rate)
+    tracker.update(input_rate, "PCM16", 1)
+    chunks = build_chunks(input_rate, seconds, chunk_ms)
+
+    start = time.process_time()
+    output_bytes = sum(len(tracker.convert(chunk)) for chunk in chunks)
+    cpu = time.process_time() - start
+    return {
+        "input_rate": input_rate,
+        "output_rate": output_rate,
+        "chunks": len(chunks),
+        "output_seconds": output_bytes / 2 / output_rate,
+        "us_per_chunk": cpu / len(chunks) * 1e6,
+        "streams_per_core": seconds / cpu if cpu else float("inf"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming resampler")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--chunk-ms", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = [measure(i, o, args.seconds, args.chunk_ms) for i, o in RATE_PAIRS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'conversion':>16} {'chunks':>8} {'us/chunk':>10} {'streams/core':>14}")
+    for r in results:
+        print(f"{r['input_rate']:>6} -> {r['output_rate']:<6} {r['chunks']:>8} "
+              f"{r['us_per_chunk']:>10.1f} {r['streams_per_core']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
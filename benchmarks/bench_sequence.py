@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Voice sequencing benchmark: duplicated and reordered chunks.
+
+Replays --messages 20ms voice chunks through WebSocketTestReceiver (no
+network), each chunk's samples holding its index. A share of them
+(--duplicate-rate) is sent a second time a few messages later, as a sender
+retry of a send that actually got through would be. Another share
+(--reorder-rate) swaps places with the next chunk. The same stream runs
+without seq numbers and with them.
+
+Reports the audio the receiver kept compared with what was sent, chunks
+kept twice or out of order, the receiver's duplicate, gap, reorder and late
+counters, dispatch CPU per message, and the bytes of duplicate-tracking
+state: the sequence window's bitset and held chunks, against a set of every
+event_id seen.
+
+Usage:
+    python benchmarks/bench_sequence.py [--messages 20000] [--duplicate-rate 0.02] [--reorder-rate 0.01]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from bench_dispatch import ReplayWebSocket  # noqa: E402
+from websocket_audio_sender import build_voice_message  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+CHUNK_MS = 20
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = SAMPLE_RATE * CHUNK_MS // 1000
+# Distinct sample values available to tag chunks with their index
+INDEX_RANGE = 32768
+
+
+def build_stream(count, duplicate_rate, reorder_rate, sequenced, seed):
+    """Init and voice chunks tagged with their index, with duplicates and swaps injected"""
+    init = json.dumps({"command": "init", "avatar_id": "bench", "quality": "low", "version": "v1",
+                       "video_encoding": "H264"})
+    voice = []
+    for index in range(count):
+        chunk = np.full(CHUNK_SAMPLES, index % INDEX_RANGE, dtype="<i2").tobytes()
+        voice.append(build_voice_message(chunk, SAMPLE_RATE, seq=index if sequenced else None))
+
+    rng = random.Random(seed)
+    for position in range(count - 1):
+        if rng.random() < reorder_rate:
+            voice[position], voice[position + 1] = voice[position + 1], voice[position]
+    messages = []
+    retries = {}
+    for position, message in enumerate(voice):
+        messages.append(message[1])
+        if rng.random() < duplicate_rate:
+            retries.setdefault(position + rng.randint(1, 3), []).append(message[1])
+        messages.extend(retries.pop(position, []))
+    for pending in retries.values():
+        messages.extend(pending)
+    event_ids = {event_id for event_id, _ in voice}
+    return [init] + messages + [json.dumps({"command": "voice_end"})], event_ids
+
+
+def kept_order(audio):
+    """Chunk indices in the order the receiver kept them"""
+    samples = np.frombuffer(audio, dtype="<i2")
+    return samples[::CHUNK_SAMPLES].tolist()
+
+
+async def measure(sequenced, count, duplicate_rate, reorder_rate, output_dir):
+    messages, event_ids = build_stream(count, duplicate_rate, reorder_rate, sequenced, seed=1)
+    receiver = WebSocketTestReceiver(output_wav_file=os.path.join(output_dir, "bench_sequence.wav"),
+                                     target_sample_rate=None)
+    kept = []
+    receiver.save_audio = lambda audio_chunks, sample_rate=None: kept.append(b"".join(audio_chunks))
+    # Capture the window as the session finishes
+    windows = []
+    finish = receiver._finish_session
+
+    async def record_window(session):
+        windows.append(session.sequence)
+        await finish(session)
+    receiver._finish_session = record_window
+
+    cpu_start = time.process_time()
+    await receiver.handle_client(ReplayWebSocket(messages))
+    cpu = time.process_time() - cpu_start
+    receiver.loop_lag.stop()
+
+    order = kept_order(kept[0]) if kept else []
+    expected = [index % INDEX_RANGE for index in range(count)]
+    stats = receiver.stats()
+    window = windows[0]
+    if window is not None:
+        state_bytes = sys.getsizeof(window._bits) + sys.getsizeof(window.held)
+    else:
+        state_bytes = 0
+    return {
+        "sequenced": sequenced,
+        "messages": len(messages) - 2,
+        "chunks_sent": count,
+        "chunks_kept": len(order),
+        "chunks_kept_twice": len(order) - len(set(order)),
+        "chunks_out_of_order": sum(a > b for a, b in zip(order, order[1:])),
+        "audio_matches": order == expected,
+        "voice_duplicates": stats["voice_duplicates"],
+        "voice_gaps": stats["voice_gaps"],
+        "voice_reordered": stats["voice_reordered"],
+        "voice_late": stats["voice_late"],
+        "cpu_us_per_message": cpu / (len(messages) - 2) * 1e6,
+        "window_state_bytes": state_bytes,
+        "event_id_set_bytes": sys.getsizeof(event_ids) + sum(sys.getsizeof(event_id) for event_id in event_ids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark duplicate and reorder handling of voice chunks")
+    parser.add_argument("--messages", type=int, default=20000, help="Voice chunks in the stream")
+    parser.add_argument("--duplicate-rate", type=float, default=0.02, help="Share of chunks sent twice")
+    parser.add_argument("--reorder-rate", type=float, default=0.01, help="Share of chunks swapped with the next")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for sequenced in (False, True):
+            results.append(asyncio.run(measure(sequenced, args.messages, args.duplicate_rate, args.reorder_rate,
+                                               output_dir)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'seq':>4} {'sent':>6} {'kept':>6} {'twice':>6} {'out of order':>13} {'dups':>6} {'gaps':>5} "
+          f"{'reordered':>10} {'late':>5} {'us/msg':>7} {'state bytes':>12} {'event_id set':>13}")
+    for r in results:
+        state = r["window_state_bytes"] if r["sequenced"] else "-"
+        print(f"{'on' if r['sequenced'] else 'off':>4} {r['chunks_sent']:>6} {r['chunks_kept']:>6} "
+              f"{r['chunks_kept_twice']:>6} {r['chunks_out_of_order']:>13} {r['voice_duplicates']:>6} "
+              f"{r['voice_gaps']:>5} {r['voice_reordered']:>10} {r['voice_late']:>5} "
+              f"{r['cpu_us_per_message']:>7.1f} {state:>12} {r['event_id_set_bytes']:>13}")
+
+
+if __name__ == "__main__":
+    main()
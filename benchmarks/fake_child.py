@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Stand-in for go-publish-video's child process, with no Agora SDK.
+
+Speaks the same stdin/stdout protocol as child.go: accepts the same flags,
+reports INITIALIZED_SUCCESS and CONNECTED, consumes WRITE_AUDIO_SAMPLE /
+WRITE_VIDEO_SAMPLE commands and answers CLOSE_COMMAND with a log line and a
+DISCONNECTED status. Instead of publishing, it counts samples and checks
+their sizes; the counts are returned as JSON in the DISCONNECTED status's
+additional_info so a benchmark can confirm nothing was lost.
+
+Usage:
+    python benchmarks/fake_child.py -appID test -width 640 -height 360
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from publisher_ipc import (  # noqa: E402
+    CLOSE_COMMAND, CONNECTION_STATUSES, LOG_LEVELS, LOG_RESPONSE, PAYLOAD_LOG, PAYLOAD_STATUS, STATUS_RESPONSE,
+    WRITE_AUDIO_SAMPLE_COMMAND, WRITE_VIDEO_SAMPLE_COMMAND, decode_media_sample, decode_message,
+    encode_log_payload, encode_message, encode_status_payload,
+)
+
+READ_SIZE = 1024 * 1024
+LOG_INTERVAL = 5.0
+
+
+def send(message):
+    os.write(sys.stdout.fileno(), message)
+
+
+def send_status(status, message="", info=""):
+    send(encode_message(STATUS_RESPONSE, PAYLOAD_STATUS,
+                        encode_status_payload(CONNECTION_STATUSES.index(status), message, info)))
+
+
+def send_log(level, message):
+    send(encode_message(LOG_RESPONSE, PAYLOAD_LOG, encode_log_payload(LOG_LEVELS.index(level), message)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Protocol stand-in for the Go publisher child")
+    parser.add_argument("-appID", default="")
+    parser.add_argument("-channelName", default="")
+    parser.add_argument("-userID", default="")
+    parser.add_argument("-token", default="")
+    parser.add_argument("-width", type=int, default=352)
+    parser.add_argument("-height", type=int, default=288)
+    parser.add_argument("-frameRate", type=int, default=15)
+    parser.add_argument("-videoCodec", default="H264")
+    parser.add_argument("-sampleRate", type=int, default=16000)
+    parser.add_argument("-audioChannels", type=int, default=1)
+    parser.add_argument("-bitrate", type=int, default=1000)
+    parser.add_argument("-minBitrate", type=int, default=100)
+    parser.add_argument("-enableStringUID", default="false")
+    return parser.parse_args()
+
+
+def handle_messages(buffer, offset, counts, video_frame_size):
+    """Handle every complete message in buffer from offset; returns the new offset, or None on close"""
+    view = memoryview(buffer)
+    while len(buffer) - offset >= 4:
+        length = struct.unpack_from(">I", buffer, offset)[0]
+        if len(buffer) - offset - 4 < length:
+            break
+        message = view[offset + 4:offset + 4 + length]
+        offset += 4 + length
+        if length == 0:
+            continue
+
+        message_type, _, payload = decode_message(message)
+        if message_type in (WRITE_AUDIO_SAMPLE_COMMAND, WRITE_VIDEO_SAMPLE_COMMAND):
+            data, timestamp_ns = decode_media_sample(payload)
+            counts["last_timestamp_ns"] = timestamp_ns
+            if message_type == WRITE_AUDIO_SAMPLE_COMMAND:
+                counts["audio_frames"] += 1
+                counts["audio_bytes"] += len(data)
+            else:
+                counts["video_frames"] += 1
+                counts["video_bytes"] += len(data)
+                if len(data) != video_frame_size:
+                    counts["bad_video_frames"] += 1
+        elif message_type == CLOSE_COMMAND:
+            return None
+        else:
+            send_status("FAILED", f"Unknown command type received: {message_type}")
+    return offset
+
+
+def main():
+    args = parse_args()
+    video_frame_size = args.width * args.height * 3 // 2
+    counts = {"audio_frames": 0, "audio_bytes": 0, "video_frames": 0, "video_bytes": 0,
+              "bad_video_frames": 0, "last_timestamp_ns": 0}
+
+    print(f"[fake_child] started: {args.width}x{args.height}@{args.frameRate}, "
+          f"audio {args.sampleRate}Hz/{args.audioChannels}ch", file=sys.stderr)
+    send_status("INITIALIZED_SUCCESS", "Connect call issued, awaiting callback.")
+    send_status("CONNECTED", "Successfully connected and media infrastructure prepared.")
+
+    stdin = sys.stdin.fileno()
+    buffer = bytearray()
+    offset = 0
+    last_log = time.monotonic()
+    while True:
+        chunk = os.read(stdin, READ_SIZE)
+        if not chunk:
+            print("[fake_child] stdin closed, exiting", file=sys.stderr)
+            return
+        # Views into the buffer only live inside handle_messages, so it can be resized here
+        del buffer[:offset]
+        buffer += chunk
+
+        offset = handle_messages(buffer, 0, counts, video_frame_size)
+        if offset is None:
+            send_log("INFO", "Child process shutting down.")
+            send_status("DISCONNECTED", "", json.dumps(counts))
+            return
+
+        if time.monotonic() - last_log >= LOG_INTERVAL:
+            last_log = time.monotonic()
+            send_log("INFO", f"Received {counts['audio_frames']} audio and {counts['video_frames']} video samples")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+End-to-end load harness with latency SLO assertions.
+
+Runs the whole stack in one process on ephemeral local ports, with no
+network or Agora SDK:
+
+  session_test_receiver.SessionHandler   /session/start and /session/stop
+  WebSocketTestReceiver                  the WebSocket receiver
+  WebSocketAudioSender                   one sender per session
+
+Each simulated session starts a session over HTTP, connects with the token
+it gets back, streams a synthetic WAV and stops the session. The scenario
+sets the number of sessions, how quickly they ramp up, the chunk size, the
+pacing (realtime, or as fast as the receiver takes them) and the chance of a
+voice_interrupt after each chunk. It comes from the flags below or from a
+JSON file of the same keys (--scenario).
+
+Measured, then checked against the SLOs:
+
+  start_p99_ms            POST /session/start round trip, seen by the client
+  ingest_lag_p99_ms       voice.send in the sender to voice.recv in the
+                          receiver, per chunk (from the trace, see tracing.py)
+  memory_per_session_mb   peak RSS growth over the idle stack, divided by the
+                          number of sessions (includes the sender's share)
+
+A failed session always fails the run. The exit status is 1 when any SLO is
+missed, so the harness can gate CI.
+
+Usage:
+    python benchmarks/load_harness.py [--sessions 20] [--chunk-ms 20] [--pacing fast] \\
+        [--interrupt-rate 0.05] [--slo-start-p99-ms 250] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import wave
+from http.server import HTTPServer
+
+import numpy as np
+import websockets
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "websocket-receive-audio"))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "connection-setup"))
+
+import session_test_receiver  # noqa: E402
+import tracing  # noqa: E402
+from trace_summary import load_events, percentiles  # noqa: E402
+from websocket_audio_sender import WebSocketAudioSender  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+SCENARIO_DEFAULTS = {
+    "sessions": 10,
+    "ramp_seconds": 1.0,
+    "chunk_ms": 100,
+    "pacing": "realtime",
+    "interrupt_rate": 0.0,
+    "audio_seconds": 3.0,
+    "pause_ratio": 0.0,
+    "vad_dbfs": None,
+    "adaptive_chunks": False,
+    "sample_rate": 24000,
+    "video": False,
+    "quality": "low",
+}
+SLO_DEFAULTS = {
+    "start_p99_ms": 250.0,
+    "ingest_lag_p99_ms": 50.0,
+    "memory_per_session_mb": 8.0,
+}
+RSS_SAMPLE_SECONDS = 0.05
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No procfs: fall back to the peak, which is still right for growth over an idle start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def write_wav(path, seconds, sample_rate, pause_ratio=0.0):
+    """A mono PCM16 WAV of a tone with a syllable-like envelope, silent for pause_ratio of each second"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    envelope[(t % 1.0) >= 1.0 - pause_ratio] = 0.0
+    samples = (np.sin(2 * np.pi * 220 * t) * envelope * 12000).astype("<i2")
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(samples.tobytes())
+
+
+def http_json(method, url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method=method, headers={
+        "Content-Type": "application/json",
+        "x-api-key": session_test_receiver.VALID_API_KEY,
+    })
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+class RssSampler:
+    """Track peak RSS in the background while the load runs"""
+
+    def __init__(self):
+        self.baseline = rss_bytes()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, rss_bytes())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+async def run_session(index, scenario, http_url, wav_file):
+    """One simulated client: start, stream, stop. Returns its measurements"""
+    loop = asyncio.get_running_loop()
+    body = {
+        "avatar_id": f"load-{index % 4}", "quality": scenario["quality"], "version": "v1",
+        "video_encoding": "H264",
+        "agora_settings": {"app_id": "app", "token": "token", "channel": f"load-{index}", "uid": str(index),
+                           "enable_string_uid": False},
+    }
+    start = time.perf_counter()
+    session = await loop.run_in_executor(None, http_json, "POST", f"{http_url}/session/start", body)
+    start_ms = (time.perf_counter() - start) * 1000
+
+    realtime = scenario["pacing"] == "realtime"
+    sender = WebSocketAudioSender(wav_file, websocket_address=session["websocket_address"],
+                                  session_token=session["session_token"], avatar_id=body["avatar_id"],
+                                  quality=scenario["quality"], chunk_seconds=scenario["chunk_ms"] / 1000,
+                                  chunk_delay=0.0, realtime=realtime, settle_delay=0.0,
+                                  linger=0.2, interrupt_rate=scenario["interrupt_rate"],
+                                  vad_threshold_dbfs=scenario["vad_dbfs"],
+                                  adaptive_chunks=scenario["adaptive_chunks"])
+    await sender.run()
+    await loop.run_in_executor(None, http_json, "DELETE", f"{http_url}/session/stop",
+                               {"session_id": session["session_id"]})
+    return {"start_ms": start_ms, "chunks": sender.chunks_sent, "interrupts": sender.interrupts_sent,
+            "bytes_sent": sender.bytes_sent, "silent_chunks": sender.silent_chunks,
+            "final_chunk_ms": sender.chunk_controller.chunk_ms if sender.chunk_controller is not None else None}
+
+
+def ingest_lags_us(trace_file):
+    """voice.send -> voice.recv per event_id, in microseconds"""
+    sent, received = {}, {}
+    for event in load_events(trace_file):
+        event_id = event.get("args", {}).get("event_id")
+        if event["name"] == "voice.send":
+            sent[event_id] = event["ts"]
+        elif event["name"] == "voice.recv":
+            received[event_id] = event["ts"]
+    return [received[event_id] - ts for event_id, ts in sent.items() if event_id in received]
+
+
+async def run_load(scenario, work_dir):
+    wav_file = os.path.join(work_dir, "load.wav")
+    write_wav(wav_file, scenario["audio_seconds"], scenario["sample_rate"], scenario["pause_ratio"])
+
+    # Background avatar warming only matters when frames are rendered
+    if scenario["video"]:
+        session_test_receiver.open_avatar_cache()
+    else:
+        session_test_receiver.avatar_cache = None
+    httpd = HTTPServer(("127.0.0.1", 0), session_test_receiver.SessionHandler)
+    http_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    http_thread.start()
+    http_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    frames = [0]
+
+    def count_frame(client_id, frame, timestamp):
+        frames[0] += 1
+
+    receiver = WebSocketTestReceiver(
+        output_wav_file=os.path.join(work_dir, "received.wav"),
+        video_frame_sink=count_frame if scenario["video"] else None,
+        avatar_cache=session_test_receiver.avatar_cache if scenario["video"] else None)
+    server = await websockets.serve(receiver.handle_client, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    session_test_receiver.WEBSOCKET_ADDRESS = f"ws://127.0.0.1:{port}"
+
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        tasks = []
+        for index in range(scenario["sessions"]):
+            tasks.append(asyncio.create_task(run_session(index, scenario, http_url, wav_file)))
+            if scenario["sessions"] > 1:
+                await asyncio.sleep(scenario["ramp_seconds"] / (scenario["sessions"] - 1))
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        server.close()
+        await server.wait_closed()
+        receiver.loop_lag.stop()
+        httpd.shutdown()
+        httpd.server_close()
+
+    sessions = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+    failures = [repr(outcome) for outcome in outcomes if isinstance(outcome, BaseException)]
+    return {
+        "sessions": sessions,
+        "failures": failures,
+        "elapsed_s": elapsed,
+        "memory_growth_bytes": sampler.peak - sampler.baseline,
+        "frames_rendered": frames[0],
+        "receiver": receiver.stats(),
+    }
+
+
+def p99_ms(values_us):
+    if not values_us:
+        return None
+    values_us = sorted(values_us)
+    return values_us[min(len(values_us) - 1, int(0.99 * len(values_us)))] / 1000
+
+
+def evaluate(scenario, slos, outcome, lags_us):
+    starts_us = [session["start_ms"] * 1000 for session in outcome["sessions"]]
+    measured = {
+        "start_p99_ms": p99_ms(starts_us),
+        "ingest_lag_p99_ms": p99_ms(lags_us),
+        "memory_per_session_mb": outcome["memory_growth_bytes"] / scenario["sessions"] / 1e6,
+    }
+    checks = []
+    for name, limit in slos.items():
+        value = measured[name]
+        checks.append({"slo": name, "limit": limit, "measured": value,
+                       "passed": value is not None and value <= limit})
+    checks.append({"slo": "failed_sessions", "limit": 0, "measured": len(outcome["failures"]),
+                   "passed": not outcome["failures"]})
+    return {
+        "scenario": scenario,
+        "checks": checks,
+        "passed": all(check["passed"] for check in checks),
+        "start": percentiles(starts_us),
+        "ingest_lag": percentiles(lags_us),
+        "chunks_sent": sum(session["chunks"] for session in outcome["sessions"]),
+        "interrupts_sent": sum(session["interrupts"] for session in outcome["sessions"]),
+        "silent_chunks": sum(session["silent_chunks"] for session in outcome["sessions"]),
+        "bytes_sent": sum(session["bytes_sent"] for session in outcome["sessions"]),
+        "final_chunk_ms": [session["final_chunk_ms"] for session in outcome["sessions"]
+                           if session["final_chunk_ms"] is not None],
+        "messages_received": outcome["receiver"]["messages_received"],
+        "frames_rendered": outcome["frames_rendered"],
+        "loop_lag_max_ms": outcome["receiver"].get("loop_lag_max_ms"),
+        "elapsed_s": outcome["elapsed_s"],
+        "failures": outcome["failures"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an in-process end-to-end load scenario and check SLOs")
+    parser.add_argument("--scenario", help="JSON file with scenario keys; flags given explicitly override it")
+    parser.add_argument("--sessions", type=int)
+    parser.add_argument("--ramp-seconds", type=float, help="Spread session starts over this long")
+    parser.add_argument("--chunk-ms", type=int)
+    parser.add_argument("--pacing", choices=["realtime", "fast"])
+    parser.add_argument("--interrupt-rate", type=float, help="Chance of a voice_interrupt after each chunk")
+    parser.add_argument("--audio-seconds", type=float)
+    parser.add_argument("--sample-rate", type=int)
+    parser.add_argument("--pause-ratio", type=float, help="Share of each second of the test audio that is silent")
+    parser.add_argument("--vad-dbfs", type=float, help="Send chunks quieter than this as 'silence' markers")
+    parser.add_argument("--adaptive-chunks", action="store_true", default=None,
+                        help="Let each sender size its chunks from ack RTT (--chunk-ms is then ignored)")
+    parser.add_argument("--video", action="store_true", default=None, help="Render avatar video for every session")
+    parser.add_argument("--quality", choices=["low", "medium", "high"])
+    for name, limit in SLO_DEFAULTS.items():
+        parser.add_argument(f"--slo-{name.replace('_', '-')}", dest=f"slo_{name}", type=float, default=limit)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    scenario = dict(SCENARIO_DEFAULTS)
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario.update(json.load(f))
+    for key in SCENARIO_DEFAULTS:
+        value = getattr(args, key)
+        if value is not None:
+            scenario[key] = value
+    slos = {name: getattr(args, f"slo_{name}") for name in SLO_DEFAULTS}
+
+    logging.getLogger().setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as work_dir:
+        trace_file = os.path.join(work_dir, "trace.json")
+        tracing.configure(trace_file, "load_harness")
+        try:
+            outcome = asyncio.run(run_load(scenario, work_dir))
+        finally:
+            tracing.configure(None)
+        result = evaluate(scenario, slos, outcome, ingest_lags_us(trace_file))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{scenario['sessions']} sessions, {scenario['chunk_ms']}ms chunks, {scenario['pacing']} pacing, "
+              f"interrupt rate {scenario['interrupt_rate']}, {scenario['audio_seconds']}s of audio each"
+              f"{', VAD gate at ' + str(scenario['vad_dbfs']) + 'dBFS' if scenario['vad_dbfs'] is not None else ''}"
+              f"{', video' if scenario['video'] else ''}")
+        print(f"{result['chunks_sent']} chunks and {result['interrupts_sent']} interrupts sent, "
+              f"{result['messages_received']} messages received, {result['frames_rendered']} frames rendered "
+              f"in {result['elapsed_s']:.1f}s")
+        print(f"{result['bytes_sent'] / 1e6:.2f}MB sent, {result['silent_chunks']} chunks as silence markers")
+        if result["final_chunk_ms"]:
+            print(f"Adaptive chunk size at the end: {min(result['final_chunk_ms'])}-{max(result['final_chunk_ms'])}ms")
+        print()
+        print(f"{'slo':<24} {'limit':>9} {'measured':>10} {'result':>7}")
+        for check in result["checks"]:
+            measured = "-" if check["measured"] is None else f"{check['measured']:.2f}"
+            print(f"{check['slo']:<24} {check['limit']:>9} {measured:>10} "
+                  f"{'PASS' if check['passed'] else 'FAIL':>7}")
+        for failure in result["failures"]:
+            print(f"Session failed: {failure}", file=sys.stderr)
+
+    if not result["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Stand-in consumer for the shared-memory frame ring.
+
+Attaches to a FrameRing by name, reads frame_ring.CONTROL_RECORD records
+from stdin, looks each frame up in place and releases its slot, the way a
+publisher child would hand the slot to the SDK instead of copying it out of
+a pipe. At EOF it prints its counts as JSON on stdout.
+
+Usage:
+    python benchmarks/ring_consumer.py RING_NAME [--frame-size BYTES]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+
+from frame_ring import CONTROL_RECORD, FrameRingReader  # noqa: E402
+
+
+def consume(reader, records, counts, frame_size):
+    """Read and release every frame in a block of control records"""
+    for offset in range(0, len(records), CONTROL_RECORD.size):
+        frame = reader.read(records[offset:offset + CONTROL_RECORD.size])
+        if frame is None:
+            continue
+        view, timestamp_ns = frame
+        counts["frames"] += 1
+        counts["bytes"] += len(view)
+        counts["last_timestamp_ns"] = timestamp_ns
+        if frame_size and len(view) != frame_size:
+            counts["bad_frames"] += 1
+        view.release()
+        reader.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame ring stand-in consumer")
+    parser.add_argument("ring")
+    parser.add_argument("--frame-size", type=int, default=0, help="Expected frame size, checked if set")
+    args = parser.parse_args()
+
+    reader = FrameRingReader(args.ring)
+    counts = {"frames": 0, "bytes": 0, "bad_frames": 0, "last_timestamp_ns": 0}
+    stdin = sys.stdin.fileno()
+    pending = b""
+    while True:
+        chunk = os.read(stdin, 64 * 1024)
+        if not chunk:
+            break
+        pending += chunk
+        usable = len(pending) - len(pending) % CONTROL_RECORD.size
+        consume(reader, pending[:usable], counts, args.frame_size)
+        pending = pending[usable:]
+
+    counts["torn_frames"] = reader.torn_frames
+    reader.close()
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark suite for the media ingest hot paths, with a stored baseline.
+
+Times each stage on its own across a matrix of chunk durations and sample
+rates:
+
+  sender_build     websocket_audio_sender.build_voice_message: base64,
+                   uuid4 and json.dumps for one chunk
+  receiver_handle  WebSocketTestReceiver.handle_client per message: JSON
+                   parsing, base64 decoding, resampling and jitter buffering
+  save_audio       WebSocketTestReceiver.save_audio for 10s of chunks
+  session_start    SessionHandler POST /session/start, from request body to
+                   JSON response, with no socket
+
+Each case first sizes its rounds to take at least MIN_ROUND_SECONDS (like
+timeit's autorange), then runs --repeat rounds with the garbage collector
+paused; the best time per operation is kept. Results are compared with
+benchmarks/baseline.json and printed as a percentage delta. Pass
+--save-baseline to record a new baseline, and --fail-over PCT to exit
+non-zero when any case is slower than that.
+
+The baseline records a fingerprint of the machine it was taken on (CPU
+model and count, OS, Python). On a machine with another fingerprint the
+deltas are still printed, with a warning, but --fail-over does not fail:
+timings from different hardware are not comparable.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--case receiver_handle] [--save-baseline] [--fail-over 10]
+"""
+
+import argparse
+import asyncio
+import gc
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "websocket-receive-audio"))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "connection-setup"))
+
+from bench_dispatch import ReplayWebSocket  # noqa: E402
+from websocket_audio_sender import build_voice_message  # noqa: E402
+from websocket_test_receiver import WebSocketTestReceiver  # noqa: E402
+
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+CHUNK_MS = (20, 100, 500)
+SAMPLE_RATES = (16000, 24000, 48000)
+SAVE_AUDIO_SECONDS = 10
+MIN_ROUND_SECONDS = 0.2
+
+
+def pcm_chunk(chunk_ms, sample_rate):
+    """A chunk of PCM16 noise (random, so base64 and JSON see realistic bytes)"""
+    return os.urandom(sample_rate * chunk_ms // 1000 * 2)
+
+
+def bench_sender_build(chunk_ms, sample_rate, count):
+    chunk = pcm_chunk(chunk_ms, sample_rate)
+    start = time.perf_counter()
+    for _ in range(count):
+        build_voice_message(chunk, sample_rate)
+    return time.perf_counter() - start
+
+
+def bench_receiver_handle(chunk_ms, sample_rate, count):
+    messages = [json.dumps({"command": "init", "avatar_id": "bench", "quality": "medium",
+                            "version": "v1", "video_encoding": "H264"})]
+    chunk = pcm_chunk(chunk_ms, sample_rate)
+    messages += [build_voice_message(chunk, sample_rate)[1] for _ in range(count)]
+
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            receiver = WebSocketTestReceiver(output_wav_file=os.path.join(directory, "bench.wav"))
+            receiver.save_audio = lambda *args, **kwargs: None
+            start = time.perf_counter()
+            await receiver.handle_client(ReplayWebSocket(messages))
+            elapsed = time.perf_counter() - start
+            receiver.loop_lag.stop()
+            return elapsed
+
+    return asyncio.run(run())
+
+
+def bench_save_audio(chunk_ms, sample_rate, count):
+    chunks = [pcm_chunk(chunk_ms, sample_rate)] * (SAVE_AUDIO_SECONDS * 1000 // chunk_ms)
+    with tempfile.TemporaryDirectory() as directory:
+        receiver = WebSocketTestReceiver(output_wav_file=os.path.join(directory, "bench.wav"))
+        start = time.perf_counter()
+        for _ in range(count):
+            receiver.save_audio(chunks, sample_rate=sample_rate)
+        return time.perf_counter() - start
+
+
+def bench_session_start(chunk_ms, sample_rate, count):
+    import session_test_receiver
+    # Keep background avatar warming out of the measurement
+    session_test_receiver.avatar_cache = None
+    body = json.dumps({
+        "avatar_id": "bench", "quality": "high", "version": "v1", "video_encoding": "H264",
+        "agora_settings": {"app_id": "app", "token": "token", "channel": "bench", "uid": "1",
+                           "enable_string_uid": False},
+    }).encode("utf-8")
+    headers = http.client.HTTPMessage()
+    headers["content-type"] = "application/json"
+    headers["content-length"] = str(len(body))
+    headers["x-api-key"] = session_test_receiver.VALID_API_KEY
+
+    start = time.perf_counter()
+    for _ in range(count):
+        handler = session_test_receiver.SessionHandler.__new__(session_test_receiver.SessionHandler)
+        handler.rfile = io.BytesIO(body)
+        handler.wfile = io.BytesIO()
+        handler.headers = headers
+        handler.command, handler.path, handler.request_version = "POST", "/session/start", "HTTP/1.1"
+        handler.requestline = "POST /session/start HTTP/1.1"
+        handler.client_address = ("127.0.0.1", 0)
+        handler.do_POST()
+    elapsed = time.perf_counter() - start
+    session_test_receiver.active_sessions.clear()
+    return elapsed
+
+
+# name -> (function, varies with the chunk/rate matrix)
+CASES = {
+    "sender_build": (bench_sender_build, True),
+    "receiver_handle": (bench_receiver_handle, True),
+    "save_audio": (bench_save_audio, True),
+    "session_start": (bench_session_start, False),
+}
+
+
+def run_case(name, chunk_ms, sample_rate, repeat):
+    function, _ = CASES[name]
+
+    def timed(count):
+        gc.collect()
+        gc.disable()
+        try:
+            return function(chunk_ms, sample_rate, count)
+        finally:
+            gc.enable()
+
+    # Autorange, which doubles as the warm-up
+    count = 1
+    while timed(count) < MIN_ROUND_SECONDS:
+        count *= 2
+    timings = [timed(count) / count * 1e6 for _ in range(repeat)]
+    timings.sort()
+    return {"case": name, "chunk_ms": chunk_ms, "sample_rate": sample_rate,
+            "us_per_op": timings[0], "us_per_op_median": timings[len(timings) // 2]}
+
+
+def case_key(result):
+    if result["chunk_ms"] is None:
+        return result["case"]
+    return f"{result['case']}/{result['chunk_ms']}ms/{result['sample_rate']}"
+
+
+def cpu_model():
+    """The CPU model name, from /proc/cpuinfo where there is one"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def machine_fingerprint():
+    """What a timing depends on besides the code: CPU, core count, OS and interpreter"""
+    return {
+        "cpu": cpu_model(),
+        "cpus": os.cpu_count(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+    }
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ingest micro-benchmarks and compare with a baseline")
+    parser.add_argument("--case", choices=list(CASES), action="append")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--fail-over", type=float, default=None,
+                        help="Exit with status 1 if any case is more than this many percent slower")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    results = []
+    for name in args.case or list(CASES):
+        if CASES[name][1]:
+            for chunk_ms in CHUNK_MS:
+                for sample_rate in SAMPLE_RATES:
+                    results.append(run_case(name, chunk_ms, sample_rate, args.repeat))
+        else:
+            results.append(run_case(name, None, None, args.repeat))
+
+    baseline = load_baseline(args.baseline)
+    previous = baseline["results"] if baseline else {}
+    fingerprint = machine_fingerprint()
+    # Keys that differ from the baseline's machine; only a matching machine can fail the run
+    mismatched = []
+    if baseline is not None:
+        recorded = baseline.get("fingerprint", {})
+        mismatched = [key for key in fingerprint if recorded.get(key) != fingerprint[key]]
+    regressions = []
+    for result in results:
+        reference = previous.get(case_key(result))
+        result["baseline_us_per_op"] = reference
+        result["delta_pct"] = (result["us_per_op"] / reference - 1) * 100 if reference else None
+        if args.fail_over is not None and result["delta_pct"] is not None and result["delta_pct"] > args.fail_over:
+            regressions.append(case_key(result))
+
+    if args.save_baseline:
+        # Results recorded on another machine are not kept alongside these
+        merged = {} if mismatched else dict(previous)
+        merged.update({case_key(result): round(result["us_per_op"], 3) for result in results})
+        with open(args.baseline, "w") as f:
+            json.dump({"fingerprint": fingerprint, "results": merged}, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'case':<34} {'us/op':>10} {'baseline':>10} {'delta':>8}")
+        for result in results:
+            reference = result["baseline_us_per_op"]
+            delta = f"{result['delta_pct']:+.1f}%" if result["delta_pct"] is not None else "-"
+            print(f"{case_key(result):<34} {result['us_per_op']:>10.2f} "
+                  f"{(f'{reference:.2f}' if reference else '-'):>10} {delta:>8}")
+        if baseline is None:
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+
+    if mismatched:
+        recorded = baseline.get("fingerprint", {})
+        differences = ", ".join(f"{key} {recorded.get(key)!r} vs {fingerprint[key]!r}" for key in mismatched)
+        print(f"Warning: baseline was recorded on another machine ({differences}); "
+              f"deltas are not comparable and --fail-over is ignored", file=sys.stderr)
+        regressions = []
+
+    if regressions:
+        print(f"Regressed more than {args.fail_over}%: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
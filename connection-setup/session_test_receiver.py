@@ -12,15 +12,35 @@ from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse
 import uuid
 import socket
+import sys
+from types import SimpleNamespace
+
+# Tracing and the avatar cache live with the receiver; both are optional, so the
+# server still runs on its own (the cache also needs NumPy)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "websocket-receive-audio"))
+try:
+    import tracing
+except ImportError:
+    tracing = SimpleNamespace(enabled=False, now_us=lambda: 0, instant=lambda *args, **kwargs: None,
+                              complete=lambda *args, **kwargs: None)
+try:
+    from avatar_cache import AvatarCache
+except ImportError:
+    AvatarCache = None
 
 # Configuration
 SERVER_PORT = 8764
 WEBSOCKET_PORT = 8765
+WEBSOCKET_ADDRESS = f"ws://oai.agora.io:{WEBSOCKET_PORT}"  # Returned to clients by /session/start
 VALID_API_KEY = os.environ.get("TEST_API_KEY", "test-api-key-123")  # Can be set via environment variable
 
 # In-memory storage for active sessions
 active_sessions = {}
 
+# Shared with the WebSocket receiver through the cache directory (AVATAR_CACHE_DIR);
+# created by open_avatar_cache() when the server starts
+avatar_cache = None
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -91,7 +111,7 @@ class SessionHandler(BaseHTTPRequestHandler):
         
         return True
     
-    def _generate_session_token(self):
+    def _generate_session_token(self, session_id):
         """Generate a mock JWT session token"""
         # This is a mock token for testing purposes
         header = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9"
@@ -99,7 +119,7 @@ class SessionHandler(BaseHTTPRequestHandler):
             "sub": str(uuid.uuid4()),
             "exp": int(time.time()) + 3600,  # 1 hour from now
             "iat": int(time.time()),
-            "session_id": str(uuid.uuid4())
+            "session_id": session_id
         }
         payload = json.dumps(payload_data, separators=(',', ':'))
         # Base64 encode the payload (simplified for testing)
@@ -148,6 +168,7 @@ class SessionHandler(BaseHTTPRequestHandler):
     def handle_session_start(self):
         """Handle session start POST request"""
         logger.info("Handling session start request")
+        start_us = tracing.now_us()
         
         # Validate API key
         if not self._validate_api_key():
@@ -220,7 +241,7 @@ class SessionHandler(BaseHTTPRequestHandler):
         
         # Generate session ID and token
         session_id = str(uuid.uuid4())
-        session_token = self._generate_session_token()
+        session_token = self._generate_session_token(session_id)
         
         # Store session
         session_data = {
@@ -233,11 +254,16 @@ class SessionHandler(BaseHTTPRequestHandler):
         active_sessions[session_id] = session_data
         
         logger.info(f"Created new session with ID: {session_id}")
+
+        # Decode the avatar's assets now, in the background, so they are ready when init arrives
+        if avatar_cache is not None:
+            avatar_cache.warm(request_data["avatar_id"], request_data["quality"])
+            logger.info(f"Warming avatar cache for {request_data['avatar_id']} ({request_data['quality']})")
         logger.info(f"Active sessions count: {len(active_sessions)}")
         
         # Get server hostname for WebSocket address
         hostname = get_server_hostname()
-        websocket_address = f"ws://oai.agora.io:{WEBSOCKET_PORT}"
+        websocket_address = WEBSOCKET_ADDRESS
         
         # Return success response
         response_data = {
@@ -248,6 +274,8 @@ class SessionHandler(BaseHTTPRequestHandler):
         
         logger.info(f"Sending success response: {json.dumps(response_data, indent=2)}")
         self._send_json_response(200, response_data)
+        tracing.complete("session.start", start_us, session_id=session_id,
+                         avatar_id=request_data["avatar_id"], quality=request_data["quality"])
     
     def handle_session_stop(self):
         """Handle session stop DELETE request"""
@@ -290,6 +318,7 @@ class SessionHandler(BaseHTTPRequestHandler):
         
         # Remove session from active sessions
         del active_sessions[session_id]
+        tracing.instant("session.stop", session_id)
         logger.info(f"Terminated session with ID: {session_id}")
         logger.info(f"Active sessions count: {len(active_sessions)}")
         
@@ -303,9 +332,18 @@ class SessionHandler(BaseHTTPRequestHandler):
         self._send_json_response(200, response_data)
 
 
+def open_avatar_cache():
+    """Create the avatar cache the session handlers warm; None if NumPy is not installed"""
+    global avatar_cache
+    if avatar_cache is None and AvatarCache is not None:
+        avatar_cache = AvatarCache()
+    return avatar_cache
+
+
 def main():
     """Start the mock server"""
     hostname = get_server_hostname()
+    open_avatar_cache()
     
     logger.info("=" * 60)
     logger.info("SESSION TEST RECEIVER SERVER")
@@ -314,6 +352,10 @@ def main():
     logger.info(f"Server hostname: {hostname}")
     logger.info(f"WebSocket address will be: ws://{hostname}:{WEBSOCKET_PORT}")
     logger.info(f"Valid API key: {VALID_API_KEY}")
+    if avatar_cache is not None:
+        logger.info(f"Avatar cache: {avatar_cache.directory}")
+    else:
+        logger.info("Avatar cache: disabled (NumPy not installed)")
     logger.info("")
     logger.info("Available endpoints:")
     logger.info(f"  POST   http://{hostname}:{SERVER_PORT}/session/start")
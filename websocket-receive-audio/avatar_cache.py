@@ -0,0 +1,254 @@
+"""
+Per-avatar asset cache with memory-mapped, render-ready frames.
+
+Building an avatar's imagery (decoding its base frames and idle loop and
+premultiplying its mouth layers) costs tens of milliseconds per session, and
+100ms+ at 720p, all before the first frame can go out. AvatarCache does that
+once per (avatar_id, quality) and writes the result to a file in a shared
+directory (/dev/shm when available):
+
+    header   magic, version, width, height, mouth levels, idle frames
+    layers   per mouth level: x, y, height, width
+    data     idle frames (I420), then per level the premultiplied planes
+             and inverse alphas (uint16), each block 64-byte aligned
+
+The file is mapped read-only and the SpriteSet's arrays point straight into
+the mapping, so every worker process (and the /session/start server, which
+warms the cache before the WebSocket connects) shares one copy through the
+page cache. Entries are evicted least recently used once the directory
+exceeds the byte budget; a process that still has an evicted file mapped
+keeps using it until it lets go.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from avatar_renderer import QUALITY_PRESETS, SpriteLayer, SpriteSet, build_procedural_sprites, i420_size
+
+# Configuration
+AVATAR_CACHE_DIR = os.environ.get("AVATAR_CACHE_DIR") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "avatar_cache")
+AVATAR_CACHE_BUDGET_MB = 256
+CACHE_MAGIC = 0x41564331
+CACHE_VERSION = 1
+WARM_WORKERS = 2
+
+logger = logging.getLogger(__name__)
+
+# magic, version, width, height, mouth levels, idle frames
+_HEADER = struct.Struct("<IIIIII")
+# x, y, height, width
+_LAYER = struct.Struct("<IIII")
+
+
+def _align(offset):
+    return (offset + 63) & ~63
+
+
+def _plane_shapes(layer_height, layer_width):
+    """Shapes of a layer's Y, U and V planes"""
+    return [(layer_height, layer_width)] + [(layer_height // 2, layer_width // 2)] * 2
+
+
+def procedural_loader(avatar_id, width, height):
+    """Default loader: the procedural face, the same for every avatar_id"""
+    return build_procedural_sprites(width, height)
+
+
+def write_sprites(path, sprites):
+    """Serialise a SpriteSet to path (atomically, via a temporary file)"""
+    layers = sprites.mouths
+    header = _HEADER.pack(CACHE_MAGIC, CACHE_VERSION, sprites.width, sprites.height,
+                          len(layers), len(sprites.idle_frames))
+    header += b"".join(_LAYER.pack(layer.x, layer.y, layer.height, layer.width) for layer in layers)
+
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header)
+        for array in list(sprites.idle_frames) + [plane for layer in layers
+                                                   for plane in layer.premultiplied + layer.inverse_alpha]:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temporary, path)
+
+
+def map_sprites(path):
+    """Map a cache file read-only; returns (SpriteSet backed by the mapping, mapping)"""
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, width, height, levels, idle_count = _HEADER.unpack_from(mapping, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        mapping.close()
+        raise ValueError(f"{path} is not a version {CACHE_VERSION} avatar cache file")
+
+    offset = _HEADER.size
+    layouts = []
+    for _ in range(levels):
+        layouts.append(_LAYER.unpack_from(mapping, offset))
+        offset += _LAYER.size
+
+    def take(dtype, shape):
+        nonlocal offset
+        offset = _align(offset)
+        array = np.frombuffer(mapping, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        offset += array.nbytes
+        return array
+
+    idle_frames = [take(np.uint8, (i420_size(width, height),)) for _ in range(idle_count)]
+    mouths = []
+    for x, y, layer_height, layer_width in layouts:
+        shapes = _plane_shapes(layer_height, layer_width)
+        premultiplied = [take(np.uint16, shape) for shape in shapes]
+        inverse_alpha = [take(np.uint16, shape) for shape in shapes]
+        mouths.append(SpriteLayer.from_premultiplied(x, y, premultiplied, inverse_alpha))
+    return SpriteSet(width, height, idle_frames[0], mouths, idle_frames), mapping
+
+
+class AvatarCache:
+    """LRU cache of render-ready avatar assets in memory-mapped files, shared across processes"""
+
+    def __init__(self, directory=AVATAR_CACHE_DIR, budget_bytes=AVATAR_CACHE_BUDGET_MB * 1024 * 1024,
+                 loader=procedural_loader):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        # loader(avatar_id, width, height) -> SpriteSet, called on a miss
+        self.loader = loader
+        os.makedirs(directory, exist_ok=True)
+
+        # Entries mapped by this process, least recently used first: key -> (SpriteSet, mapping)
+        self._mapped = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._warming = {}
+        self._pool = None
+
+        # Metrics
+        self.hits = 0
+        self.maps = 0
+        self.builds = 0
+        self.evictions = 0
+        self.build_ms_total = 0.0
+
+    def path_for(self, avatar_id, quality):
+        width, height, _ = QUALITY_PRESETS[quality]
+        digest = hashlib.sha1(str(avatar_id).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}-{width}x{height}-v{CACHE_VERSION}.avc")
+
+    def get(self, avatar_id, quality):
+        """Return the SpriteSet for an avatar at a quality, mapping or building it as needed"""
+        key = (avatar_id, quality)
+        path = self.path_for(avatar_id, quality)
+        with self._lock:
+            entry = self._mapped.get(key)
+            if entry is not None:
+                self._mapped.move_to_end(key)
+                self.hits += 1
+                self._touch(path)
+                return entry[0]
+
+        try:
+            sprites, mapping = map_sprites(path)
+            self.maps += 1
+        except (FileNotFoundError, ValueError):
+            start = time.perf_counter()
+            width, height, _ = QUALITY_PRESETS[quality]
+            write_sprites(path, self.loader(avatar_id, width, height))
+            sprites, mapping = map_sprites(path)
+            build_ms = (time.perf_counter() - start) * 1000
+            self.builds += 1
+            self.build_ms_total += build_ms
+            logger.info(f"Built avatar assets for {avatar_id} at {quality} in {build_ms:.1f}ms")
+
+        with self._lock:
+            self._mapped[key] = (sprites, mapping)
+            self._touch(path)
+        self._evict(keep=path)
+        return sprites
+
+    def warm(self, avatar_id, quality):
+        """Start loading an avatar in the background; returns a concurrent.futures.Future of its SpriteSet"""
+        key = (avatar_id, quality)
+        with self._lock:
+            entry = self._mapped.get(key)
+            if entry is not None:
+                self._mapped.move_to_end(key)
+                self.hits += 1
+                future = concurrent.futures.Future()
+                future.set_result(entry[0])
+                return future
+            future = self._warming.get(key)
+            if future is None:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(WARM_WORKERS, thread_name_prefix="avatar-warm")
+                future = self._warming[key] = self._pool.submit(self.get, avatar_id, quality)
+                future.add_done_callback(lambda _: self._warming.pop(key, None))
+        return future
+
+    def _touch(self, path):
+        # mtime is the LRU clock shared by every process using the directory
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep):
+        """Delete least recently used files until the directory fits the budget"""
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".avc"):
+                continue
+            try:
+                info = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((info.st_mtime, entry.path, info.st_size))
+            total += info.st_size
+
+        for _, path, size in sorted(files):
+            if total <= self.budget_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            self.evictions += 1
+            self._forget(path)
+            logger.info(f"Evicted avatar assets {os.path.basename(path)} ({size / 1e6:.1f}MB)")
+
+    def _forget(self, path):
+        """Drop this process's reference to an evicted file; in-use arrays keep the mapping alive"""
+        with self._lock:
+            for key in list(self._mapped):
+                if self.path_for(*key) == path:
+                    del self._mapped[key]
+
+    def stats(self):
+        """Return cache metrics as a plain dict"""
+        return {
+            "avatar_cache_entries": len(self._mapped),
+            "avatar_cache_hits": self.hits,
+            "avatar_cache_maps": self.maps,
+            "avatar_cache_builds": self.builds,
+            "avatar_cache_evictions": self.evictions,
+            "avatar_cache_avg_build_ms": round(self.build_ms_total / self.builds, 2) if self.builds else 0.0,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        with self._lock:
+            self._mapped.clear()
@@ -0,0 +1,332 @@
+"""
+CPU reference avatar renderer: turns a session's audio into I420 video frames.
+
+The Go publisher pushes raw YUV420 frames (ParentController.StreamVideo ->
+MediaSamplePayload), but nothing produced them from the received audio.
+AvatarRenderer composites pre-built sprite layers over a base frame with
+NumPy: a face plate and a mouth sprite chosen from the audio energy of each
+video frame's worth of samples. Frames are written into a small pool of
+preallocated I420 buffers, so steady-state rendering does not allocate.
+
+Sprites are generated procedurally here so the stage runs without any
+assets; a real avatar would load its decoded layers into the same
+SpriteSet structure (avatar_cache.AvatarCache keeps them memory-mapped and
+shared between processes).
+"""
+
+import logging
+
+import numpy as np
+
+# Configuration
+QUALITY_PRESETS = {
+    "low": (320, 180, 15),
+    "medium": (640, 360, 30),
+    "high": (1280, 720, 30),
+}
+DEFAULT_QUALITY = "medium"
+MOUTH_LEVELS = 6
+FRAME_POOL_SIZE = 3
+SILENCE_DB = -50.0
+FULL_SCALE_DB = -12.0
+ENERGY_ATTACK = 0.6
+ENERGY_RELEASE = 0.25
+
+logger = logging.getLogger(__name__)
+
+_sprite_cache = {}
+
+
+def i420_size(width, height):
+    """Bytes in one I420 frame"""
+    return width * height * 3 // 2
+
+
+def rgb_to_yuv(r, g, b):
+    """BT.601 limited-range conversion of one colour"""
+    y = 16 + (65.738 * r + 129.057 * g + 25.064 * b) / 256
+    u = 128 + (-37.945 * r - 74.494 * g + 112.439 * b) / 256
+    v = 128 + (112.439 * r - 94.154 * g - 18.285 * b) / 256
+    return int(round(y)), int(round(u)), int(round(v))
+
+
+def _ellipse_mask(height, width, cy, cx, ry, rx):
+    """Float coverage mask of an ellipse on a height x width grid, with a 1px soft edge"""
+    ys, xs = np.ogrid[:height, :width]
+    distance = np.sqrt(((ys + 0.5 - cy) / max(ry, 1e-6)) ** 2 + ((xs + 0.5 - cx) / max(rx, 1e-6)) ** 2)
+    edge = 1.0 / max(min(rx, ry), 1.0)
+    return np.clip((1.0 - distance) / edge, 0.0, 1.0)
+
+
+class SpriteLayer:
+    """One pre-decoded layer: premultiplied planes and inverse alpha for a region of the frame"""
+
+    def __init__(self, x, y, planes, alphas):
+        # x, y are in luma pixels and even, so the chroma region lines up
+        self.x = x
+        self.y = y
+        self.height, self.width = planes[0].shape
+        self.premultiplied = []
+        self.inverse_alpha = []
+        for plane, alpha in zip(planes, alphas):
+            a = np.rint(alpha * 256).astype(np.uint16)
+            self.premultiplied.append(plane.astype(np.uint16) * a)
+            self.inverse_alpha.append(256 - a)
+
+    @classmethod
+    def from_premultiplied(cls, x, y, premultiplied, inverse_alpha):
+        """Wrap planes that are already premultiplied, such as ones mapped from the avatar cache"""
+        layer = cls.__new__(cls)
+        layer.x = x
+        layer.y = y
+        layer.height, layer.width = premultiplied[0].shape
+        layer.premultiplied = list(premultiplied)
+        layer.inverse_alpha = list(inverse_alpha)
+        return layer
+
+
+class SpriteSet:
+    """Base frame plus the mouth layers for one avatar at one resolution"""
+
+    def __init__(self, width, height, base, mouths, idle_frames=None):
+        self.width = width
+        self.height = height
+        # base is a full I420 frame; mouths[level] is a SpriteLayer
+        self.base = base
+        self.mouths = mouths
+        # Full I420 frames the base cycles through (an idle loop); just base if there is none
+        self.idle_frames = idle_frames or [base]
+
+
+def build_procedural_sprites(width, height, levels=MOUTH_LEVELS):
+    """Draw a simple face plate and mouth shapes from closed to fully open"""
+    if width % 2 or height % 2:
+        raise ValueError(f"I420 needs even dimensions, got {width}x{height}")
+    cw, ch = width // 2, height // 2
+
+    # Vertical background gradient with a face ellipse and two eyes
+    bg_top, bg_bottom = rgb_to_yuv(40, 60, 90), rgb_to_yuv(15, 20, 35)
+    skin, eye, lips, mouth_inside = (rgb_to_yuv(224, 172, 140), rgb_to_yuv(30, 30, 40),
+                                     rgb_to_yuv(170, 70, 80), rgb_to_yuv(60, 15, 25))
+    ramp = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    cramp = ramp[::2]
+
+    def fill(plane_index, grid_ramp, shape):
+        top, bottom = bg_top[plane_index], bg_bottom[plane_index]
+        return np.broadcast_to(top + (bottom - top) * grid_ramp, shape).astype(np.float32)
+
+    y_plane = fill(0, ramp, (height, width)).copy()
+    u_plane = fill(1, cramp, (ch, cw)).copy()
+    v_plane = fill(2, cramp, (ch, cw)).copy()
+
+    def paint(mask_full, mask_chroma, colour):
+        y_plane[:] = y_plane * (1 - mask_full) + colour[0] * mask_full
+        u_plane[:] = u_plane * (1 - mask_chroma) + colour[1] * mask_chroma
+        v_plane[:] = v_plane * (1 - mask_chroma) + colour[2] * mask_chroma
+
+    def shape(cy, cx, ry, rx):
+        return (_ellipse_mask(height, width, cy, cx, ry, rx),
+                _ellipse_mask(ch, cw, cy / 2, cx / 2, ry / 2, rx / 2))
+
+    paint(*shape(height * 0.5, width * 0.5, height * 0.42, height * 0.32), skin)
+    for side in (-1, 1):
+        paint(*shape(height * 0.4, width * 0.5 + side * height * 0.12, height * 0.035, height * 0.05), eye)
+
+    base = np.empty(i420_size(width, height), dtype=np.uint8)
+    base[:width * height] = np.rint(y_plane).astype(np.uint8).ravel()
+    base[width * height:width * height + cw * ch] = np.rint(u_plane).astype(np.uint8).ravel()
+    base[width * height + cw * ch:] = np.rint(v_plane).astype(np.uint8).ravel()
+
+    # Mouth region, aligned to even luma coordinates
+    mw = (int(height * 0.26) + 1) & ~1
+    mh = (int(height * 0.16) + 1) & ~1
+    mx = (width // 2 - mw // 2) & ~1
+    my = (int(height * 0.66) - mh // 2) & ~1
+    mouths = []
+    for level in range(levels):
+        openness = level / max(levels - 1, 1)
+        rx, ry = mw * 0.45, max(mh * 0.08, mh * 0.45 * openness)
+        outer_y = _ellipse_mask(mh, mw, mh / 2, mw / 2, ry + mh * 0.06, rx)
+        outer_c = _ellipse_mask(mh // 2, mw // 2, mh / 4, mw / 4, (ry + mh * 0.06) / 2, rx / 2)
+        inner_y = _ellipse_mask(mh, mw, mh / 2, mw / 2, ry * openness, rx * 0.8)
+        inner_c = _ellipse_mask(mh // 2, mw // 2, mh / 4, mw / 4, ry * openness / 2, rx * 0.4)
+        planes = []
+        for index, inner in enumerate((inner_y, inner_c, inner_c)):
+            planes.append(lips[index] * (1 - inner) + mouth_inside[index] * inner)
+        mouths.append(SpriteLayer(mx, my, planes, (outer_y, outer_c, outer_c)))
+
+    return SpriteSet(width, height, base, mouths)
+
+
+def get_sprites(width, height, levels=MOUTH_LEVELS):
+    """Return the (shared, read-only) sprite set for a resolution, building it once"""
+    key = (width, height, levels)
+    sprites = _sprite_cache.get(key)
+    if sprites is None:
+        sprites = _sprite_cache[key] = build_procedural_sprites(width, height, levels)
+    return sprites
+
+
+class AvatarRenderer:
+    """Renders one session's audio into I420 frames at a fixed size and frame rate"""
+
+    def __init__(self, width, height, fps, sample_rate=16000, sprites=None, pool_size=FRAME_POOL_SIZE):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.sample_rate = sample_rate
+        self.sprites = sprites or get_sprites(width, height)
+        self.frame_size = i420_size(width, height)
+
+        # Preallocated output frames, each with plane views
+        self._pool = []
+        luma, chroma = width * height, (width // 2) * (height // 2)
+        for _ in range(pool_size):
+            buffer = np.empty(self.frame_size, dtype=np.uint8)
+            planes = (buffer[:luma].reshape(height, width),
+                      buffer[luma:luma + chroma].reshape(height // 2, width // 2),
+                      buffer[luma + chroma:].reshape(height // 2, width // 2))
+            self._pool.append((buffer, planes))
+        self._next_buffer = 0
+        self._idle_index = 0
+        largest = max(layer.height * layer.width for layer in self.sprites.mouths)
+        self._scratch = np.empty(largest, dtype=np.uint16)
+
+        # Audio accumulated towards the next frame; frame n covers samples
+        # [n * rate / fps, (n + 1) * rate / fps)
+        self._audio = np.zeros(0, dtype=np.float32)
+        self._frame_index = 0
+        self._consumed_samples = 0
+        self._energy = 0.0
+
+        self.frames_rendered = 0
+
+    @classmethod
+    def for_quality(cls, quality, sample_rate=16000, sprites=None):
+        """Create a renderer from an init message's quality field"""
+        if quality not in QUALITY_PRESETS:
+            logger.warning(f"Unknown quality '{quality}', rendering at '{DEFAULT_QUALITY}'")
+            quality = DEFAULT_QUALITY
+        width, height, fps = QUALITY_PRESETS[quality]
+        if sprites is not None and (sprites.width, sprites.height) != (width, height):
+            logger.warning(f"Sprites are {sprites.width}x{sprites.height}, not {width}x{height}; ignoring them")
+            sprites = None
+        return cls(width, height, fps, sample_rate, sprites)
+
+    def level_for_energy(self, rms):
+        """Map a frame's RMS (PCM16 scale) to a mouth level, with attack/release smoothing"""
+        db = 20 * np.log10(max(rms, 1.0) / 32768.0)
+        target = min(1.0, max(0.0, (db - SILENCE_DB) / (FULL_SCALE_DB - SILENCE_DB)))
+        rate = ENERGY_ATTACK if target > self._energy else ENERGY_RELEASE
+        self._energy += (target - self._energy) * rate
+        return int(round(self._energy * (len(self.sprites.mouths) - 1)))
+
+    def _planes(self, out):
+        """Frame and plane views over a caller-supplied writable buffer"""
+        buffer = np.frombuffer(out, dtype=np.uint8, count=self.frame_size)
+        luma, chroma = self.width * self.height, (self.width // 2) * (self.height // 2)
+        return buffer, (buffer[:luma].reshape(self.height, self.width),
+                        buffer[luma:luma + chroma].reshape(self.height // 2, self.width // 2),
+                        buffer[luma + chroma:].reshape(self.height // 2, self.width // 2))
+
+    def render(self, level, out=None):
+        """Composite the base frame and the mouth sprite for level; returns a memoryview of the frame
+
+        Without out, the view is valid until the pool wraps around (pool_size
+        renders later). out can be any writable buffer of at least frame_size
+        bytes, such as a frame_ring slot, to render in place.
+        """
+        if out is None:
+            buffer, planes = self._pool[self._next_buffer]
+            self._next_buffer = (self._next_buffer + 1) % len(self._pool)
+        else:
+            buffer, planes = self._planes(out)
+        idle_frames = self.sprites.idle_frames
+        np.copyto(buffer, idle_frames[self._idle_index % len(idle_frames)])
+        self._idle_index += 1
+
+        layer = self.sprites.mouths[level]
+        for index, plane in enumerate(planes):
+            scale = 1 if index == 0 else 2
+            x, y = layer.x // scale, layer.y // scale
+            premultiplied = layer.premultiplied[index]
+            h, w = premultiplied.shape
+            region = plane[y:y + h, x:x + w]
+            scratch = self._scratch[:h * w].reshape(h, w)
+            # out = (sprite * a + base * (256 - a)) / 256
+            np.multiply(region, layer.inverse_alpha[index], out=scratch)
+            scratch += premultiplied
+            scratch >>= 8
+            np.copyto(region, scratch, casting="unsafe")
+
+        self.frames_rendered += 1
+        return memoryview(buffer)
+
+    def feed(self, pcm16_bytes):
+        """Add mono PCM16 audio at sample_rate"""
+        samples = np.frombuffer(pcm16_bytes, dtype="<i2").astype(np.float32)
+        self._audio = np.concatenate((self._audio, samples)) if len(self._audio) else samples
+
+    def render_next(self, out=None):
+        """Render the next frame if enough audio has been fed; returns (frame, pts_ns) or None
+
+        out is passed on to render().
+        """
+        end = (self._frame_index + 1) * self.sample_rate // self.fps
+        needed = end - self._consumed_samples
+        if len(self._audio) < needed:
+            return None
+        window, self._audio = self._audio[:needed], self._audio[needed:]
+        self._consumed_samples = end
+        rms = float(np.sqrt(np.dot(window, window) / needed)) if needed else 0.0
+        pts_ns = self._frame_index * 1_000_000_000 // self.fps
+        self._frame_index += 1
+        return self.render(self.level_for_energy(rms), out), pts_ns
+
+    def state(self):
+        """Position in the session's audio and animation, for restore() on another renderer"""
+        return {
+            "frame_index": self._frame_index,
+            "consumed_samples": self._consumed_samples,
+            "energy": self._energy,
+            "idle_index": self._idle_index,
+            "audio": self._audio,
+        }
+
+    def restore(self, state):
+        """Continue from a state() taken from a renderer with the same size, rate and sprites"""
+        self._frame_index = state["frame_index"]
+        self._consumed_samples = state["consumed_samples"]
+        self._energy = state["energy"]
+        self._idle_index = state["idle_index"]
+        self._audio = state["audio"]
+
+    def seek(self, samples):
+        """Continue with the first frame that starts at or after samples into the session, with no audio buffered"""
+        self._frame_index = -(-samples * self.fps // self.sample_rate)
+        self._consumed_samples = self._frame_index * self.sample_rate // self.fps
+        self._audio = np.zeros(0, dtype=np.float32)
+
+    def with_quality(self, quality, sprites=None):
+        """A renderer at another quality that carries on from this one's audio position
+
+        Its first frame covers the audio this one had not yet rendered, up to
+        the end of the first frame of the new rate's grid that starts at or
+        after that point.
+        """
+        renderer = type(self).for_quality(quality, self.sample_rate, sprites)
+        renderer._frame_index = -(-self._consumed_samples * renderer.fps // self.sample_rate)
+        renderer._consumed_samples = self._consumed_samples
+        renderer._energy = self._energy
+        renderer._idle_index = self._idle_index
+        renderer._audio = self._audio
+        return renderer
+
+    def stats(self):
+        """Return renderer metrics as a plain dict"""
+        return {
+            "video_width": self.width,
+            "video_height": self.height,
+            "video_fps": self.fps,
+            "frames_rendered": self.frames_rendered,
+        }
@@ -0,0 +1,159 @@
+"""
+Adaptive chunk sizing for the audio sender.
+
+The receiver can only play a chunk once all of it has arrived, so every
+millisecond of chunk duration is a millisecond of latency. Every message
+also costs a JSON envelope, a WebSocket frame and a receiver dispatch,
+though. On a slow or lossy link, small chunks queue up behind each other and
+add more latency than they save.
+
+ChunkSizeController picks the chunk duration from what the link is doing. It
+is delay-based, like LEDBAT. The receiver acks each voice chunk (voice_ack).
+The controller tracks the base RTT (the minimum over a sliding window) and a
+smoothed RTT, and takes their difference as the queue the sender has built.
+The oldest unacked chunk's age and the time send() spent blocked on the
+socket count too, so a stalled link shows up before its acks do. Without
+acks, only the send time is used.
+
+Once per DECISION_INTERVAL_MS of audio:
+
+  queue above TARGET_QUEUE_MS        grow the chunk by GROW_FACTOR
+  queue below half of it, twice      shrink by SHRINK_STEP_MS
+  otherwise                          hold
+
+The result is clamped to min_ms..max_ms. This settles on the smallest chunk
+that does not build a queue. Every decision is logged with its inputs, so
+the constants can be tuned per region.
+"""
+
+import collections
+import logging
+import time
+
+# Configuration
+MIN_CHUNK_MS = 10
+MAX_CHUNK_MS = 200
+INITIAL_CHUNK_MS = 40
+DECISION_INTERVAL_MS = 500
+TARGET_QUEUE_MS = 20.0
+GROW_FACTOR = 1.5
+SHRINK_STEP_MS = 10
+CALM_DECISIONS_TO_SHRINK = 2
+BASE_RTT_WINDOW_SECONDS = 10.0
+SRTT_GAIN = 0.125
+MAX_OUTSTANDING = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkSizeController:
+    """Chooses the next chunk duration from ack RTT and send time"""
+
+    def __init__(self, min_ms=MIN_CHUNK_MS, max_ms=MAX_CHUNK_MS, initial_ms=INITIAL_CHUNK_MS,
+                 target_queue_ms=TARGET_QUEUE_MS, decision_interval_ms=DECISION_INTERVAL_MS):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.chunk_ms = min(max(initial_ms, min_ms), max_ms)
+        self.target_queue_ms = target_queue_ms
+        self.decision_interval_ms = decision_interval_ms
+
+        # event_id -> monotonic send time, oldest first
+        self._outstanding = collections.OrderedDict()
+        # Sliding-window minimum of ack RTTs: (time, rtt) with increasing rtt
+        self._rtt_window = collections.deque()
+        self.srtt_ms = None
+        self.acks = 0
+        self._audio_ms = 0
+        self._send_ms_max = 0.0
+        self._calm = 0
+
+        # Metrics
+        self.decisions = 0
+        self.grows = 0
+        self.shrinks = 0
+
+    @property
+    def base_rtt_ms(self):
+        return self._rtt_window[0][1] if self._rtt_window else None
+
+    def on_sent(self, event_id, duration_ms, send_seconds):
+        """Record a chunk that send() took send_seconds to accept"""
+        self._outstanding[event_id] = time.monotonic()
+        if len(self._outstanding) > MAX_OUTSTANDING:
+            self._outstanding.popitem(last=False)
+        self._send_ms_max = max(self._send_ms_max, send_seconds * 1000)
+        self._audio_ms += duration_ms
+
+    def on_ack(self, event_id):
+        """Record the receiver's voice_ack for a chunk"""
+        sent_at = self._outstanding.pop(event_id, None)
+        if sent_at is None:
+            return
+        now = time.monotonic()
+        rtt_ms = (now - sent_at) * 1000
+        self.acks += 1
+        self.srtt_ms = rtt_ms if self.srtt_ms is None else self.srtt_ms + SRTT_GAIN * (rtt_ms - self.srtt_ms)
+
+        window = self._rtt_window
+        while window and window[-1][1] >= rtt_ms:
+            window.pop()
+        window.append((now, rtt_ms))
+        while window[0][0] < now - BASE_RTT_WINDOW_SECONDS:
+            window.popleft()
+
+    def queue_ms(self):
+        """Estimated queueing delay the sender has built, in milliseconds"""
+        queue = self._send_ms_max
+        base = self.base_rtt_ms
+        if base is not None:
+            queue = max(queue, self.srtt_ms - base)
+            if self._outstanding:
+                oldest = next(iter(self._outstanding.values()))
+                queue = max(queue, (time.monotonic() - oldest) * 1000 - base)
+        return queue
+
+    def next_chunk_ms(self):
+        """Duration for the next chunk, deciding again once per decision interval"""
+        if self._audio_ms >= self.decision_interval_ms:
+            self._decide()
+        return self.chunk_ms
+
+    def _decide(self):
+        queue = self.queue_ms()
+        previous = self.chunk_ms
+        if queue > self.target_queue_ms:
+            self._calm = 0
+            self.chunk_ms = min(self.max_ms, int(round(previous * GROW_FACTOR)))
+        elif queue < self.target_queue_ms / 2:
+            self._calm += 1
+            if self._calm >= CALM_DECISIONS_TO_SHRINK:
+                self._calm = 0
+                self.chunk_ms = max(self.min_ms, previous - SHRINK_STEP_MS)
+        else:
+            self._calm = 0
+
+        action = "grow" if self.chunk_ms > previous else "shrink" if self.chunk_ms < previous else "hold"
+        self.decisions += 1
+        if action == "grow":
+            self.grows += 1
+        elif action == "shrink":
+            self.shrinks += 1
+        base = self.base_rtt_ms
+        logger.info(f"Chunk size {action}: {previous}ms -> {self.chunk_ms}ms "
+                    f"(queue={queue:.1f}ms srtt={self.srtt_ms or 0:.1f}ms "
+                    f"base_rtt={base or 0:.1f}ms max_send={self._send_ms_max:.1f}ms "
+                    f"unacked={len(self._outstanding)})")
+        self._audio_ms = 0
+        self._send_ms_max = 0.0
+
+    def stats(self):
+        """Return controller state as a plain dict"""
+        return {
+            "chunk_ms": self.chunk_ms,
+            "srtt_ms": round(self.srtt_ms, 2) if self.srtt_ms is not None else None,
+            "base_rtt_ms": round(self.base_rtt_ms, 2) if self.base_rtt_ms is not None else None,
+            "acks": self.acks,
+            "decisions": self.decisions,
+            "grows": self.grows,
+            "shrinks": self.shrinks,
+        }
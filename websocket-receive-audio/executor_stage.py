@@ -0,0 +1,239 @@
+"""
+Executor stage for CPU-heavy per-chunk work in the WebSocket receiver.
+
+Decoding (and whatever processing follows it) runs inline on the event loop
+by default, so one large chunk stalls every other connection on the node.
+ChunkExecutor ships that work to a thread or process pool instead. Each
+session gets an OrderedLane: work is submitted to the pool as soon as it
+arrives, but results are released through an asyncio queue strictly in
+submission order. Loop lag and pool queue depth are tracked so it is easy to
+confirm the loop stays responsive.
+
+A lane can also have a stage: stateful work, such as resampling with the
+filter history of earlier chunks, that must see every item in order. It runs
+on the pool one item at a time, as each item reaches the front of the lane,
+and its state travels with the job (pickled to the worker and back in
+process mode).
+
+Process workers start lazily, from a receiver that is already running
+threads, so they come from a forkserver rather than a fork of the receiver,
+which could leave a child holding a lock one of those threads had.
+"""
+
+import asyncio
+import base64
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Configuration
+EXECUTOR_MODES = ("inline", "thread", "process")
+LOOP_LAG_INTERVAL = 0.05
+LOOP_LAG_WARN_MS = 100
+
+logger = logging.getLogger(__name__)
+
+
+def decode_voice_chunk(audio_base64):
+    """Default chunk processor: decode a base64 'voice' payload to PCM bytes"""
+    return base64.b64decode(audio_base64)
+
+
+class LaneMarker:
+    """Control item that travels through a lane in order with the audio results"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class OrderedLane:
+    """Per-session submission queue that returns pool results in submission order
+
+    Every item carries a tag (e.g. the utterance segment it belongs to) and
+    comes out of the results queue as a (tag, value) pair. If is_stale(tag)
+    turns true while an item is queued, the item is cancelled and skipped
+    when it reaches the front, so dropping work never has to walk the queue.
+    With a stage, stage(state, value) -> (state, value) runs on every item
+    that is not skipped, markers included, before it is released. Submitted
+    work that is skipped or fails still comes out, as (tag, None), so the
+    caller can settle whatever it counted in at submit().
+    """
+
+    def __init__(self, executor, is_stale=None, stage=None, state=None):
+        self._executor = executor
+        self._is_stale = is_stale
+        self._stage = stage
+        self.state = state
+        self._pending = asyncio.Queue()
+        self.results = asyncio.Queue()
+        self.dropped = 0
+        # Input size of submitted work not yet out of the lane, for memory accounting
+        self.pending_bytes = 0
+        self._drain_task = asyncio.create_task(self._drain())
+
+    def submit(self, tag, fn, *args, size=0):
+        """Start fn(*args) on the pool; its result is queued once earlier items are out"""
+        self.pending_bytes += size
+        self._pending.put_nowait((tag, self._executor.run(fn, *args), size))
+
+    def put_marker(self, tag, value):
+        """Queue a marker behind everything submitted so far"""
+        self._pending.put_nowait((tag, LaneMarker(value), 0))
+
+    async def close(self):
+        """Flush queued work, then end the results stream with None"""
+        self._pending.put_nowait((None, None, 0))
+        await self._drain_task
+
+    async def _drain(self):
+        is_stale = self._is_stale
+        while True:
+            tag, item, size = await self._pending.get()
+            self.pending_bytes -= size
+            if item is None:
+                await self.results.put(None)
+                return
+            work = isinstance(item, asyncio.Future)
+            if is_stale is not None and is_stale(tag):
+                if work:
+                    item.cancel()
+                    await self.results.put((tag, None))
+                self.dropped += 1
+                continue
+            if work:
+                try:
+                    item = await item
+                except asyncio.CancelledError:
+                    if item.cancelled():
+                        await self.results.put((tag, None))
+                        continue
+                    raise
+                except Exception as e:
+                    logger.error(f"Chunk processing failed: {e}")
+                    await self.results.put((tag, None))
+                    continue
+            if self._stage is not None:
+                try:
+                    self.state, item = await self._executor.run(self._stage, self.state, item)
+                except Exception as e:
+                    logger.error(f"Chunk stage failed: {e}")
+                    if work:
+                        await self.results.put((tag, None))
+                    continue
+            await self.results.put((tag, item))
+
+
+class ChunkExecutor:
+    """Runs chunk processing inline, on a thread pool or on a process pool"""
+
+    def __init__(self, mode="thread", max_workers=None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+        self.mode = mode
+        if mode == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chunk")
+        elif mode == "process":
+            self.pool = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context("forkserver"))
+            # Start the forkserver and a first worker now rather than on the loop at the first chunk
+            self.pool.submit(len, b"").result()
+        else:
+            self.pool = None
+
+        # Metrics
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+
+    def open_lane(self, is_stale=None, stage=None, state=None):
+        """Create an ordered lane for one session"""
+        return OrderedLane(self, is_stale, stage, state)
+
+    def run(self, fn, *args):
+        """Schedule fn(*args) and return an asyncio future for its result"""
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        if self.pool is None:
+            future = loop.create_future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            self.completed += 1
+            return future
+
+        future = loop.run_in_executor(self.pool, fn, *args)
+        self.queue_depth += 1
+        if self.queue_depth > self.max_queue_depth:
+            self.max_queue_depth = self.queue_depth
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        self.queue_depth -= 1
+        self.completed += 1
+
+    def stats(self):
+        """Return pool metrics as a plain dict"""
+        return {
+            "executor_mode": self.mode,
+            "executor_queue_depth": self.queue_depth,
+            "executor_max_queue_depth": self.max_queue_depth,
+            "executor_submitted": self.submitted,
+            "executor_completed": self.completed,
+        }
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up compared to a fixed sleep interval"""
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+        self.over_threshold = 0
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start sampling; does nothing if it is already running"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.samples += 1
+            self.last_ms = lag_ms
+            self.total_ms += lag_ms
+            if lag_ms > self.max_ms:
+                self.max_ms = lag_ms
+            if lag_ms > LOOP_LAG_WARN_MS:
+                self.over_threshold += 1
+                logger.warning(f"Event loop lag {lag_ms:.1f}ms")
+
+    def stats(self):
+        """Return loop lag metrics as a plain dict"""
+        return {
+            "loop_lag_ms_last": round(self.last_ms, 2),
+            "loop_lag_ms_avg": round(self.total_ms / self.samples, 2) if self.samples else 0.0,
+            "loop_lag_ms_max": round(self.max_ms, 2),
+            "loop_lag_over_threshold": self.over_threshold,
+        }
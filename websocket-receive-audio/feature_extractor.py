@@ -0,0 +1,202 @@
+"""
+Streaming spectral feature extraction for lip-sync.
+
+StreamingFeatureExtractor consumes PCM16 chunks of any size and emits one
+feature row per 10ms hop over a 25ms analysis window: RMS level, a pitch
+estimate, MFCCs and a coarse viseme class. The tail of each chunk that does
+not yet fill a window is kept, so features are identical however the audio
+was chunked. Every chunk is analysed in one batch: the frames are strided
+views over the sample buffer and a single rfft covers them all.
+"""
+
+import functools
+import logging
+
+import numpy as np
+
+# Configuration
+WINDOW_MS = 25
+HOP_MS = 10
+N_MELS = 26
+N_MFCC = 13
+PITCH_MIN_HZ = 70
+PITCH_MAX_HZ = 400
+VOICING_THRESHOLD = 0.35
+OCTAVE_TOLERANCE = 0.9
+SILENCE_DBFS = -50.0
+CLOSED_DBFS = -38.0
+
+# Viseme classes, from the mouth shape they drive
+VISEMES = ("sil", "M", "A", "E", "O", "S")
+SIL, CLOSED, OPEN, SPREAD, ROUND, FRICATIVE = range(len(VISEMES))
+
+logger = logging.getLogger(__name__)
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels=N_MELS):
+    """Triangular mel filters as an (n_fft // 2 + 1, n_mels) matrix"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    edges = mel_to_hz(np.linspace(hz_to_mel(0), hz_to_mel(sample_rate / 2), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    lower, centre, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins[None, :] - lower) / (centre - lower)
+    falling = (upper - bins[None, :]) / (upper - centre)
+    return np.maximum(0.0, np.minimum(rising, falling)).T.astype(np.float32)
+
+
+def dct_matrix(n_in, n_out):
+    """Orthonormal DCT-II as an (n_in, n_out) matrix"""
+    n = np.arange(n_in)[:, None]
+    k = np.arange(n_out)[None, :]
+    matrix = np.cos(np.pi / n_in * (n + 0.5) * k) * np.sqrt(2.0 / n_in)
+    matrix[:, 0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+@functools.lru_cache(maxsize=8)
+def analysis_tables(sample_rate, window, n_fft):
+    """Taper, filterbanks, band masks and pitch lag range for one configuration (shared, read-only)"""
+    taper = np.hanning(window).astype(np.float32)
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    mid_band = (freqs >= 1000) & (freqs < 3000)
+    min_lag = max(1, sample_rate // PITCH_MAX_HZ)
+    max_lag = min(window - 1, sample_rate // PITCH_MIN_HZ)
+    # The taper's own autocorrelation, used to undo its decay over lag
+    taper_spectrum = np.abs(np.fft.rfft(taper, n=n_fft)) ** 2
+    taper_autocorrelation = np.fft.irfft(taper_spectrum, n=n_fft)
+    tables = {
+        "_taper": taper,
+        "_mel": mel_filterbank(sample_rate, n_fft),
+        "_dct": dct_matrix(N_MELS, N_MFCC),
+        "_low_band": freqs < 1000,
+        "_mid_band": mid_band,
+        "_high_band": freqs >= 3000,
+        "_mid_freqs": freqs[mid_band].astype(np.float32),
+        "_lag_correction": (taper_autocorrelation[0] /
+                            taper_autocorrelation[min_lag:max_lag + 1]).astype(np.float32),
+    }
+    for table in tables.values():
+        table.flags.writeable = False
+    return tables
+
+
+class StreamingFeatureExtractor:
+    """Incremental per-hop RMS, pitch, MFCC and viseme extraction for one stream"""
+
+    def __init__(self, sample_rate=16000, window_ms=WINDOW_MS, hop_ms=HOP_MS):
+        self.sample_rate = sample_rate
+        self.window = sample_rate * window_ms // 1000
+        self.hop = sample_rate * hop_ms // 1000
+        # Twice the window so the autocorrelation taken from the power spectrum is not circular
+        self.n_fft = 1 << int(np.ceil(np.log2(2 * self.window)))
+
+        self._min_lag = max(1, sample_rate // PITCH_MAX_HZ)
+        self._max_lag = min(self.window - 1, sample_rate // PITCH_MIN_HZ)
+        self.__dict__.update(analysis_tables(sample_rate, self.window, self.n_fft))
+
+        # Samples not yet covered by a full window
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.hops_processed = 0
+
+    def __getstate__(self):
+        # Pickled with each executor job in process mode: send the pending samples, not the tables
+        state = self.__dict__.copy()
+        for name in analysis_tables(self.sample_rate, self.window, self.n_fft):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.update(analysis_tables(self.sample_rate, self.window, self.n_fft))
+
+    def process(self, pcm16_bytes):
+        """Analyse a PCM16 mono chunk; returns a dict of per-hop feature arrays (possibly empty)"""
+        samples = np.frombuffer(pcm16_bytes, dtype="<i2", count=len(pcm16_bytes) // 2).astype(np.float32)
+        buffer = np.concatenate((self._pending, samples)) if len(self._pending) else samples
+        count = 0 if len(buffer) < self.window else (len(buffer) - self.window) // self.hop + 1
+        first_hop = self.hops_processed
+        if count == 0:
+            self._pending = buffer
+            return self._empty(first_hop)
+
+        frames = np.lib.stride_tricks.sliding_window_view(buffer, self.window)[::self.hop][:count]
+        self._pending = buffer[count * self.hop:].copy()
+        self.hops_processed += count
+
+        rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / self.window)
+        spectrum = np.fft.rfft(frames * self._taper, n=self.n_fft)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+
+        mfcc = np.log(power @ self._mel + 1e-6) @ self._dct
+        pitch, voicing = self._pitch(power)
+        return {
+            "first_hop": first_hop,
+            "rms": rms,
+            "pitch_hz": pitch,
+            "voicing": voicing,
+            "mfcc": mfcc,
+            "viseme": self._visemes(rms, power, voicing),
+        }
+
+    def _pitch(self, power):
+        """Autocorrelation pitch estimate per frame, from the power spectrum; 0 Hz where unvoiced"""
+        autocorrelation = np.fft.irfft(power, n=self.n_fft)
+        energy = autocorrelation[:, 0]
+        lags = autocorrelation[:, self._min_lag:self._max_lag + 1] * self._lag_correction
+        # Take the peak at the shortest lag that comes close to the strongest one, so
+        # subharmonics don't win. Peaks are at least min_lag apart, so searching
+        # min_lag lags past the first crossing finds that peak and no other.
+        rows = np.arange(len(lags))
+        first = (lags >= OCTAVE_TOLERANCE * lags.max(axis=1, keepdims=True)).argmax(axis=1)
+        span = np.minimum(first[:, None] + np.arange(self._min_lag)[None, :], lags.shape[1] - 1)
+        best = span[rows, lags[rows[:, None], span].argmax(axis=1)]
+        peak = lags[rows, best]
+
+        # Parabolic interpolation around the peak for sub-sample lag
+        left = lags[rows, np.maximum(best - 1, 0)]
+        right = lags[rows, np.minimum(best + 1, lags.shape[1] - 1)]
+        curvature = left - 2 * peak + right
+        offset = np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, -1.0), 0.0)
+
+        voicing = np.where(energy > 0, np.minimum(peak / np.maximum(energy, 1e-9), 1.0), 0.0)
+        pitch = np.where(voicing >= VOICING_THRESHOLD, self.sample_rate / (best + offset + self._min_lag), 0.0)
+        return pitch.astype(np.float32), voicing.astype(np.float32)
+
+    def _visemes(self, rms, power, voicing):
+        """Coarse mouth-shape class from level, band balance and the mid-band centroid"""
+        dbfs = 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+        total = power.sum(axis=1) + 1e-9
+        high_ratio = power[:, self._high_band].sum(axis=1) / total
+        mid = power[:, self._mid_band]
+        centroid = (mid @ self._mid_freqs) / (mid.sum(axis=1) + 1e-9)
+        low_ratio = power[:, self._low_band].sum(axis=1) / total
+
+        viseme = np.full(len(rms), OPEN, dtype=np.int8)
+        viseme[(centroid > 1900) & (low_ratio < 0.8)] = SPREAD
+        viseme[(low_ratio > 0.9) & (voicing >= VOICING_THRESHOLD)] = ROUND
+        viseme[(high_ratio > 0.5) & (voicing < VOICING_THRESHOLD)] = FRICATIVE
+        viseme[dbfs < CLOSED_DBFS] = CLOSED
+        viseme[dbfs < SILENCE_DBFS] = SIL
+        return viseme
+
+    def _empty(self, first_hop):
+        return {
+            "first_hop": first_hop,
+            "rms": np.zeros(0, dtype=np.float32),
+            "pitch_hz": np.zeros(0, dtype=np.float32),
+            "voicing": np.zeros(0, dtype=np.float32),
+            "mfcc": np.zeros((0, N_MFCC), dtype=np.float32),
+            "viseme": np.zeros(0, dtype=np.int8),
+        }
+
+    def stats(self):
+        """Return extractor metrics as a plain dict"""
+        return {
+            "feature_hops": self.hops_processed,
+            "feature_pending_samples": len(self._pending),
+        }
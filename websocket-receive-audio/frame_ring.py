@@ -0,0 +1,208 @@
+"""
+Shared-memory ring buffer transport for raw video frames.
+
+A 640x360 I420 frame is ~345KB. Sent through the publisher pipe it is
+copied into the kernel, out again by the child, and then into the child's
+message buffers, 30 times a second per session. FrameRing keeps a fixed set
+of frame slots in one multiprocessing.shared_memory block instead: the
+producer renders (or copies) a frame into a free slot and sends only a small
+control record (slot, sequence number, length, timestamp) to the consumer,
+which reads the frame in place.
+
+Layout of the shared block:
+
+    header   magic, slot count, slot size, write count, read count
+    slot meta, per slot: sequence number, length, timestamp
+    slot data, per slot: slot_size bytes
+
+The producer only writes the write count and slot metadata; the consumer only
+writes the read count, so no lock is needed. Frame n goes to slot
+n % slots. A slot's sequence number is odd while it is being written and
+2 * (n + 1) once frame n is complete, so a reader can tell a finished frame
+from a torn or reused one. The producer does not reuse a slot until the
+consumer has released it (read count), which bounds the ring's latency to
+its slot count.
+"""
+
+import logging
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# Configuration
+FRAME_RING_SLOTS = 8
+RING_MAGIC = 0x46524E47
+
+logger = logging.getLogger(__name__)
+
+# magic, slots, slot_size, pad, write_count, read_count
+_HEADER = struct.Struct("<IIQQQQ")
+_WRITE_COUNT_OFFSET = 24
+_READ_COUNT_OFFSET = 32
+_COUNT = struct.Struct("<Q")
+# sequence, length, timestamp
+_SLOT_META = struct.Struct("<QQq")
+
+# Control record sent for each published frame: slot, length, timestamp, sequence
+CONTROL_RECORD = struct.Struct("<IIqQ")
+
+
+def _data_offset(slots):
+    offset = _HEADER.size + slots * _SLOT_META.size
+    # Keep frame data cache-line aligned
+    return (offset + 63) & ~63
+
+
+def _attach(name):
+    """Attach to an existing block without letting this process's resource tracker unlink it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+class FrameRing:
+    """Producer side: owns the shared block and hands out frame slots"""
+
+    def __init__(self, slot_size, slots=FRAME_RING_SLOTS, name=None):
+        self.slot_size = slot_size
+        self.slots = slots
+        self._data_offset = _data_offset(slots)
+        self.memory = shared_memory.SharedMemory(name=name, create=True,
+                                                 size=self._data_offset + slots * slot_size)
+        self._owns_memory = True
+        self.name = self.memory.name
+        self._buffer = self.memory.buf
+        _HEADER.pack_into(self._buffer, 0, RING_MAGIC, slots, slot_size, 0, 0, 0)
+        self.write_count = 0
+        self._writing = None
+
+        # Metrics
+        self.frames_published = 0
+        self.full_waits = 0
+
+    @classmethod
+    def attach(cls, name):
+        """Producer side of a ring created by another process, which owns (and unlinks) the block
+
+        For a child of the owner, such as a multiprocessing worker: it shares
+        the owner's resource tracker, so the block stays registered once and
+        the owner's unlink clears it.
+        """
+        ring = cls.__new__(cls)
+        ring.memory = shared_memory.SharedMemory(name=name)
+        ring._owns_memory = False
+        ring.name = name
+        ring._buffer = ring.memory.buf
+        magic, ring.slots, ring.slot_size, _, ring.write_count, _ = _HEADER.unpack_from(ring._buffer, 0)
+        if magic != RING_MAGIC:
+            raise ValueError(f"Shared memory block '{name}' is not a frame ring")
+        ring._data_offset = _data_offset(ring.slots)
+        ring._writing = None
+        ring.frames_published = 0
+        ring.full_waits = 0
+        return ring
+
+    def free_slots(self):
+        read_count = _COUNT.unpack_from(self._buffer, _READ_COUNT_OFFSET)[0]
+        return self.slots - (self.write_count - read_count)
+
+    def acquire(self):
+        """Return a writable memoryview of the next slot, or None if the consumer has not freed one"""
+        if self.free_slots() <= 0:
+            self.full_waits += 1
+            return None
+        slot = self.write_count % self.slots
+        _SLOT_META.pack_into(self._buffer, _HEADER.size + slot * _SLOT_META.size, 2 * self.write_count + 1, 0, 0)
+        self._writing = slot
+        start = self._data_offset + slot * self.slot_size
+        return self._buffer[start:start + self.slot_size]
+
+    def publish(self, length, timestamp_ns):
+        """Complete the acquired slot; returns the control record to send to the consumer"""
+        slot = self._writing
+        self._writing = None
+        sequence = 2 * (self.write_count + 1)
+        _SLOT_META.pack_into(self._buffer, _HEADER.size + slot * _SLOT_META.size, sequence, length, timestamp_ns)
+        self.write_count += 1
+        _COUNT.pack_into(self._buffer, _WRITE_COUNT_OFFSET, self.write_count)
+        self.frames_published += 1
+        return CONTROL_RECORD.pack(slot, length, timestamp_ns, sequence)
+
+    def write(self, data, timestamp_ns, timeout=None):
+        """Copy one frame into the ring; returns the control record, or None if no slot freed up in time"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        view = self.acquire()
+        while view is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(0.0005)
+            view = self.acquire()
+        length = len(data)
+        view[:length] = data
+        view.release()
+        return self.publish(length, timestamp_ns)
+
+    def stats(self):
+        """Return ring metrics as a plain dict"""
+        return {
+            "ring_slots": self.slots,
+            "ring_free_slots": self.free_slots(),
+            "ring_frames_published": self.frames_published,
+            "ring_full_waits": self.full_waits,
+        }
+
+    def close(self):
+        """Release the shared block, and unlink it if this ring created it"""
+        self._buffer = None
+        self.memory.close()
+        if not self._owns_memory:
+            return
+        try:
+            self.memory.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameRingReader:
+    """Consumer side: reads frames in place and releases their slots"""
+
+    def __init__(self, name, memory=None):
+        # memory: the FrameRing's own block, when the consumer lives in the producer's process
+        self._owns_memory = memory is None
+        self.memory = _attach(name) if memory is None else memory
+        self._buffer = self.memory.buf
+        magic, self.slots, self.slot_size, _, _, _ = _HEADER.unpack_from(self._buffer, 0)
+        if magic != RING_MAGIC:
+            raise ValueError(f"Shared memory block '{name}' is not a frame ring")
+        self._data_offset = _data_offset(self.slots)
+        self.read_count = 0
+
+        # Metrics
+        self.frames_read = 0
+        self.torn_frames = 0
+
+    def read(self, record):
+        """Return (memoryview, timestamp_ns) for a control record, or None if the slot no longer holds it
+
+        The view stays valid until release() is called for this frame.
+        """
+        slot, length, timestamp_ns, sequence = CONTROL_RECORD.unpack(record)
+        if _SLOT_META.unpack_from(self._buffer, _HEADER.size + slot * _SLOT_META.size)[0] != sequence:
+            self.torn_frames += 1
+            return None
+        start = self._data_offset + slot * self.slot_size
+        self.frames_read += 1
+        return self._buffer[start:start + length], timestamp_ns
+
+    def release(self):
+        """Hand the oldest unreleased slot back to the producer"""
+        self.read_count += 1
+        _COUNT.pack_into(self._buffer, _READ_COUNT_OFFSET, self.read_count)
+
+    def close(self):
+        self._buffer = None
+        if self._owns_memory:
+            self.memory.close()
@@ -0,0 +1,172 @@
+"""
+Heartbeats, round-trip times and dead-connection reaping for the receiver.
+
+The receiver otherwise notices a dead client only when reading from its
+socket fails. A half-open TCP connection (the client vanished without a FIN
+or RST) never fails a read, so its session would hold its audio buffers,
+playout task and renderer pool session until the kernel gives up on it,
+which can take hours.
+
+HeartbeatMonitor watches every connection from its own task. Every
+HEARTBEAT_INTERVAL seconds it sends a WebSocket ping and times the pong; the
+round-trip time is kept on the connection (rtt_ms, a smoothed rtt_ms_avg and
+rtt_ms_max). A connection is reaped as
+
+  dead  when no pong arrives within HEARTBEAT_TIMEOUT of the ping
+  idle  when no message has arrived for IDLE_TIMEOUT seconds, even though
+        it still answers pings (off by default: an agent's connection can be
+        quiet between turns for as long as the conversation pauses)
+
+A missing pong is not fatal while the connection is clearly alive or cannot
+answer: if a message arrived after the ping, or the receiver has stopped
+reading from it (backpressure), the pong is counted as late instead.
+
+Reaping aborts the connection's transport, so the receiver's reader fails
+and its usual cleanup releases everything the session holds. The bytes the
+sessions held at that moment are counted as reclaimed.
+"""
+
+import asyncio
+import logging
+import time
+
+import websockets
+
+# Configuration
+HEARTBEAT_INTERVAL = 10.0
+HEARTBEAT_TIMEOUT = 10.0
+# None: never reap a connection that still answers pings
+IDLE_TIMEOUT = None
+# Weight of the newest sample in rtt_ms_avg
+RTT_SMOOTHING = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatMonitor:
+    """Pings connections, records their round-trip times and reaps dead or idle ones"""
+
+    def __init__(self, reap, blocked=None, interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT):
+        # reap(connection, reason) closes a connection and returns (sessions, bytes) it released
+        self.reap = reap
+        # blocked(connection) is True while the receiver is not reading from it
+        self.blocked = blocked
+        # None disables pings or idle reaping
+        self.interval = interval
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._tasks = {}
+
+        # Metrics
+        self.pings = 0
+        self.late_pongs = 0
+        self.rtt_ms_max = 0.0
+        self._rtt_ms_total = 0.0
+        self._rtt_samples = 0
+        self.reaped_dead = 0
+        self.reaped_idle = 0
+        self.reaped_sessions = 0
+        self.reclaimed_bytes = 0
+
+    def add(self, connection):
+        """Start watching a connection; the receiver updates its last_message_at as messages arrive"""
+        connection.last_message_at = time.monotonic()
+        connection.rtt_ms = None
+        connection.rtt_ms_avg = None
+        connection.rtt_ms_max = None
+        self._tasks[connection] = asyncio.create_task(self._watch(connection))
+
+    def remove(self, connection):
+        task = self._tasks.pop(connection, None)
+        if task is not None:
+            task.cancel()
+
+    async def _watch(self, connection):
+        websocket = connection.websocket
+        can_ping = self.interval is not None and hasattr(websocket, "ping")
+        period = min(value for value in (self.interval, self.idle_timeout) if value is not None)
+        while True:
+            await asyncio.sleep(period)
+            try:
+                if self.idle_timeout is not None and \
+                        time.monotonic() - connection.last_message_at > self.idle_timeout:
+                    self._reap(connection, "idle", f"no message for {self.idle_timeout:.0f}s")
+                    return
+                if can_ping and not await self._heartbeat(connection):
+                    self._reap(connection, "dead", f"no pong within {self.timeout:.0f}s")
+                    return
+            except websockets.exceptions.ConnectionClosed:
+                return
+            except Exception as e:
+                logger.error(f"Heartbeat for {connection.client_id} failed: {e}")
+
+    async def _heartbeat(self, connection):
+        """Ping a connection and record the round trip; False if it looks dead"""
+        sent_at = time.monotonic()
+        try:
+            rtt = await asyncio.wait_for(self._ping(connection.websocket), self.timeout)
+        except asyncio.TimeoutError:
+            if connection.last_message_at > sent_at or (self.blocked is not None and self.blocked(connection)):
+                self.late_pongs += 1
+                logger.info(f"Late pong from {connection.client_id}; it is still sending or we are not reading")
+                return True
+            return False
+        self._record_rtt(connection, rtt * 1000)
+        return True
+
+    async def _ping(self, websocket):
+        """Seconds from sending a ping to its pong"""
+        start = time.perf_counter()
+        pong = await websocket.ping()
+        self.pings += 1
+        await pong
+        return time.perf_counter() - start
+
+    def _record_rtt(self, connection, rtt_ms):
+        connection.rtt_ms = rtt_ms
+        if connection.rtt_ms_avg is None:
+            connection.rtt_ms_avg = connection.rtt_ms_max = rtt_ms
+        else:
+            connection.rtt_ms_avg += RTT_SMOOTHING * (rtt_ms - connection.rtt_ms_avg)
+            connection.rtt_ms_max = max(connection.rtt_ms_max, rtt_ms)
+        self._rtt_ms_total += rtt_ms
+        self._rtt_samples += 1
+        if rtt_ms > self.rtt_ms_max:
+            self.rtt_ms_max = rtt_ms
+
+    def _reap(self, connection, kind, reason):
+        self._tasks.pop(connection, None)
+        sessions, reclaimed = self.reap(connection, f"{kind}: {reason}")
+        if kind == "dead":
+            self.reaped_dead += 1
+        else:
+            self.reaped_idle += 1
+        self.reaped_sessions += sessions
+        self.reclaimed_bytes += reclaimed
+
+    def connections(self):
+        """Round-trip times and idle seconds per watched connection"""
+        now = time.monotonic()
+        return {
+            connection.client_id: {
+                "rtt_ms": round(connection.rtt_ms, 2) if connection.rtt_ms is not None else None,
+                "rtt_ms_avg": round(connection.rtt_ms_avg, 2) if connection.rtt_ms_avg is not None else None,
+                "rtt_ms_max": round(connection.rtt_ms_max, 2) if connection.rtt_ms_max is not None else None,
+                "idle_seconds": round(now - connection.last_message_at, 1),
+            }
+            for connection in self._tasks
+        }
+
+    def stats(self):
+        """Return heartbeat and reaping metrics as a plain dict"""
+        return {
+            "heartbeat_pings": self.pings,
+            "heartbeat_late_pongs": self.late_pongs,
+            "heartbeat_rtt_ms_avg": round(self._rtt_ms_total / self._rtt_samples, 2) if self._rtt_samples else 0.0,
+            "heartbeat_rtt_ms_max": round(self.rtt_ms_max, 2),
+            "reaped_dead_connections": self.reaped_dead,
+            "reaped_idle_connections": self.reaped_idle,
+            "reaped_sessions": self.reaped_sessions,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
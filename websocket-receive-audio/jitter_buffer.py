@@ -0,0 +1,239 @@
+"""
+Adaptive jitter buffer for the WebSocket receiver.
+
+Voice chunks arrive in bursts of arbitrary size (0.5s each from the test
+sender). The Go publisher (ParentController.StreamAudio) wants exactly one
+10ms PCM16 frame per tick, so this module reframes incoming audio into fixed
+frames and releases them on a steady clock, padding with silence on underrun.
+The playout depth follows the observed arrival jitter (RFC 3550 style
+estimator) so the buffer only adds as much latency as the link needs.
+"""
+
+import asyncio
+import logging
+import time
+
+# Configuration
+FRAME_DURATION_MS = 10
+MIN_DEPTH_MS = 20
+MAX_DEPTH_MS = 500
+CAPACITY_MS = 30000
+JITTER_MULTIPLIER = 4.0
+
+logger = logging.getLogger(__name__)
+
+
+class JitterBuffer:
+    """Reframes PCM16 audio into fixed-size frames with an adaptive playout depth"""
+
+    def __init__(self, sample_rate=24000, channels=1, frame_ms=FRAME_DURATION_MS,
+                 min_depth_ms=MIN_DEPTH_MS, max_depth_ms=MAX_DEPTH_MS, capacity_ms=CAPACITY_MS):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_ms = frame_ms
+        self.frame_bytes = (sample_rate * frame_ms // 1000) * channels * 2
+        self.silence = bytes(self.frame_bytes)
+        self.min_depth_ms = min_depth_ms
+        self.max_depth_ms = max_depth_ms
+        self.capacity_ms = capacity_ms
+        self.target_depth_ms = min_depth_ms
+
+        self._buffer = bytearray()
+        self._playing = False
+        self._active = False
+        # Cumulative byte offsets: everything below read_offset has left the buffer
+        self.write_offset = 0
+        self.read_offset = 0
+
+        # Arrival jitter estimate (RFC 3550, section 6.4.1)
+        self._media_start = None
+        self._media_seconds = 0.0
+        self._min_transit = None
+        self.jitter_ms = 0.0
+
+        # Metrics
+        self.frames_in = 0
+        self.frames_out = 0
+        self.underruns = 0
+        self.overruns = 0
+        self.dropped_frames = 0
+        self.silence_frames = 0
+        self._latency_total_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.interrupts = 0
+        self._interrupted_at = None
+        self._interrupt_latency_total_ms = 0.0
+        self._interrupt_latency_samples = 0
+        self.max_interrupt_latency_ms = 0.0
+
+    @property
+    def depth_ms(self):
+        """Audio currently buffered, in milliseconds"""
+        return len(self._buffer) * 1000 / (self.sample_rate * self.channels * 2)
+
+    @property
+    def buffered_bytes(self):
+        return len(self._buffer)
+
+    def push(self, audio_bytes, arrival_time=None):
+        """Append a chunk of PCM16 audio and update the jitter estimate"""
+        if not audio_bytes:
+            return
+        if arrival_time is None:
+            arrival_time = time.monotonic()
+
+        # Transit time is arrival time minus media time. Only lateness against the
+        # fastest transit seen counts as jitter: a sender running ahead of real
+        # time is absorbed by the buffer and must not inflate the target depth.
+        if self._media_start is None:
+            self._media_start = arrival_time
+        transit = arrival_time - self._media_start - self._media_seconds
+        if self._min_transit is None or transit < self._min_transit:
+            self._min_transit = transit
+        lateness_ms = (transit - self._min_transit) * 1000
+        self.jitter_ms += (lateness_ms - self.jitter_ms) / 16
+        self._media_seconds += len(audio_bytes) / (self.sample_rate * self.channels * 2)
+
+        self.target_depth_ms = min(
+            self.max_depth_ms,
+            max(self.min_depth_ms, self.frame_ms + JITTER_MULTIPLIER * self.jitter_ms),
+        )
+
+        self._buffer += audio_bytes
+        self.write_offset += len(audio_bytes)
+        self.frames_in += len(audio_bytes) / self.frame_bytes
+        self._active = True
+
+        # Overrun: trim the oldest audio back down to capacity
+        if self.depth_ms > self.capacity_ms:
+            excess_frames = int((self.depth_ms - self.capacity_ms) // self.frame_ms) + 1
+            if excess_frames > 0:
+                del self._buffer[:excess_frames * self.frame_bytes]
+                self.read_offset += excess_frames * self.frame_bytes
+                self.overruns += 1
+                self.dropped_frames += excess_frames
+
+        if not self._playing and self.depth_ms >= self.target_depth_ms:
+            self._playing = True
+
+    def mark_end(self):
+        """Signal the end of the current utterance so the tail is played out, not held back"""
+        remainder = len(self._buffer) % self.frame_bytes
+        if remainder:
+            self._buffer += bytes(self.frame_bytes - remainder)
+            self.write_offset += self.frame_bytes - remainder
+        self._playing = bool(self._buffer)
+        self._active = False
+        self._media_start = None
+        self._media_seconds = 0.0
+        self._min_transit = None
+
+    def flush(self, interrupted_at=None):
+        """Drop all buffered audio (e.g. on voice_interrupt)
+
+        If interrupted_at (time.monotonic()) is given, the delay until the next
+        emitted frame is recorded as the interrupt latency.
+        """
+        dropped = len(self._buffer) // self.frame_bytes
+        self._buffer.clear()
+        self.read_offset = self.write_offset
+        if interrupted_at is not None:
+            self.interrupts += 1
+            self._interrupted_at = interrupted_at
+        self._playing = False
+        self._active = False
+        self._media_start = None
+        self._media_seconds = 0.0
+        self._min_transit = None
+        return dropped
+
+    def pop_frame(self):
+        """Return the next 10ms frame, or silence if nothing is ready"""
+        if self._interrupted_at is not None:
+            latency_ms = (time.monotonic() - self._interrupted_at) * 1000
+            self._interrupted_at = None
+            self._interrupt_latency_samples += 1
+            self._interrupt_latency_total_ms += latency_ms
+            if latency_ms > self.max_interrupt_latency_ms:
+                self.max_interrupt_latency_ms = latency_ms
+
+        if self._playing and len(self._buffer) >= self.frame_bytes:
+            latency_ms = self.depth_ms
+            self._latency_total_ms += latency_ms
+            if latency_ms > self.max_latency_ms:
+                self.max_latency_ms = latency_ms
+            frame = bytes(self._buffer[:self.frame_bytes])
+            del self._buffer[:self.frame_bytes]
+            self.read_offset += self.frame_bytes
+            self.frames_out += 1
+            return frame
+
+        if self._active:
+            # Mid-utterance starvation: pad with silence and rebuild depth
+            if self._playing:
+                self.underruns += 1
+                self._playing = False
+        elif self._buffer:
+            # Trailing partial frame after voice_end
+            frame = bytes(self._buffer).ljust(self.frame_bytes, b"\x00")
+            self.read_offset += len(self._buffer)
+            self._buffer.clear()
+            self._playing = False
+            self.frames_out += 1
+            return frame
+
+        self.silence_frames += 1
+        return self.silence
+
+    def stats(self):
+        """Return buffer metrics as a plain dict"""
+        return {
+            "frame_ms": self.frame_ms,
+            "depth_ms": round(self.depth_ms, 2),
+            "target_depth_ms": round(self.target_depth_ms, 2),
+            "jitter_ms": round(self.jitter_ms, 2),
+            "frames_in": int(self.frames_in),
+            "frames_out": self.frames_out,
+            "silence_frames": self.silence_frames,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "dropped_frames": self.dropped_frames,
+            "avg_added_latency_ms": round(self._latency_total_ms / self.frames_out, 2) if self.frames_out else 0.0,
+            "max_added_latency_ms": round(self.max_latency_ms, 2),
+            "interrupts": self.interrupts,
+            "avg_interrupt_latency_ms": round(self._interrupt_latency_total_ms / self._interrupt_latency_samples, 2)
+            if self._interrupt_latency_samples else 0.0,
+            "max_interrupt_latency_ms": round(self.max_interrupt_latency_ms, 2),
+        }
+
+
+async def run_playout(jitter_buffer, emit, stop_event):
+    """Release one frame per tick on a steady clock until stop_event is set
+
+    emit(frame_bytes, timestamp_ns) is called for every tick; timestamps count
+    from the start of playout so they line up with the publisher's media clock.
+    """
+    loop = asyncio.get_running_loop()
+    interval = jitter_buffer.frame_ms / 1000
+    start = loop.time()
+    tick = 0
+    late_ticks = 0
+
+    while not stop_event.is_set():
+        tick += 1
+        deadline = start + tick * interval
+        delay = deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -interval * 10:
+            # The loop stalled for more than 10 frames; resync instead of bursting
+            late_ticks += 1
+            start = loop.time() - tick * interval
+            logger.warning(f"Playout clock fell {-delay * 1000:.1f}ms behind, resyncing")
+
+        frame = jitter_buffer.pop_frame()
+        result = emit(frame, int((tick - 1) * interval * 1e9))
+        if asyncio.iscoroutine(result):
+            await result
+
+    return late_ticks
@@ -0,0 +1,245 @@
+"""
+Quality-tier load governor for the receiver's render pipeline.
+
+Every rendering session asks for a quality tier in init: low, medium or
+high, each a resolution and frame rate (avatar_renderer.QUALITY_PRESETS).
+That tier is the most it gets. Every CHECK_INTERVAL, LoadGovernor measures
+the node's pressure as the largest of three ratios:
+
+  render load  share of the interval spent rendering and handing frames to
+               the sink on the event loop (or, with a renderer pool, the
+               busiest worker's utilisation), over TARGET_RENDER_LOAD
+  loop lag     mean event-loop lag, which every session's audio and video
+               wait behind, over LOOP_LAG_SLO_MS
+  late frames  share of video frames the media clocks dropped for missing
+               the lip-sync window, over LATE_FRAME_SLO
+
+Above 1.0 it steps one session down a tier: lowest priority first (init's
+priority field, default 0), and at equal priority the session on the highest
+tier. It then waits STEP_COOLDOWN before the next step, so the change shows
+up in the measurements. Once pressure has stayed below UPSHIFT_PRESSURE for
+UPSHIFT_HOLD seconds, it steps the highest-priority degraded session back up,
+if the render load it predicts after the step (scaled by pixel rate) stays
+under UPSHIFT_PREDICTED_LOAD of the target. Sessions therefore degrade one at
+a time instead of all at once.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+from avatar_renderer import DEFAULT_QUALITY, QUALITY_PRESETS
+
+# Configuration
+CHECK_INTERVAL = 0.5
+TARGET_RENDER_LOAD = 0.7
+LOOP_LAG_SLO_MS = 50.0
+LATE_FRAME_SLO = 0.05
+STEP_COOLDOWN = 1.0
+UPSHIFT_PRESSURE = 0.6
+UPSHIFT_HOLD = 5.0
+UPSHIFT_PREDICTED_LOAD = 0.85
+DECISION_LOG = 50
+
+logger = logging.getLogger(__name__)
+
+
+def pixel_rate(quality):
+    """Pixels rendered per second at a quality; the governor's cost model"""
+    width, height, fps = QUALITY_PRESETS[quality]
+    return width * height * fps
+
+
+# Cheapest first
+TIERS = sorted(QUALITY_PRESETS, key=pixel_rate)
+
+
+class _GovernedSession:
+    def __init__(self, session, order, now):
+        self.session = session
+        self.order = order
+        self.requested = TIERS.index(session.quality if session.quality in QUALITY_PRESETS else DEFAULT_QUALITY)
+        self.tier = self.requested
+        self.since = now
+        self.frames = 0
+        self.dropped = 0
+
+
+class LoadGovernor:
+    """Steps rendering sessions between quality tiers to keep the node inside its latency SLO"""
+
+    def __init__(self, apply, loop_lag=None, renderer_pool=None, check_interval=CHECK_INTERVAL,
+                 target_render_load=TARGET_RENDER_LOAD):
+        # apply(session, quality) switches a session's renderer; False if it cannot right now
+        self.apply = apply
+        self.loop_lag = loop_lag
+        self.renderer_pool = renderer_pool
+        self.check_interval = check_interval
+        self.target_render_load = target_render_load
+        self._sessions = {}
+        self._opened = 0
+        self._task = None
+        # Seconds of rendering on the event loop since the last check
+        self.render_seconds = 0.0
+        self._last_check = time.monotonic()
+        self._lag_measured = (0, 0.0)
+        self._calm_since = None
+        self._next_step = 0.0
+        self.pressure = 0.0
+        self.render_load = 0.0
+        self._decisions = collections.deque(maxlen=DECISION_LOG)
+
+        # Metrics
+        self.steps_down = 0
+        self.steps_up = 0
+        # Session-seconds spent in each tier by sessions that have finished
+        self._tier_seconds = dict.fromkeys(TIERS, 0.0)
+
+    def add(self, session):
+        """Govern a session that has started rendering at its requested quality"""
+        self._opened += 1
+        self._sessions[session] = _GovernedSession(session, self._opened, time.monotonic())
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, session):
+        governed = self._sessions.pop(session, None)
+        if governed is not None:
+            self._tier_seconds[TIERS[governed.tier]] += time.monotonic() - governed.since
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Load governor check failed: {e}")
+
+    def _measure(self, now):
+        """Update render load and pressure from the interval since the last check; returns the dominant signal"""
+        interval = max(now - self._last_check, 1e-6)
+        self._last_check = now
+        render_load = self.render_seconds / interval
+        self.render_seconds = 0.0
+        if self.renderer_pool is not None:
+            render_load = max([render_load] + [worker.utilisation for worker in self.renderer_pool.workers])
+        self.render_load = render_load
+
+        lag_ms = 0.0
+        if self.loop_lag is not None:
+            samples, total_ms = self._lag_measured
+            if self.loop_lag.samples > samples:
+                lag_ms = (self.loop_lag.total_ms - total_ms) / (self.loop_lag.samples - samples)
+            self._lag_measured = (self.loop_lag.samples, self.loop_lag.total_ms)
+
+        frames = dropped = 0
+        for session, governed in self._sessions.items():
+            clock = session.media_clock
+            if clock is None:
+                continue
+            frames += clock.video_frames - governed.frames
+            dropped += clock.video_dropped - governed.dropped
+            governed.frames, governed.dropped = clock.video_frames, clock.video_dropped
+        late = dropped / (frames + dropped) if frames + dropped else 0.0
+
+        signals = {
+            f"render load {render_load:.2f}": render_load / self.target_render_load,
+            f"loop lag {lag_ms:.0f}ms": lag_ms / LOOP_LAG_SLO_MS,
+            f"late frames {late:.1%}": late / LATE_FRAME_SLO,
+        }
+        reason = max(signals, key=signals.get)
+        self.pressure = signals[reason]
+        return reason
+
+    def check(self):
+        """Measure pressure and step at most one session down or up"""
+        now = time.monotonic()
+        reason = self._measure(now)
+        if self.pressure > 1.0:
+            self._calm_since = None
+            if now >= self._next_step and self._step(now, -1, reason):
+                self._next_step = now + STEP_COOLDOWN
+        elif self.pressure < UPSHIFT_PRESSURE:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= UPSHIFT_HOLD and now >= self._next_step:
+                if self._step(now, 1, f"headroom, {reason}"):
+                    self._next_step = now + STEP_COOLDOWN
+                    self._calm_since = now
+        else:
+            self._calm_since = None
+
+    def _step(self, now, direction, reason):
+        """Move the next session one tier in direction (-1 down, 1 up); True if one moved"""
+        if direction < 0:
+            candidates = sorted((governed for governed in self._sessions.values() if governed.tier > 0),
+                                key=lambda governed: (governed.session.priority, -governed.tier, -governed.order))
+        else:
+            candidates = sorted((governed for governed in self._sessions.values()
+                                 if governed.tier < governed.requested),
+                                key=lambda governed: (-governed.session.priority, governed.tier, governed.order))
+        for governed in candidates:
+            current, target = TIERS[governed.tier], TIERS[governed.tier + direction]
+            if direction > 0 and not self._fits(current, target):
+                return False
+            if not self.apply(governed.session, target):
+                continue
+            self._tier_seconds[current] += now - governed.since
+            governed.since = now
+            governed.tier += direction
+            if direction < 0:
+                self.steps_down += 1
+            else:
+                self.steps_up += 1
+            self._decisions.append({
+                "time": time.time(),
+                "client_id": governed.session.client_id,
+                "from": current,
+                "to": target,
+                "pressure": round(self.pressure, 2),
+                "reason": reason,
+            })
+            logger.info(f"{'Degrading' if direction < 0 else 'Restoring'} {governed.session.client_id} "
+                        f"from {current} to {target} ({reason})")
+            return True
+        return False
+
+    def _fits(self, current, target):
+        """Whether the render load predicted after moving one session from current to target fits"""
+        total = sum(pixel_rate(TIERS[governed.tier]) for governed in self._sessions.values())
+        predicted = self.render_load * (total + pixel_rate(target) - pixel_rate(current)) / total
+        return predicted <= self.target_render_load * UPSHIFT_PREDICTED_LOAD
+
+    def tier_seconds(self):
+        """Session-seconds spent in each tier, including the sessions still rendering"""
+        now = time.monotonic()
+        seconds = dict(self._tier_seconds)
+        for governed in self._sessions.values():
+            seconds[TIERS[governed.tier]] += now - governed.since
+        return seconds
+
+    def decisions(self):
+        """The most recent tier changes, oldest first"""
+        return list(self._decisions)
+
+    def stats(self):
+        """Return governor metrics as a plain dict"""
+        stats = {
+            "governor_pressure": round(self.pressure, 3),
+            "governor_render_load": round(self.render_load, 3),
+            "governor_steps_down": self.steps_down,
+            "governor_steps_up": self.steps_up,
+            "governor_sessions_degraded": sum(governed.tier < governed.requested
+                                              for governed in self._sessions.values()),
+        }
+        for tier in TIERS:
+            stats[f"governor_sessions_{tier}"] = sum(TIERS[governed.tier] == tier
+                                                     for governed in self._sessions.values())
+        for tier, seconds in self.tier_seconds().items():
+            stats[f"governor_{tier}_seconds"] = round(seconds, 1)
+        return stats
@@ -0,0 +1,224 @@
+"""
+Per-session A/V media clock with lip-sync skew instrumentation.
+
+parent.go stamps audio and video from separate tickers, and on the Python
+side nothing tied a video frame to the audio it was rendered from. A
+MediaClock gives both streams one timeline: audio is the master, and every
+frame's timestamp_unix_nano is the session's origin plus the frame's media
+time (audio position, or the audio position a video frame was rendered
+from).
+
+Each frame is also compared with the moment it is handed on. A stream's
+lateness is how far behind the playout position it is sent, and A/V skew is
+video lateness minus audio lateness (positive = lips behind the voice). A
+video frame can only be rendered once all of its audio has been played out,
+so the receiver holds audio back by about one video frame to line the two
+up (audio_delay_frames).
+
+Skew goes into a histogram; its average is the offset and its slope over
+time is the drift. Video frames more than MAX_SKEW_MS late are dropped, and
+gaps in the video timeline are filled by sending a frame more than once, so
+the stream stays at its nominal frame rate.
+"""
+
+import collections
+import logging
+import time
+
+# Configuration
+MAX_SKEW_MS = 40
+HISTOGRAM_BUCKET_MS = 10
+HISTOGRAM_RANGE_MS = 200
+DRIFT_WINDOW = 256
+MAX_DUPLICATES = 5
+RESYNC_LATENESS_MS = 100
+
+logger = logging.getLogger(__name__)
+
+
+class SkewHistogram:
+    """Fixed-bucket histogram of A/V skew in milliseconds"""
+
+    def __init__(self, bucket_ms=HISTOGRAM_BUCKET_MS, range_ms=HISTOGRAM_RANGE_MS):
+        self.bucket_ms = bucket_ms
+        self.range_ms = range_ms
+        # One underflow bucket, the regular buckets, one overflow bucket
+        self.counts = [0] * (2 * range_ms // bucket_ms + 2)
+        self.samples = 0
+        self.within_target = 0
+
+    def add(self, skew_ms, target_ms=MAX_SKEW_MS):
+        if skew_ms < -self.range_ms:
+            index = 0
+        elif skew_ms >= self.range_ms:
+            index = len(self.counts) - 1
+        else:
+            index = 1 + int((skew_ms + self.range_ms) // self.bucket_ms)
+        self.counts[index] += 1
+        self.samples += 1
+        if abs(skew_ms) <= target_ms:
+            self.within_target += 1
+
+    def buckets(self):
+        """Non-empty buckets as {"lo..hi": count}, in milliseconds"""
+        result = {}
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            if index == 0:
+                label = f"<{-self.range_ms}"
+            elif index == len(self.counts) - 1:
+                label = f">={self.range_ms}"
+            else:
+                low = -self.range_ms + (index - 1) * self.bucket_ms
+                label = f"{low}..{low + self.bucket_ms}"
+            result[label] = count
+        return result
+
+    def percentile_abs(self, fraction):
+        """Upper bound of |skew| for the given fraction of samples, from bucket edges"""
+        if not self.samples:
+            return 0.0
+        folded = collections.Counter()
+        for index, count in enumerate(self.counts):
+            if index == 0 or index == len(self.counts) - 1:
+                edge = float("inf")
+            else:
+                low = -self.range_ms + (index - 1) * self.bucket_ms
+                edge = max(abs(low), abs(low + self.bucket_ms))
+            folded[edge] += count
+        seen = 0
+        for edge in sorted(folded):
+            seen += folded[edge]
+            if seen >= fraction * self.samples:
+                return edge
+        return float("inf")
+
+
+class MediaClock:
+    """Shared audio/video timeline for one session, with skew measurement and drop/duplicate correction"""
+
+    def __init__(self, fps, max_skew_ms=MAX_SKEW_MS):
+        self.fps = fps
+        self.max_skew_ms = max_skew_ms
+        self.frame_ns = 1_000_000_000 // fps
+        self.origin_unix_ns = None
+        self.origin_monotonic_ns = None
+
+        self.audio_position_ns = 0
+        self.audio_lateness_ns = 0
+        self.next_video_slot = 0
+
+        self.histogram = SkewHistogram()
+        self._skew_samples = collections.deque(maxlen=DRIFT_WINDOW)
+        self.skew_ms_last = 0.0
+
+        # Metrics
+        self.audio_frames = 0
+        self.video_frames = 0
+        self.video_dropped = 0
+        self.video_duplicated = 0
+        self.resyncs = 0
+
+    def tick(self, media_ns):
+        """Note the playout position as it is reached; anchors the timeline on the first call"""
+        now = time.monotonic_ns()
+        if self.origin_monotonic_ns is None:
+            self.origin_unix_ns = time.time_ns() - media_ns
+            self.origin_monotonic_ns = now - media_ns
+            return
+        lateness = now - (self.origin_monotonic_ns + media_ns)
+        if lateness > RESYNC_LATENESS_MS * 1_000_000:
+            # Playout stalled and resynced; move the timeline rather than report a permanent offset
+            self.resyncs += 1
+            self.origin_monotonic_ns += lateness
+            self.origin_unix_ns += lateness
+            logger.warning(f"Media clock re-anchored after a {lateness / 1e6:.0f}ms stall")
+
+    def stamp_audio(self, media_ns):
+        """Timestamp an audio frame starting media_ns into the session, as it is sent"""
+        if self.origin_monotonic_ns is None:
+            self.tick(media_ns)
+        self.audio_lateness_ns = time.monotonic_ns() - (self.origin_monotonic_ns + media_ns)
+        self.audio_position_ns = media_ns
+        self.audio_frames += 1
+        return self.origin_unix_ns + media_ns
+
+    def video_timestamps(self, media_ns):
+        """Timestamps to send a video frame rendered from audio at media_ns with, as it is sent
+
+        Returns an empty list to drop the frame, one timestamp to send it, or
+        several to repeat it into video slots that were skipped.
+        """
+        if self.origin_monotonic_ns is None:
+            return []
+        now = time.monotonic_ns()
+        skew_ms = 0.0
+        if self.audio_frames:
+            # Nothing to compare with until the first audio frame has gone out
+            skew_ms = (now - (self.origin_monotonic_ns + media_ns) - self.audio_lateness_ns) / 1e6
+            self.skew_ms_last = skew_ms
+            self.histogram.add(skew_ms, self.max_skew_ms)
+            self._skew_samples.append((now, skew_ms))
+
+        slot = (media_ns + self.frame_ns // 2) // self.frame_ns
+        if skew_ms > self.max_skew_ms or slot < self.next_video_slot:
+            # Too late for lip-sync (or a slot already filled): skip it and catch up
+            self.video_dropped += 1
+            return []
+
+        first = max(self.next_video_slot, slot - MAX_DUPLICATES)
+        self.next_video_slot = slot + 1
+        self.video_frames += 1
+        self.video_duplicated += slot - first
+        return [self.origin_unix_ns + s * self.frame_ns for s in range(first, slot + 1)]
+
+    def set_fps(self, fps):
+        """Change the video frame rate mid-session; slots continue from the same point on the timeline"""
+        next_slot_ns = self.next_video_slot * self.frame_ns
+        self.fps = fps
+        self.frame_ns = 1_000_000_000 // fps
+        self.next_video_slot = -(-next_slot_ns // self.frame_ns)
+
+    def offset_ms(self):
+        """Mean A/V skew over the drift window"""
+        if not self._skew_samples:
+            return 0.0
+        return sum(skew for _, skew in self._skew_samples) / len(self._skew_samples)
+
+    def drift_ms_per_min(self):
+        """Least-squares slope of skew over the drift window"""
+        count = len(self._skew_samples)
+        if count < 2:
+            return 0.0
+        mean_t = sum(t for t, _ in self._skew_samples) / count
+        mean_s = sum(s for _, s in self._skew_samples) / count
+        covariance = sum((t - mean_t) * (s - mean_s) for t, s in self._skew_samples)
+        variance = sum((t - mean_t) ** 2 for t, _ in self._skew_samples)
+        if not variance:
+            return 0.0
+        return covariance / variance * 60e9
+
+    def stats(self):
+        """Return sync metrics as a plain dict"""
+        histogram = self.histogram
+        return {
+            "av_skew_ms_last": round(self.skew_ms_last, 2),
+            "av_offset_ms": round(self.offset_ms(), 2),
+            "av_drift_ms_per_min": round(self.drift_ms_per_min(), 2),
+            "av_skew_p50_abs_ms": histogram.percentile_abs(0.5),
+            "av_skew_p99_abs_ms": histogram.percentile_abs(0.99),
+            "av_within_target_pct": round(100 * histogram.within_target / histogram.samples, 2)
+            if histogram.samples else 100.0,
+            "av_skew_histogram": histogram.buckets(),
+            "audio_frames_stamped": self.audio_frames,
+            "video_frames_stamped": self.video_frames,
+            "video_frames_dropped": self.video_dropped,
+            "video_frames_duplicated": self.video_duplicated,
+            "clock_resyncs": self.resyncs,
+        }
+
+
+def audio_delay_frames(fps, audio_frame_ms):
+    """Audio frames to hold back so audio leaves with the video frame rendered from it"""
+    return round(1000 / fps / audio_frame_ms)
@@ -0,0 +1,298 @@
+"""
+Per-session memory accounting and caps for the WebSocket receiver.
+
+Every session holds audio in up to four places:
+
+  queued         messages read but not yet processed (the connection's StreamScheduler)
+  executor       chunks submitted to the executor lane and not yet applied
+  jitter_buffer  PCM waiting to be played out
+  retained       PCM kept for received_audio.wav until the session ends
+
+MemoryAccountant sums them per session every CHECK_INTERVAL seconds, and sums
+the sessions for the node. The caps apply to the first three stages, the
+audio in flight (CAPPED_STAGES). Retained audio grows with the length of a
+healthy session and backpressure cannot drain it, so it is reported but
+never pauses or closes a connection. A connection whose session (or any of
+its streams) holds more than max_session_bytes in flight, or any connection
+while the node does, is paused: its reader stops taking messages, which
+pushes back on the sender through the socket while those stages drain. A
+connection still over its cap after BACKPRESSURE_TIMEOUT seconds is closed
+with 1008 (policy violation). While the node stays over its cap past the
+timeout, the connection with the most audio in flight is closed on each check.
+
+MemoryProfiler is an optional tracemalloc mode. It attributes live
+allocations to pipeline stages by the innermost frame of their traceback
+that belongs to a known module (STAGE_MODULES), i.e. by where memory was
+allocated rather than where it is held: retained audio shows up under the
+stage that produced the bytes, such as resample. It slows allocation down
+noticeably, so it is off by default.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import tracemalloc
+
+# Configuration
+MAX_SESSION_BYTES = 256 * 1024 * 1024
+MAX_NODE_BYTES = 2 * 1024 * 1024 * 1024
+CHECK_INTERVAL = 0.1
+BACKPRESSURE_TIMEOUT = 10.0
+PROFILE_FRAMES = 16
+PROFILE_TOP_SITES = 10
+
+# Module file -> pipeline stage, for tracemalloc attribution
+STAGE_MODULES = {
+    "websocket_test_receiver.py": "receiver",
+    "stream_mux.py": "queue",
+    "executor_stage.py": "decode",
+    "resampler.py": "resample",
+    "jitter_buffer.py": "jitter_buffer",
+    "feature_extractor.py": "features",
+    "avatar_renderer.py": "render",
+    "avatar_cache.py": "render",
+    "renderer_pool.py": "render",
+    "media_clock.py": "av_sync",
+    "traffic_capture.py": "capture",
+    "tracing.py": "tracing",
+}
+# Package directory -> pipeline stage
+STAGE_PACKAGES = {
+    "websockets": "websocket",
+    "json": "parse",
+}
+
+# Allocations left out of the profile: module imports and tracemalloc itself
+PROFILE_IGNORED_FILES = (
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    tracemalloc.__file__,
+)
+IGNORED = "ignored"
+
+CLOSE_CODE = 1008
+# Stages counted against the caps
+CAPPED_STAGES = ("queued", "executor", "jitter_buffer")
+
+logger = logging.getLogger(__name__)
+
+
+def session_memory(session):
+    """Bytes a ClientSession holds, per stage"""
+    scheduler = session.scheduler
+    lane = session.lane
+    jitter_buffer = session.jitter_buffer
+    return {
+        "queued": scheduler.queued_bytes(session.stream_id) if scheduler is not None else 0,
+        "executor": lane.pending_bytes if lane is not None else 0,
+        "jitter_buffer": jitter_buffer.buffered_bytes if jitter_buffer is not None else 0,
+        "retained": session.utterances.retained_bytes(),
+    }
+
+
+class MemoryAccountant:
+    """Tracks per-session memory and pauses or closes connections over their caps"""
+
+    def __init__(self, max_session_bytes=MAX_SESSION_BYTES, max_node_bytes=MAX_NODE_BYTES,
+                 check_interval=CHECK_INTERVAL, backpressure_timeout=BACKPRESSURE_TIMEOUT):
+        # None disables a cap
+        self.max_session_bytes = max_session_bytes
+        self.max_node_bytes = max_node_bytes
+        self.check_interval = check_interval
+        self.backpressure_timeout = backpressure_timeout
+        # Connection session -> sessions_of, listing the sessions it holds (itself and its streams)
+        self._connections = {}
+        self._task = None
+        self.node_bytes = 0
+        self.node_capped_bytes = 0
+        self.node_stages = {}
+        self._node_over_since = None
+        self._closing = set()
+
+        # Metrics
+        self.peak_node_bytes = 0
+        self.backpressure_pauses = 0
+        self.disconnects = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def add(self, connection, sessions_of):
+        """Account for a connection; sessions_of(connection) lists the sessions it holds"""
+        connection.memory_ok = asyncio.Event()
+        connection.memory_ok.set()
+        connection.memory_paused_at = None
+        self._connections[connection] = sessions_of
+        if self._task is None:
+            self.start()
+
+    def remove(self, connection):
+        self._connections.pop(connection, None)
+        connection.memory_ok.set()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Memory accounting failed: {e}")
+
+    def check(self):
+        """Measure every session, then pause, resume or close connections against the caps"""
+        now = time.monotonic()
+        max_session = self.max_session_bytes
+        node_bytes = 0
+        node_stages = dict.fromkeys(("queued", "executor", "jitter_buffer", "retained"), 0)
+        # In-flight bytes per connection, the part the caps apply to
+        connection_bytes = {}
+        # Connections with a session over the cap
+        over = set()
+        for connection, sessions_of in self._connections.items():
+            total = 0
+            for session in sessions_of(connection):
+                usage = session.memory = session_memory(session)
+                session.memory_bytes = sum(usage.values())
+                node_bytes += session.memory_bytes
+                capped = sum(usage[stage] for stage in CAPPED_STAGES)
+                total += capped
+                for stage, size in usage.items():
+                    node_stages[stage] += size
+                if max_session is not None and capped > max_session:
+                    over.add(connection)
+            connection_bytes[connection] = total
+
+        node_capped = sum(connection_bytes.values())
+        self.node_bytes = node_bytes
+        self.node_capped_bytes = node_capped
+        self.node_stages = node_stages
+        if node_bytes > self.peak_node_bytes:
+            self.peak_node_bytes = node_bytes
+        node_over = self.max_node_bytes is not None and node_capped > self.max_node_bytes
+        if node_over:
+            if self._node_over_since is None:
+                self._node_over_since = now
+                logger.warning(f"Node audio in flight {node_capped} bytes is over the cap of "
+                               f"{self.max_node_bytes} bytes; pausing all connections")
+            elif now - self._node_over_since > self.backpressure_timeout:
+                largest = max(connection_bytes, key=connection_bytes.get)
+                self._disconnect(largest, f"node over its memory cap; largest connection has "
+                                          f"{connection_bytes[largest]} bytes in flight")
+        else:
+            self._node_over_since = None
+
+        for connection in list(self._connections):
+            if connection in over or node_over:
+                # Over the node cap alone, only the largest connection is closed
+                self._pause(connection, now, close_after_timeout=connection in over)
+            else:
+                self._resume(connection)
+
+    def _pause(self, connection, now, close_after_timeout):
+        """Stop the connection's reader until it is back under the caps"""
+        if connection.memory_paused_at is None:
+            connection.memory_paused_at = now
+            connection.memory_ok.clear()
+            self.backpressure_pauses += 1
+            logger.warning(f"Pausing {connection.client_id}: over its memory cap")
+        elif close_after_timeout and now - connection.memory_paused_at > self.backpressure_timeout:
+            self._disconnect(connection, f"still over its memory cap after {self.backpressure_timeout:.0f}s")
+
+    def _resume(self, connection):
+        if connection.memory_paused_at is not None:
+            connection.memory_paused_at = None
+            connection.memory_ok.set()
+            logger.info(f"Resuming {connection.client_id}: back under its memory cap")
+
+    def _disconnect(self, connection, reason):
+        if connection not in self._connections:
+            return
+        logger.error(f"Closing {connection.client_id} ({reason})")
+        self.disconnects += 1
+        self.remove(connection)
+        if connection.websocket is not None:
+            task = asyncio.create_task(connection.websocket.close(CLOSE_CODE, "memory cap exceeded"))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def sessions(self):
+        """Per-session bytes by stage, as of the last check"""
+        return {session.client_id: dict(session.memory, total=session.memory_bytes)
+                for connection, sessions_of in self._connections.items()
+                for session in sessions_of(connection) if session.memory is not None}
+
+    def stats(self):
+        """Return node memory metrics as a plain dict"""
+        stats = {
+            "memory_bytes": self.node_bytes,
+            "memory_capped_bytes": self.node_capped_bytes,
+            "memory_peak_bytes": self.peak_node_bytes,
+            "memory_backpressure_pauses": self.backpressure_pauses,
+            "memory_disconnects": self.disconnects,
+        }
+        for stage, size in self.node_stages.items():
+            stats[f"memory_{stage}_bytes"] = size
+        return stats
+
+
+def file_stage(filename):
+    """Pipeline stage of a source file, or None if it is not part of one"""
+    if filename in PROFILE_IGNORED_FILES:
+        return IGNORED
+    parts = filename.split(os.sep)
+    stage = STAGE_MODULES.get(parts[-1])
+    if stage is None and len(parts) > 1:
+        stage = STAGE_PACKAGES.get(parts[-2])
+    return stage
+
+
+def allocation_stage(traceback, file_stages):
+    """Pipeline stage of the innermost frame that belongs to a known module; file_stages caches file_stage()"""
+    for frame in reversed(traceback):
+        filename = frame.filename
+        if filename not in file_stages:
+            file_stages[filename] = file_stage(filename)
+        stage = file_stages[filename]
+        if stage is not None:
+            return stage
+    return "other"
+
+
+class MemoryProfiler:
+    """tracemalloc-based attribution of live allocations to pipeline stages"""
+
+    def __init__(self, frames=PROFILE_FRAMES):
+        self.frames = frames
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info(f"Memory profiling enabled ({self.frames} frames per allocation)")
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def stage_bytes(self, top_sites=PROFILE_TOP_SITES):
+        """Live bytes per stage, and the largest allocation sites with their stage
+
+        Takes around a second per 10k live allocation sites; run it off the event loop.
+        """
+        snapshot = tracemalloc.take_snapshot()
+        file_stages = {}
+        stages = {}
+        sites = []
+        for stat in snapshot.statistics("traceback"):
+            stage = allocation_stage(stat.traceback, file_stages)
+            if stage == IGNORED:
+                continue
+            stages[stage] = stages.get(stage, 0) + stat.size
+            if len(sites) < top_sites:
+                frame = stat.traceback[-1]
+                sites.append({"stage": stage, "bytes": stat.size, "blocks": stat.count,
+                              "site": f"{os.path.basename(frame.filename)}:{frame.lineno}"})
+        return {"stages": dict(sorted(stages.items(), key=lambda item: -item[1])), "top_sites": sites}
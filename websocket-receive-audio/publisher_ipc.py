@@ -0,0 +1,422 @@
+"""
+asyncio client for the go-publish-video child process.
+
+The Go child (go-publish-video/child.go) reads length-prefixed FlatBuffers
+messages from stdin and answers with STATUS_RESPONSE / LOG_RESPONSE messages
+on stdout, as defined in ipc/ipc_defs.fbs. Each frame on the pipe is a 4-byte
+big-endian length followed by an IPCMessage whose payload vector holds a
+complete nested MediaSamplePayload (or StatusResponsePayload /
+LogResponsePayload) buffer.
+
+The layouts of the messages the parent sends are fixed, so PublisherIPC
+encodes them by packing a 68-byte header in front of the sample data instead
+of building them byte by byte. The header and a memoryview of the sample data
+are queued as separate buffers and every sample queued in the same loop
+iteration goes to the pipe in one os.writev() call. Sample data given as bytes
+is never copied in Python; any other buffer is copied once when it is queued,
+since it may be reused (the renderer's pooled frames are) before the pipe has
+taken it. Responses from the child are parsed in a background task.
+
+Connection settings are passed on the child's command line (child_args), as
+parent.go does; the child does not act on INIT_COMMAND messages.
+"""
+
+import asyncio
+import collections
+import fcntl
+import logging
+import os
+import struct
+from itertools import islice
+
+import tracing
+
+# Configuration
+WRITE_HIGH_WATER = 4 * 1024 * 1024
+PIPE_SIZE = 1024 * 1024
+IOV_MAX = 1024
+CONNECT_TIMEOUT = 10.0
+CLOSE_TIMEOUT = 5.0
+
+# Enums from ipc/ipc_defs.fbs
+INIT_COMMAND, WRITE_VIDEO_SAMPLE_COMMAND, WRITE_AUDIO_SAMPLE_COMMAND, CLOSE_COMMAND, \
+    STATUS_RESPONSE, LOG_RESPONSE = range(6)
+MESSAGE_TYPES = ("INIT_COMMAND", "WRITE_VIDEO_SAMPLE_COMMAND", "WRITE_AUDIO_SAMPLE_COMMAND",
+                 "CLOSE_COMMAND", "STATUS_RESPONSE", "LOG_RESPONSE")
+PAYLOAD_NONE, PAYLOAD_INIT, PAYLOAD_MEDIA_SAMPLE, PAYLOAD_STATUS, PAYLOAD_LOG = range(5)
+CONNECTION_STATUSES = ("UNINITIALIZED", "INITIALIZED_SUCCESS", "INITIALIZED_FAILURE", "CONNECTED",
+                       "DISCONNECTED", "RECONNECTING", "RECONNECTED", "CONNECTION_LOST", "FAILED",
+                       "TOKEN_WILL_EXPIRE")
+LOG_LEVELS = ("DEBUG", "INFO", "WARN", "ERROR")
+_PYTHON_LOG_LEVELS = (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR)
+
+logger = logging.getLogger(__name__)
+
+_LENGTH_PREFIX = struct.Struct(">I")
+
+# IPCMessage table, root at 16, vtable at 4, payload vector at 28:
+#   root, vtable (size, table size, message_type, payload_type, payload, pad),
+#   soffset to vtable, payload uoffset, message_type, payload_type, pad, payload length
+_IPC_MESSAGE = struct.Struct("<IHHHHHHiIBBHI")
+# MediaSamplePayload table, root at 12, vtable at 4, data vector at 28:
+#   root, vtable (size, table size, data, timestamp_unix_nano),
+#   soffset to vtable, timestamp, data uoffset, data length
+_MEDIA_SAMPLE = struct.Struct("<IHHHHiqII")
+_MEDIA_HEADER_SIZE = _LENGTH_PREFIX.size + _IPC_MESSAGE.size + _MEDIA_SAMPLE.size
+
+
+def _pack_ipc_message(buffer, offset, message_type, payload_type, payload_length):
+    _IPC_MESSAGE.pack_into(buffer, offset, 16, 10, 12, 8, 9, 4, 0, 12, 8, message_type, payload_type, 0,
+                           payload_length)
+
+
+def encode_media_header(message_type, data_length, timestamp_ns):
+    """Length prefix plus the IPCMessage and MediaSamplePayload tables that precede the sample bytes"""
+    header = bytearray(_MEDIA_HEADER_SIZE)
+    sample_length = _MEDIA_SAMPLE.size + data_length
+    _LENGTH_PREFIX.pack_into(header, 0, _IPC_MESSAGE.size + sample_length)
+    _pack_ipc_message(header, 4, message_type, PAYLOAD_MEDIA_SAMPLE, sample_length)
+    _MEDIA_SAMPLE.pack_into(header, 4 + _IPC_MESSAGE.size, 12, 8, 16, 12, 4, 8, timestamp_ns, 4, data_length)
+    return header
+
+
+def encode_message(message_type, payload_type=PAYLOAD_NONE, payload=b""):
+    """Frame an IPCMessage around an already encoded payload buffer"""
+    message = bytearray(_LENGTH_PREFIX.size + _IPC_MESSAGE.size)
+    _LENGTH_PREFIX.pack_into(message, 0, _IPC_MESSAGE.size + len(payload))
+    _pack_ipc_message(message, 4, message_type, payload_type, len(payload))
+    return bytes(message) + bytes(payload)
+
+
+def _encode_string(text):
+    """FlatBuffers string: length, UTF-8 bytes, NUL terminator, padded to 4 bytes"""
+    data = text.encode("utf-8")
+    padding = (4 - (len(data) + 1) % 4) % 4
+    return struct.pack("<I", len(data)) + data + b"\0" * (1 + padding)
+
+
+def encode_status_payload(status, error_message="", additional_info=""):
+    """StatusResponsePayload buffer (the child's side of the protocol)"""
+    error_string = _encode_string(error_message)
+    # root, vtable (size, table size, status, error_message, additional_info, pad),
+    # soffset, error_message and additional_info uoffsets, status, pad
+    table = struct.pack("<IHHHHHHiIIBxxx", 16, 10, 16, 12, 4, 8, 0, 12, 32 - 20, 32 + len(error_string) - 24,
+                        status)
+    return table + error_string + _encode_string(additional_info)
+
+
+def encode_log_payload(level, message):
+    """LogResponsePayload buffer (the child's side of the protocol)"""
+    # root, vtable (size, table size, level, message), soffset, message uoffset, level, pad
+    return struct.pack("<IHHHHiIBxxx", 12, 8, 12, 8, 4, 8, 24 - 16, level) + _encode_string(message)
+
+
+def _field_position(buffer, table, index):
+    """Absolute position of a table field, or None if it is absent"""
+    vtable = table - struct.unpack_from("<i", buffer, table)[0]
+    vtable_size = struct.unpack_from("<H", buffer, vtable)[0]
+    entry = 4 + 2 * index
+    if entry >= vtable_size:
+        return None
+    offset = struct.unpack_from("<H", buffer, vtable + entry)[0]
+    return table + offset if offset else None
+
+
+def _root_table(buffer):
+    return struct.unpack_from("<I", buffer, 0)[0]
+
+
+def _read_byte(buffer, table, index, default=0):
+    position = _field_position(buffer, table, index)
+    return buffer[position] if position is not None else default
+
+
+def _read_vector(buffer, table, index):
+    """Memoryview of a [byte] vector or string field"""
+    position = _field_position(buffer, table, index)
+    if position is None:
+        return memoryview(b"")
+    start = position + struct.unpack_from("<I", buffer, position)[0]
+    length = struct.unpack_from("<I", buffer, start)[0]
+    return memoryview(buffer)[start + 4:start + 4 + length]
+
+
+def decode_message(buffer):
+    """Split an IPCMessage into (message_type, payload_type, payload memoryview)"""
+    table = _root_table(buffer)
+    return _read_byte(buffer, table, 0), _read_byte(buffer, table, 1), _read_vector(buffer, table, 2)
+
+
+def decode_media_sample(payload):
+    """Return (data memoryview, timestamp_unix_nano) from a MediaSamplePayload buffer"""
+    table = _root_table(payload)
+    position = _field_position(payload, table, 1)
+    timestamp = struct.unpack_from("<q", payload, position)[0] if position is not None else 0
+    return _read_vector(payload, table, 0), timestamp
+
+
+def decode_status_payload(payload):
+    """Return (status, error_message, additional_info) from a StatusResponsePayload buffer"""
+    table = _root_table(payload)
+    return (_read_byte(payload, table, 0),
+            bytes(_read_vector(payload, table, 1)).decode("utf-8", "replace"),
+            bytes(_read_vector(payload, table, 2)).decode("utf-8", "replace"))
+
+
+def decode_log_payload(payload):
+    """Return (level, message) from a LogResponsePayload buffer"""
+    table = _root_table(payload)
+    return _read_byte(payload, table, 0), bytes(_read_vector(payload, table, 1)).decode("utf-8", "replace")
+
+
+def child_args(app_id, channel_name, user_id, token="", width=352, height=288, frame_rate=15,
+               video_codec="H264", sample_rate=16000, audio_channels=1, bitrate=1000, min_bitrate=100,
+               enable_string_uid=False):
+    """Command-line flags for the Go child, matching ParentController.Start"""
+    return [
+        "-appID", app_id,
+        "-channelName", channel_name,
+        "-userID", user_id,
+        "-token", token,
+        "-width", str(width),
+        "-height", str(height),
+        "-frameRate", str(frame_rate),
+        "-videoCodec", video_codec,
+        "-sampleRate", str(sample_rate),
+        "-audioChannels", str(audio_channels),
+        "-bitrate", str(bitrate),
+        "-minBitrate", str(min_bitrate),
+        "-enableStringUID", "true" if enable_string_uid else "false",
+    ]
+
+
+class PublisherIPC:
+    """Drives one publisher child process over its stdin/stdout pipes"""
+
+    def __init__(self, command, on_status=None, write_high_water=WRITE_HIGH_WATER, session_id=None):
+        self.command = command
+        # Only used to tag trace events
+        self.session_id = session_id
+        # Called as on_status(status_name, error_message, additional_info) for every STATUS_RESPONSE
+        self.on_status = on_status
+        self.write_high_water = write_high_water
+        self.process = None
+        self.status = None
+        self.connected = asyncio.Event()
+        self.closed = asyncio.Event()
+
+        self._fd = None
+        self._loop = None
+        self._pending = collections.deque()
+        self._pending_bytes = 0
+        self._flush_scheduled = False
+        self._waiting_writable = False
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = []
+        self._start_us = None
+
+        # Metrics
+        self.audio_frames = 0
+        self.video_frames = 0
+        self.bytes_written = 0
+        self.writev_calls = 0
+        self.blocked_writes = 0
+        self.max_pending_bytes = 0
+        self.responses = 0
+
+    async def start(self, wait_connected=True, timeout=CONNECT_TIMEOUT):
+        """Start the child and, by default, wait for it to report CONNECTED"""
+        self._loop = asyncio.get_running_loop()
+        self._start_us = tracing.now_us()
+        read_fd, self._fd = os.pipe()
+        if hasattr(fcntl, "F_SETPIPE_SZ"):
+            try:
+                fcntl.fcntl(self._fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+            except OSError:
+                pass
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.command, stdin=read_fd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+        finally:
+            os.close(read_fd)
+        os.set_blocking(self._fd, False)
+        logger.info(f"Publisher child started with PID {self.process.pid}")
+
+        self._tasks = [asyncio.create_task(self._read_responses()), asyncio.create_task(self._read_stderr())]
+        if wait_connected:
+            await asyncio.wait_for(self.connected.wait(), timeout)
+
+    def send_audio(self, data, timestamp_ns=0):
+        """Queue a PCM16 audio frame; the caller may reuse its buffer as soon as this returns"""
+        self.audio_frames += 1
+        if self.audio_frames == 1:
+            tracing.instant("publish.first_audio", self.session_id, category="publish")
+        self._queue_sample(WRITE_AUDIO_SAMPLE_COMMAND, data, timestamp_ns)
+
+    def send_video(self, data, timestamp_ns=0):
+        """Queue an I420 video frame; the caller may reuse its buffer as soon as this returns"""
+        self.video_frames += 1
+        if self.video_frames == 1:
+            tracing.instant("publish.first_video", self.session_id, category="publish")
+        self._queue_sample(WRITE_VIDEO_SAMPLE_COMMAND, data, timestamp_ns)
+
+    def _queue_sample(self, message_type, data, timestamp_ns):
+        # Bytes cannot change while queued; a mutable buffer could before it is written
+        view = memoryview(data).cast("B") if isinstance(data, bytes) else memoryview(memoryview(data).tobytes())
+        self._queue(memoryview(encode_media_header(message_type, len(view), timestamp_ns)))
+        self._queue(view)
+
+    def _queue(self, view):
+        if self._fd is None:
+            raise ConnectionError("Publisher pipe is closed")
+        self._pending.append(view)
+        self._pending_bytes += len(view)
+        if self._pending_bytes > self.max_pending_bytes:
+            self.max_pending_bytes = self._pending_bytes
+        self._drained.clear()
+        # Everything queued during this loop iteration goes out in one writev
+        if not self._flush_scheduled and not self._waiting_writable:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        """Write as much of the queue as the pipe takes, without blocking"""
+        self._flush_scheduled = False
+        pending = self._pending
+        while pending:
+            buffers = list(islice(pending, IOV_MAX))
+            try:
+                written = os.writev(self._fd, buffers)
+            except BlockingIOError:
+                written = 0
+            except (BrokenPipeError, OSError) as e:
+                logger.error(f"Publisher pipe write failed: {e}")
+                self._abort_writes()
+                return
+            self.writev_calls += 1
+            self.bytes_written += written
+            self._pending_bytes -= written
+            short = written < sum(len(buffer) for buffer in buffers)
+
+            while written:
+                head = pending[0]
+                if len(head) <= written:
+                    written -= len(head)
+                    pending.popleft()
+                else:
+                    pending[0] = head[written:]
+                    written = 0
+
+            if short:
+                # Pipe is full: resume when the child has read some of it
+                if not self._waiting_writable:
+                    self.blocked_writes += 1
+                    self._waiting_writable = True
+                    self._loop.add_writer(self._fd, self._on_writable)
+                return
+
+        if self._waiting_writable:
+            self._waiting_writable = False
+            self._loop.remove_writer(self._fd)
+        self._drained.set()
+
+    def _on_writable(self):
+        self._flush()
+
+    def _abort_writes(self):
+        if self._waiting_writable:
+            self._loop.remove_writer(self._fd)
+            self._waiting_writable = False
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._drained.set()
+        os.close(self._fd)
+        self._fd = None
+
+    async def drain(self):
+        """Wait until the queued bytes fall below the high-water mark"""
+        while self._pending_bytes > self.write_high_water and self._fd is not None:
+            await self._wait_flushed()
+
+    async def _wait_flushed(self):
+        if self._pending:
+            await self._drained.wait()
+
+    async def _read_responses(self):
+        """Parse STATUS_RESPONSE and LOG_RESPONSE messages from the child's stdout"""
+        reader = self.process.stdout
+        try:
+            while True:
+                length = _LENGTH_PREFIX.unpack(await reader.readexactly(4))[0]
+                if length == 0:
+                    continue
+                self._handle_response(await reader.readexactly(length))
+        except asyncio.IncompleteReadError:
+            logger.info("Publisher child stdout closed")
+        finally:
+            self.closed.set()
+
+    def _handle_response(self, message):
+        self.responses += 1
+        message_type, _, payload = decode_message(message)
+        if message_type == STATUS_RESPONSE and len(payload):
+            status, error_message, additional_info = decode_status_payload(payload)
+            name = CONNECTION_STATUSES[status] if status < len(CONNECTION_STATUSES) else str(status)
+            self.status = name
+            logger.info(f"Publisher status: {name}, Message: {error_message}, Info: {additional_info}")
+            if status in (CONNECTION_STATUSES.index("CONNECTED"), CONNECTION_STATUSES.index("RECONNECTED")):
+                if name == "CONNECTED" and not self.connected.is_set():
+                    tracing.complete("publisher.connect", self._start_us, session_id=self.session_id,
+                                     category="publish")
+                self.connected.set()
+            elif status in (CONNECTION_STATUSES.index("DISCONNECTED"), CONNECTION_STATUSES.index("CONNECTION_LOST")):
+                self.connected.clear()
+            if self.on_status is not None:
+                self.on_status(name, error_message, additional_info)
+        elif message_type == LOG_RESPONSE and len(payload):
+            level, text = decode_log_payload(payload)
+            python_level = _PYTHON_LOG_LEVELS[level] if level < len(_PYTHON_LOG_LEVELS) else logging.INFO
+            level_name = LOG_LEVELS[level] if level < len(LOG_LEVELS) else str(level)
+            logger.log(python_level, f"[child-{level_name}] {text}")
+        else:
+            name = MESSAGE_TYPES[message_type] if message_type < len(MESSAGE_TYPES) else str(message_type)
+            logger.warning(f"Received unexpected message type from publisher child: {name}")
+
+    async def _read_stderr(self):
+        async for line in self.process.stderr:
+            logger.debug(f"[child-stderr] {line.decode('utf-8', 'replace').rstrip()}")
+
+    async def close(self, timeout=CLOSE_TIMEOUT):
+        """Flush queued samples, send CLOSE_COMMAND and wait for the child to exit"""
+        if self.process is None:
+            return
+        if self._fd is not None:
+            self._queue(memoryview(encode_message(CLOSE_COMMAND)))
+            await self._wait_flushed()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Publisher child {self.process.pid} did not exit, killing it")
+            self.process.kill()
+            await self.process.wait()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info(f"Publisher child exited with code {self.process.returncode}")
+
+    def stats(self):
+        """Return pipe metrics as a plain dict"""
+        return {
+            "publisher_status": self.status,
+            "publisher_audio_frames": self.audio_frames,
+            "publisher_video_frames": self.video_frames,
+            "publisher_bytes_written": self.bytes_written,
+            "publisher_writev_calls": self.writev_calls,
+            "publisher_blocked_writes": self.blocked_writes,
+            "publisher_pending_bytes": self._pending_bytes,
+            "publisher_max_pending_bytes": self.max_pending_bytes,
+            "publisher_responses": self.responses,
+        }
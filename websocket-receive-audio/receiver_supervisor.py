@@ -0,0 +1,246 @@
+"""
+Multi-process mode for the WebSocket test receiver.
+
+A single asyncio loop spends JSON parsing, base64 decoding and downstream
+processing on one core. ReceiverSupervisor pre-forks N worker processes that
+each bind their own listening socket on the same port with SO_REUSEPORT, so
+the kernel spreads incoming connections across them. The supervisor restarts
+workers that exit unexpectedly and aggregates the stats they report.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import time
+
+import websockets
+
+from heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, IDLE_TIMEOUT
+from memory_accounting import MAX_SESSION_BYTES, MAX_NODE_BYTES
+from resampler import TARGET_SAMPLE_RATE
+from traffic_capture import TrafficCapture
+from websocket_test_receiver import WebSocketTestReceiver, WEBSOCKET_PORT, create_executor
+
+# Configuration
+LISTEN_BACKLOG = 1024
+STATS_REPORT_INTERVAL = 2.0
+STATS_LOG_INTERVAL = 10.0
+RESTART_BACKOFF_INITIAL = 0.5
+RESTART_BACKOFF_MAX = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+def create_reuseport_socket(host, port, backlog=LISTEN_BACKLOG):
+    """Create a listening TCP socket that other processes can bind to as well"""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("SO_REUSEPORT is not supported on this platform; run with --workers 1")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def worker_capture_path(capture_file, worker_index):
+    """Per-worker capture file: name.workerN-PID.ext, keeping a .gz suffix last"""
+    stem, ext = os.path.splitext(capture_file[:-3] if capture_file.endswith(".gz") else capture_file)
+    suffix = ".gz" if capture_file.endswith(".gz") else ""
+    return f"{stem}.worker{worker_index}-{os.getpid()}{ext}{suffix}"
+
+
+async def _serve_worker(worker_index, host, port, stats_queue, executor_mode, executor_workers,
+                        target_sample_rate, capture_file, max_session_bytes, max_node_bytes, memory_profile,
+                        heartbeat_interval, heartbeat_timeout, idle_timeout):
+    """Run one receiver on a SO_REUSEPORT socket and report stats periodically"""
+    capture = TrafficCapture(worker_capture_path(capture_file, worker_index)) if capture_file else None
+    receiver = WebSocketTestReceiver(
+        output_wav_file=f"received_audio_worker{worker_index}.wav",
+        executor=create_executor(executor_mode, executor_workers),
+        target_sample_rate=target_sample_rate,
+        capture=capture,
+        max_session_bytes=max_session_bytes,
+        max_node_bytes=max_node_bytes,
+        memory_profile=memory_profile,
+        heartbeat_interval=heartbeat_interval,
+        heartbeat_timeout=heartbeat_timeout,
+        idle_timeout=idle_timeout,
+    )
+    sock = create_reuseport_socket(host, port)
+
+    async with websockets.serve(receiver.handle_client, sock=sock, process_request=receiver.process_request,
+                                **receiver.serve_options()):
+        logger.info(f"Worker {worker_index} (PID {os.getpid()}) listening on {host}:{port}")
+        while True:
+            await asyncio.sleep(STATS_REPORT_INTERVAL)
+            if capture is not None:
+                # Workers are terminated, not shut down, so keep the capture on disk current
+                capture.flush()
+            try:
+                stats_queue.put_nowait((worker_index, os.getpid(), time.time(), receiver.stats()))
+            except queue.Full:
+                pass
+
+
+def _worker_main(worker_index, host, port, stats_queue, executor_mode, executor_workers, target_sample_rate,
+                 capture_file, max_session_bytes, max_node_bytes, memory_profile, heartbeat_interval,
+                 heartbeat_timeout, idle_timeout):
+    """Process entry point for a receiver worker"""
+    # The supervisor owns shutdown; workers exit when it terminates them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        asyncio.run(_serve_worker(worker_index, host, port, stats_queue, executor_mode, executor_workers,
+                                  target_sample_rate, capture_file, max_session_bytes, max_node_bytes,
+                                  memory_profile, heartbeat_interval, heartbeat_timeout, idle_timeout))
+    except Exception as e:
+        logger.error(f"Worker {worker_index} crashed: {e}")
+        raise
+
+
+class ReceiverSupervisor:
+    """Pre-forks receiver workers behind one port, restarts crashed ones and aggregates stats"""
+
+    def __init__(self, workers, host="0.0.0.0", port=WEBSOCKET_PORT, executor_mode="inline", executor_workers=None,
+                 target_sample_rate=TARGET_SAMPLE_RATE, capture_file=None,
+                 max_session_bytes=MAX_SESSION_BYTES, max_node_bytes=MAX_NODE_BYTES, memory_profile=False,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.executor_mode = executor_mode
+        self.executor_workers = executor_workers
+        self.target_sample_rate = target_sample_rate
+        self.capture_file = capture_file
+        self.max_session_bytes = max_session_bytes
+        # Each worker accounts for its own sessions, so it gets an equal share of the node cap
+        self.worker_max_node_bytes = max_node_bytes // workers if max_node_bytes is not None else None
+        self.memory_profile = memory_profile
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.idle_timeout = idle_timeout
+        self.context = multiprocessing.get_context("fork")
+        self.stats_queue = self.context.Queue(maxsize=workers * 16)
+        self.processes = {}
+        self.restart_counts = {}
+        self.restart_backoff = {}
+        self.restart_due = {}
+        self.started_at = {}
+        self.worker_stats = {}
+        self._stopping = False
+
+    def _spawn(self, worker_index):
+        """Start (or restart) the worker in the given slot"""
+        process = self.context.Process(
+            target=_worker_main,
+            args=(worker_index, self.host, self.port, self.stats_queue,
+                  self.executor_mode, self.executor_workers, self.target_sample_rate, self.capture_file,
+                  self.max_session_bytes, self.worker_max_node_bytes, self.memory_profile,
+                  self.heartbeat_interval, self.heartbeat_timeout, self.idle_timeout),
+            name=f"receiver-worker-{worker_index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[worker_index] = process
+        self.started_at[worker_index] = time.monotonic()
+        logger.info(f"Started worker {worker_index} with PID {process.pid}")
+
+    def _check_workers(self):
+        """Restart workers that have exited, backing off if they crash repeatedly"""
+        now = time.monotonic()
+        for worker_index, process in list(self.processes.items()):
+            if self._stopping:
+                return
+            if process is not None and process.is_alive():
+                continue
+
+            if process is not None:
+                process.join()
+                # Reset the backoff for workers that ran for a while; double it for crash loops
+                ran_long = now - self.started_at[worker_index] > RESTART_BACKOFF_MAX
+                backoff = RESTART_BACKOFF_INITIAL if ran_long else min(
+                    RESTART_BACKOFF_MAX, self.restart_backoff.get(worker_index, RESTART_BACKOFF_INITIAL) * 2
+                )
+                self.restart_backoff[worker_index] = backoff
+                self.restart_due[worker_index] = now + backoff
+                self.restart_counts[worker_index] = self.restart_counts.get(worker_index, 0) + 1
+                self.processes[worker_index] = None
+                logger.warning(f"Worker {worker_index} (PID {process.pid}) exited with code {process.exitcode}, "
+                               f"restarting in {backoff:.1f}s")
+                continue
+
+            if now >= self.restart_due.get(worker_index, 0):
+                self._spawn(worker_index)
+
+    def _drain_stats(self, timeout):
+        """Collect stats reported by workers, waiting up to timeout for the first one"""
+        try:
+            worker_index, pid, reported_at, stats = self.stats_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            self.worker_stats[worker_index] = dict(stats, pid=pid, reported_at=reported_at)
+            try:
+                worker_index, pid, reported_at, stats = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def aggregate_stats(self):
+        """Return totals across workers plus the latest per-worker breakdown"""
+        totals = {}
+        for stats in self.worker_stats.values():
+            for key, value in stats.items():
+                if key in ("pid", "reported_at") or not isinstance(value, (int, float)):
+                    continue
+                totals[key] = totals.get(key, 0) + value
+        return {
+            "workers": self.workers,
+            "workers_alive": sum(1 for p in self.processes.values() if p is not None and p.is_alive()),
+            "restarts": dict(self.restart_counts),
+            "totals": totals,
+            "per_worker": dict(self.worker_stats),
+        }
+
+    def stop(self, *_):
+        """Terminate all workers"""
+        self._stopping = True
+
+    def run(self):
+        """Start the workers and supervise them until interrupted"""
+        # Fail fast if the port cannot be shared, before forking anything
+        create_reuseport_socket(self.host, self.port).close()
+
+        logger.info("=" * 60)
+        logger.info(f"WEBSOCKET TEST RECEIVER - {self.workers} workers on port {self.port} (SO_REUSEPORT)")
+        logger.info("=" * 60)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        for worker_index in range(self.workers):
+            self._spawn(worker_index)
+
+        last_log = time.monotonic()
+        try:
+            while not self._stopping:
+                self._drain_stats(timeout=0.5)
+                self._check_workers()
+                if time.monotonic() - last_log >= STATS_LOG_INTERVAL:
+                    last_log = time.monotonic()
+                    summary = self.aggregate_stats()
+                    logger.info(f"Workers alive: {summary['workers_alive']}/{self.workers}, "
+                                f"totals: {summary['totals']}, restarts: {summary['restarts']}")
+        finally:
+            for process in self.processes.values():
+                if process is not None and process.is_alive():
+                    process.terminate()
+            for process in self.processes.values():
+                if process is not None:
+                    process.join(timeout=5)
+            logger.info("All receiver workers stopped")
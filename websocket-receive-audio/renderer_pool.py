@@ -0,0 +1,509 @@
+"""
+Pre-forked renderer worker pool with session affinity.
+
+Rendering on the receiver's event loop costs every connection on the node
+whenever one session renders, and forking a renderer process per session
+puts seconds of interpreter start-up, imports and sprite building in front
+of its first frame. RendererPool starts a fixed set of worker processes when
+it is created. Each worker warms up before it takes any session: it renders
+one frame at every quality preset, which builds the sprites. Frames come
+back through a FrameRing (frame_ring.py) per worker, created by the parent
+and attached by name in the worker.
+
+Workers are forked from a forkserver that has already imported this module
+and NumPy, not from the receiver itself: the receiver runs executor and
+avatar-loading threads, and a process forked from it could inherit a lock
+one of them held. Replacing a dead worker from the event loop is safe for
+the same reason.
+
+Every worker is a one-process ProcessPoolExecutor, so a session's jobs run
+in the order they were submitted. A session opens on the worker that already
+holds its avatar (avatar_id and quality) unless that worker is overloaded or
+has AFFINITY_SLACK_SESSIONS more sessions than the least loaded one; it then
+opens on the least loaded worker. With an AvatarCache, each worker maps the
+cache's files itself, so an affinity hit skips mapping (or building) the
+avatar again.
+
+Utilisation is the share of each REBALANCE_INTERVAL that a worker spent
+rendering, smoothed. When a worker is over OVERLOAD_UTILISATION, one of its
+sessions moves to the coolest worker (preferring a session whose avatar that
+worker already holds). The renderer's state moves with it, so pts and the
+mouth animation continue, and audio fed during the move is held back and
+sent on afterwards. A worker that dies is replaced, and its sessions start
+again on the new process at the point their audio had reached, losing the
+frames it had in hand.
+
+Frames come back as frame ring control records and are passed to the
+session's on_frame(frame, pts_ns) callback on the event loop. The frame is a
+memoryview into the ring, valid only for the call.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from avatar_cache import AvatarCache
+from avatar_renderer import AvatarRenderer, DEFAULT_QUALITY, QUALITY_PRESETS, i420_size
+from frame_ring import FrameRing, FrameRingReader
+
+# Configuration
+RENDER_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+RING_SLOTS = 24
+RING_FULL_WAIT = 0.02
+OVERLOAD_UTILISATION = 0.85
+REBALANCE_INTERVAL = 1.0
+REBALANCE_MARGIN = 0.25
+AFFINITY_SLACK_SESSIONS = 4
+UTILISATION_SMOOTHING = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+# Worker process side
+
+_worker = None
+
+
+class _WorkerState:
+    """Renderers, frame ring and avatar cache of one worker process"""
+
+    def __init__(self, ring_name, cache_config):
+        start = time.perf_counter()
+        self.ring = FrameRing.attach(ring_name)
+        self.cache = AvatarCache(*cache_config) if cache_config is not None else None
+        self.renderers = {}
+        self.avatars = set()
+        for quality in QUALITY_PRESETS:
+            AvatarRenderer.for_quality(quality).render(0)
+        self.warm_ms = (time.perf_counter() - start) * 1000
+
+
+def _init_worker(ring_name, cache_config):
+    global _worker
+    _worker = _WorkerState(ring_name, cache_config)
+
+
+def _worker_info():
+    return os.getpid(), _worker.warm_ms
+
+
+def _open_session(key, quality, sample_rate, avatar_id, state=None, position=0):
+    """Create a session's renderer, continuing from state if it moved here or else from position
+    (samples); returns (affinity hit, ms)"""
+    start = time.perf_counter()
+    hit = (avatar_id, quality) in _worker.avatars
+    sprites = None
+    if _worker.cache is not None and avatar_id is not None:
+        sprites = _worker.cache.get(avatar_id, quality)
+    renderer = _worker.renderers[key] = AvatarRenderer.for_quality(quality, sample_rate, sprites)
+    if state is not None:
+        renderer.restore(state)
+    elif position:
+        renderer.seek(position)
+    _worker.avatars.add((avatar_id, quality))
+    return hit, (time.perf_counter() - start) * 1000
+
+
+def _set_quality(key, quality, avatar_id):
+    """Switch a session's renderer to another quality, carrying on from its audio position"""
+    renderer = _worker.renderers.get(key)
+    if renderer is None:
+        return
+    sprites = None
+    if _worker.cache is not None and avatar_id is not None:
+        sprites = _worker.cache.get(avatar_id, quality)
+    _worker.renderers[key] = renderer.with_quality(quality, sprites)
+    _worker.avatars.add((avatar_id, quality))
+
+
+def _acquire_slot(ring):
+    """A free ring slot, waiting up to RING_FULL_WAIT for the parent to release one"""
+    view = ring.acquire()
+    deadline = time.monotonic() + RING_FULL_WAIT
+    while view is None and time.monotonic() < deadline:
+        time.sleep(0.0005)
+        view = ring.acquire()
+    return view
+
+
+def _render(key, pcm):
+    """Feed audio to a session and render its due frames into the ring; returns (records, dropped, busy seconds)"""
+    start = time.perf_counter()
+    renderer = _worker.renderers.get(key)
+    if renderer is None:
+        return [], 0, 0.0
+    renderer.feed(pcm)
+    ring = _worker.ring
+    records = []
+    dropped = 0
+    while True:
+        view = _acquire_slot(ring)
+        rendered = renderer.render_next(out=view)
+        if view is not None:
+            view.release()
+        if rendered is None:
+            break
+        if view is None:
+            dropped += 1
+            continue
+        records.append(ring.publish(renderer.frame_size, rendered[1]))
+    return records, dropped, time.perf_counter() - start
+
+
+def _close_session(key):
+    """Drop a session's renderer; returns its state() to continue elsewhere, or None"""
+    renderer = _worker.renderers.pop(key, None)
+    return renderer.state() if renderer is not None else None
+
+
+# Parent side
+
+def _worker_context():
+    """Multiprocessing context for workers; the forkserver preloads the renderer before it forks any"""
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class RenderWorker:
+    """Parent-side handle on one worker process"""
+
+    def __init__(self, index, ring_slots, cache_config):
+        self.index = index
+        self.ring_slots = ring_slots
+        self.cache_config = cache_config
+        self.sessions = set()
+        # (avatar_id, quality) pairs the process has loaded
+        self.avatars = set()
+        self.utilisation = 0.0
+        self.busy_seconds = 0.0
+        self._busy_measured = 0.0
+        self.inflight = 0
+        self.frames = 0
+        self.frames_dropped = 0
+        self.restarts = 0
+        self.start()
+
+    def start(self):
+        """Start the process with a new ring; it warms up straight away"""
+        self.ring = FrameRing(max(i420_size(width, height) for width, height, _ in QUALITY_PRESETS.values()),
+                              self.ring_slots)
+        # The worker attaches to the ring by name and writes it; the parent owns and unlinks it
+        self.reader = FrameRingReader(self.ring.name, self.ring.memory)
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=_worker_context(),
+                                            initializer=_init_worker, initargs=(self.ring.name, self.cache_config))
+        self.info = self.executor.submit(_worker_info)
+        self.avatars = set()
+
+    def update_utilisation(self, interval):
+        busy = (self.busy_seconds - self._busy_measured) / interval
+        self._busy_measured = self.busy_seconds
+        self.utilisation += (min(busy, 1.0) - self.utilisation) * UTILISATION_SMOOTHING
+
+    def load(self):
+        return self.utilisation, len(self.sessions)
+
+    def stop(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.close_ring()
+
+    def close_ring(self):
+        self.reader.close()
+        self.ring.close()
+
+    def stats(self):
+        """Return worker metrics as a plain dict"""
+        pid = warm_ms = None
+        if self.info.done() and self.info.exception() is None:
+            pid, warm_ms = self.info.result()
+        return {
+            "worker": self.index,
+            "pid": pid,
+            "warm_ms": round(warm_ms, 1) if warm_ms is not None else None,
+            "utilisation": round(self.utilisation, 3),
+            "sessions": len(self.sessions),
+            "avatars": len(self.avatars),
+            "inflight": self.inflight,
+            "frames": self.frames,
+            "frames_dropped": self.frames_dropped,
+            "restarts": self.restarts,
+        }
+
+
+class RemoteRenderer:
+    """A session's renderer on a pool worker; feed() audio, frames arrive through on_frame"""
+
+    def __init__(self, pool, key, quality, sample_rate, avatar_id):
+        self.pool = pool
+        self.key = key
+        self.quality = quality
+        self.sample_rate = sample_rate
+        self.avatar_id = avatar_id
+        _, _, self.fps = QUALITY_PRESETS[quality]
+        # Called as on_frame(frame, pts_ns) on the event loop for every rendered frame
+        self.on_frame = None
+        self.worker = None
+        # Audio is sent on as soon as it completes a frame (frame n ends at sample (n + 1) * rate // fps)
+        self._pending = bytearray()
+        self._fed = 0
+        self._frames_fed = 0
+        self._frame_end = sample_rate // self.fps
+        # Samples submitted to workers so far
+        self.position = 0
+        # Batches fed while the session moves between workers
+        self.held = None
+        self.closed = False
+
+    def feed(self, pcm16_bytes):
+        """Add mono PCM16 audio at sample_rate"""
+        self._pending += pcm16_bytes
+        self._fed += len(pcm16_bytes) // 2
+        if self._fed < self._frame_end:
+            return
+        while self._frame_end <= self._fed:
+            self._frames_fed += 1
+            self._frame_end = (self._frames_fed + 1) * self.sample_rate // self.fps
+        pcm = bytes(self._pending)
+        self._pending.clear()
+        self.pool.submit_audio(self, pcm)
+
+    def set_quality(self, quality):
+        """Render at another quality from here on; returns False while the session is moving between workers"""
+        if self.held is not None:
+            return False
+        self.quality = quality
+        _, _, self.fps = QUALITY_PRESETS[quality]
+        self._frames_fed = self._fed * self.fps // self.sample_rate
+        self._frame_end = (self._frames_fed + 1) * self.sample_rate // self.fps
+        self.pool.set_quality(self)
+        return True
+
+    def close(self):
+        self.pool.close_session(self)
+
+
+class RendererPool:
+    """Pre-started, pre-warmed renderer processes shared by the sessions of one receiver"""
+
+    def __init__(self, workers=RENDER_WORKERS, avatar_cache=None, ring_slots=RING_SLOTS,
+                 overload_utilisation=OVERLOAD_UTILISATION, rebalance_interval=REBALANCE_INTERVAL, affinity=True):
+        # Workers open their own AvatarCache on the same directory (processes share its files)
+        cache_config = None
+        if avatar_cache is not None:
+            cache_config = (avatar_cache.directory, avatar_cache.budget_bytes, avatar_cache.loader)
+        self.workers = [RenderWorker(index, ring_slots, cache_config) for index in range(workers)]
+        self.overload_utilisation = overload_utilisation
+        self.rebalance_interval = rebalance_interval
+        self.affinity = affinity
+        self._next_key = 0
+        self._task = None
+
+        # Metrics
+        self.sessions_opened = 0
+        self.affinity_hits = 0
+        self.open_ms_total = 0.0
+        self.opens_measured = 0
+        self.migrations = 0
+        self.worker_restarts = 0
+
+    def wait_ready(self):
+        """Block until every worker has warmed up; returns their warm-up times in ms"""
+        return [worker.info.result()[1] for worker in self.workers]
+
+    def _choose_worker(self, avatar):
+        least = min(self.workers, key=RenderWorker.load)
+        if not self.affinity:
+            return least
+        holders = [worker for worker in self.workers if avatar in worker.avatars
+                   and worker.utilisation < self.overload_utilisation
+                   and len(worker.sessions) < len(least.sessions) + AFFINITY_SLACK_SESSIONS]
+        return min(holders, key=RenderWorker.load) if holders else least
+
+    def open(self, quality, sample_rate, avatar_id=None):
+        """Open a session's renderer on a worker; call from the event loop"""
+        if quality not in QUALITY_PRESETS:
+            logger.warning(f"Unknown quality '{quality}', rendering at '{DEFAULT_QUALITY}'")
+            quality = DEFAULT_QUALITY
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._rebalance_loop())
+        self._next_key += 1
+        session = RemoteRenderer(self, self._next_key, quality, sample_rate, avatar_id)
+        self.sessions_opened += 1
+        self._attach(session, self._choose_worker((avatar_id, quality))).add_done_callback(self._opened)
+        return session
+
+    def _attach(self, session, worker, state=None):
+        """Open session on worker, continuing from state or else from the audio it has been fed"""
+        session.worker = worker
+        worker.sessions.add(session)
+        worker.avatars.add((session.avatar_id, session.quality))
+        return self._run(worker, _open_session, session.key, session.quality, session.sample_rate,
+                         session.avatar_id, state, session.position)
+
+    def _opened(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        hit, open_ms = future.result()
+        self.affinity_hits += hit
+        self.open_ms_total += open_ms
+        self.opens_measured += 1
+
+    def _run(self, worker, fn, *args):
+        """Submit a job to worker; a dead process is replaced when a job fails or cannot be submitted"""
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(worker.executor, fn, *args)
+        except BrokenProcessPool:
+            self._restart(worker, worker.executor)
+            future = loop.run_in_executor(worker.executor, fn, *args)
+        executor = worker.executor
+        worker.inflight += 1
+
+        def done(future):
+            worker.inflight -= 1
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self._restart(worker, executor)
+        future.add_done_callback(done)
+        return future
+
+    def submit_audio(self, session, pcm):
+        if session.closed:
+            return
+        if session.held is not None:
+            session.held.append(pcm)
+            return
+        worker = session.worker
+        future = self._run(worker, _render, session.key, pcm)
+        session.position += len(pcm) // 2
+        future.add_done_callback(lambda future: self._deliver(worker, session, future))
+
+    def _deliver(self, worker, session, future):
+        """Pass a render job's frames to the session, releasing each ring slot in order"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        records, dropped, busy_seconds = future.result()
+        worker.busy_seconds += busy_seconds
+        worker.frames_dropped += dropped
+        if not records:
+            return
+        reader = worker.reader
+        for record in records:
+            frame = reader.read(record)
+            try:
+                if frame is not None and session.on_frame is not None and not session.closed:
+                    session.on_frame(*frame)
+            except Exception as e:
+                logger.error(f"Frame delivery failed: {e}")
+            finally:
+                if frame is not None:
+                    frame[0].release()
+                reader.release()
+        worker.frames += len(records)
+
+    def set_quality(self, session):
+        worker = session.worker
+        worker.avatars.add((session.avatar_id, session.quality))
+        self._run(worker, _set_quality, session.key, session.quality, session.avatar_id)
+
+    def close_session(self, session):
+        if session.closed:
+            return
+        session.closed = True
+        session.worker.sessions.discard(session)
+        if session.held is None:
+            self._run(session.worker, _close_session, session.key)
+        # A session still moving is closed on its new worker once it gets there
+
+    def migrate(self, session, target):
+        """Move a session to another worker, carrying its renderer state"""
+        source = session.worker
+        source.sessions.discard(session)
+        session.worker = target
+        target.sessions.add(session)
+        session.held = []
+        self.migrations += 1
+        logger.info(f"Moving renderer session {session.key} from worker {source.index} "
+                    f"(utilisation {source.utilisation:.2f}) to worker {target.index} "
+                    f"(utilisation {target.utilisation:.2f})")
+
+        def detached(future):
+            state = None
+            if not future.cancelled() and future.exception() is None:
+                state = future.result()
+            held, session.held = session.held, None
+            if session.closed:
+                return
+            self._attach(session, target, state)
+            for pcm in held:
+                self.submit_audio(session, pcm)
+        self._run(source, _close_session, session.key).add_done_callback(detached)
+
+    def rebalance(self):
+        """Measure utilisation and move one session off the hottest worker if it is overloaded"""
+        for worker in self.workers:
+            worker.update_utilisation(self.rebalance_interval)
+        hottest = max(self.workers, key=RenderWorker.load)
+        coolest = min(self.workers, key=RenderWorker.load)
+        if (hottest.utilisation < self.overload_utilisation or len(hottest.sessions) < 2
+                or coolest.utilisation > hottest.utilisation - REBALANCE_MARGIN):
+            return
+        movable = [session for session in hottest.sessions if session.held is None]
+        if not movable:
+            return
+        # Prefer a session whose avatar the cooler worker already holds
+        movable.sort(key=lambda session: ((session.avatar_id, session.quality) not in coolest.avatars,
+                                          -session.key))
+        self.migrate(movable[0], coolest)
+
+    async def _rebalance_loop(self):
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            try:
+                self.rebalance()
+            except Exception as e:
+                logger.error(f"Renderer pool rebalance failed: {e}")
+
+    def _restart(self, worker, executor):
+        """Replace a worker whose process died; its sessions start again at their audio position"""
+        if worker.executor is not executor:
+            return
+        logger.error(f"Renderer worker {worker.index} died; restarting it with {len(worker.sessions)} sessions")
+        executor.shutdown(wait=False, cancel_futures=True)
+        worker.close_ring()
+        worker.restarts += 1
+        self.worker_restarts += 1
+        worker.start()
+        for session in list(worker.sessions):
+            worker.sessions.discard(session)
+            self._attach(session, worker)
+
+    def worker_stats(self):
+        """Per-worker utilisation, sessions and avatars"""
+        return [worker.stats() for worker in self.workers]
+
+    def stats(self):
+        """Return pool metrics as a plain dict"""
+        return {
+            "renderer_pool_workers": len(self.workers),
+            "renderer_pool_sessions": sum(len(worker.sessions) for worker in self.workers),
+            "renderer_pool_sessions_opened": self.sessions_opened,
+            "renderer_pool_affinity_hits": self.affinity_hits,
+            "renderer_pool_avg_open_ms": round(self.open_ms_total / self.opens_measured, 2)
+            if self.opens_measured else 0.0,
+            "renderer_pool_migrations": self.migrations,
+            "renderer_pool_restarts": self.worker_restarts,
+            "renderer_pool_max_utilisation": round(max(worker.utilisation for worker in self.workers), 3),
+            "renderer_pool_frames": sum(worker.frames for worker in self.workers),
+            "renderer_pool_frames_dropped": sum(worker.frames_dropped for worker in self.workers),
+        }
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for worker in self.workers:
+            worker.stop()
@@ -0,0 +1,208 @@
+"""
+Per-session audio format tracking and streaming resampling.
+
+'voice' messages carry sampleRate and encoding, but the receiver used to
+ignore them and always wrote 24000 Hz mono. AudioFormatTracker records the
+format declared by 'init' and 'voice' messages, flags mid-stream changes and
+converts every chunk to the publisher's format (InitPayload.audio_sample_rate,
+16000 Hz mono by default) with a StreamingResampler.
+
+StreamingResampler is a rational polyphase windowed-sinc filter. Filter state
+(the input history and the output phase) is preserved between chunks, so
+chunk boundaries of any size are seamless. Each chunk is computed with one
+vectorised gather and multiply-accumulate in NumPy.
+"""
+
+import functools
+import logging
+from math import gcd
+
+import numpy as np
+
+# Configuration
+TARGET_SAMPLE_RATE = 16000
+TARGET_CHANNELS = 1
+TAPS_PER_PHASE = 32
+KAISER_BETA = 8.6
+ROLLOFF = 0.94
+SUPPORTED_ENCODINGS = ("PCM16", "PCM8")
+
+logger = logging.getLogger(__name__)
+
+
+def pcm_to_float(audio_bytes, encoding="PCM16", channels=1):
+    """Decode PCM bytes to a float32 array shaped (frames, channels)"""
+    if encoding == "PCM16":
+        samples = np.frombuffer(audio_bytes, dtype="<i2", count=len(audio_bytes) // 2).astype(np.float32)
+    elif encoding == "PCM8":
+        samples = (np.frombuffer(audio_bytes, dtype=np.uint8).astype(np.float32) - 128.0) * 256.0
+    else:
+        raise ValueError(f"Unsupported encoding '{encoding}'")
+    frames = len(samples) // channels
+    return samples[:frames * channels].reshape(frames, channels)
+
+
+def float_to_pcm16(samples):
+    """Encode a float array in PCM16 range to little-endian PCM16 bytes"""
+    return np.clip(np.rint(samples), -32768, 32767).astype("<i2").tobytes()
+
+
+@functools.lru_cache(maxsize=32)
+def polyphase_bank(up, down, taps):
+    """Kaiser-windowed sinc prototype, split into one sub-filter per output phase (shared, read-only)"""
+    length = up * taps
+    # Cutoff relative to the upsampled rate, below the lower of the two Nyquist limits
+    cutoff = ROLLOFF * 0.5 / max(up, down)
+    n = np.arange(length) - (length - 1) / 2
+    prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, KAISER_BETA)
+    prototype *= up / prototype.sum()
+    # bank[phase, k] multiplies input sample (base - k)
+    bank = prototype.reshape(taps, up).T.astype(np.float32).copy()
+    bank.flags.writeable = False
+    return bank
+
+
+class StreamingResampler:
+    """Rational polyphase resampler that keeps its filter state between chunks"""
+
+    def __init__(self, input_rate, output_rate, channels=1, taps_per_phase=TAPS_PER_PHASE):
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.channels = channels
+        divisor = gcd(input_rate, output_rate)
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        self.taps = taps_per_phase
+        self.passthrough = self.up == self.down
+
+        if not self.passthrough:
+            self.bank = polyphase_bank(self.up, self.down, self.taps)
+        self._history = np.zeros((self.taps - 1, channels), dtype=np.float32)
+        self._input_count = 0
+        self._output_count = 0
+
+    def __getstate__(self):
+        # Pickled with each executor job in process mode: send the filter history, not the bank
+        state = self.__dict__.copy()
+        state.pop("bank", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not self.passthrough:
+            self.bank = polyphase_bank(self.up, self.down, self.taps)
+
+    @property
+    def delay_seconds(self):
+        """Group delay the filter adds, in seconds of output"""
+        if self.passthrough:
+            return 0.0
+        return (self.up * self.taps - 1) / 2 / (self.up * self.input_rate)
+
+    def process(self, samples):
+        """Resample a float32 (frames, channels) block; returns the output frames available so far"""
+        if self.passthrough:
+            return samples
+
+        count = len(samples)
+        extended = np.concatenate((self._history, samples)) if count else self._history
+        end_input = self._input_count + count
+
+        # Output n uses input position n * down / up; emit every n whose base sample has arrived
+        first = self._output_count
+        last = -(-end_input * self.up // self.down)
+        if last <= first:
+            self._advance(extended, count)
+            return np.zeros((0, self.channels), dtype=np.float32)
+
+        positions = np.arange(first, last, dtype=np.int64) * self.down
+        base = positions // self.up
+        phase = positions % self.up
+        index = (base - self._input_count + self.taps - 1)[:, None] - np.arange(self.taps)[None, :]
+        output = np.einsum("nkc,nk->nc", extended[index], self.bank[phase], optimize=False)
+
+        self._output_count = last
+        self._advance(extended, count)
+        return output
+
+    def _advance(self, extended, count):
+        self._history = extended[len(extended) - (self.taps - 1):].copy()
+        self._input_count += count
+
+
+class AudioFormatTracker:
+    """Tracks a session's declared audio format and converts chunks to the target format"""
+
+    def __init__(self, target_rate=TARGET_SAMPLE_RATE, target_channels=TARGET_CHANNELS):
+        self.target_rate = target_rate
+        self.target_channels = target_channels
+        self.sample_rate = None
+        self.encoding = None
+        self.channels = None
+        self.format_changes = 0
+        self.rejected_chunks = 0
+        self.resampler = None
+
+    def update(self, sample_rate=None, encoding=None, channels=None, source="voice"):
+        """Record declared format fields; returns True if an established format changed"""
+        sample_rate = sample_rate or self.sample_rate or 24000
+        encoding = encoding or self.encoding or "PCM16"
+        channels = channels or self.channels or 1
+        if (sample_rate, encoding, channels) == (self.sample_rate, self.encoding, self.channels):
+            return False
+
+        changed = self.sample_rate is not None
+        if changed:
+            self.format_changes += 1
+            logger.warning(f"Audio format changed mid-stream via {source}: "
+                           f"{self.sample_rate}Hz/{self.encoding}/{self.channels}ch -> "
+                           f"{sample_rate}Hz/{encoding}/{channels}ch")
+        self.sample_rate, self.encoding, self.channels = sample_rate, encoding, channels
+        self.resampler = StreamingResampler(sample_rate, self.target_rate or sample_rate, self.target_channels)
+        return changed
+
+    @property
+    def output_rate(self):
+        return self.target_rate or self.sample_rate or 24000
+
+    def silence(self, duration_ms):
+        """Silent audio in the current input format, for 'silence' markers sent in place of chunks"""
+        if self.resampler is None:
+            self.update()
+        frames = int(round(self.sample_rate * duration_ms / 1000))
+        if self.encoding == "PCM8":
+            return b"\x80" * (frames * self.channels)
+        return bytes(frames * self.channels * 2)
+
+    def convert(self, audio_bytes):
+        """Convert one chunk in the current format to PCM16 at the target rate and channel count
+
+        Returns None for chunks in an encoding that cannot be decoded here.
+        """
+        if self.resampler is None:
+            self.update()
+        if self.encoding not in SUPPORTED_ENCODINGS:
+            self.rejected_chunks += 1
+            if self.rejected_chunks == 1:
+                logger.warning(f"Cannot decode '{self.encoding}' audio; dropping chunks")
+            return None
+        if (self.encoding == "PCM16" and self.resampler.passthrough
+                and self.channels == self.target_channels):
+            return audio_bytes
+
+        samples = pcm_to_float(audio_bytes, self.encoding, self.channels)
+        if self.channels != self.target_channels:
+            mono = samples.mean(axis=1, keepdims=True)
+            samples = np.repeat(mono, self.target_channels, axis=1) if self.target_channels > 1 else mono
+        return float_to_pcm16(self.resampler.process(samples))
+
+    def stats(self):
+        """Return format state as a plain dict"""
+        return {
+            "input_sample_rate": self.sample_rate,
+            "input_encoding": self.encoding,
+            "input_channels": self.channels,
+            "output_sample_rate": self.output_rate,
+            "format_changes": self.format_changes,
+            "rejected_chunks": self.rejected_chunks,
+        }
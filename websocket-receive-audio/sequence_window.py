@@ -0,0 +1,131 @@
+"""
+Sliding-window duplicate and reorder detection for sequenced voice chunks.
+
+The sender numbers each session's 'voice' messages with seq, starting at 0,
+and re-sends a message unchanged when a send fails. A retry whose first
+attempt actually got through would otherwise be played twice. SequenceWindow
+releases each seq once, in order:
+
+  next_seq      the next seq to release
+  bitset        one bit per seq from next_seq - size up to the highest seq
+                seen, set once it has arrived, held in a single int that
+                slides forward with next_seq
+  held          chunks that arrived ahead of a missing seq, at most
+                reorder_depth of them
+
+A chunk behind next_seq is a duplicate if its bit is set. If not, or it is
+too old to tell, it is late: its gap was already skipped. A chunk ahead of
+next_seq waits in held until the gap fills. The gap is given up on, and
+counted, once more than reorder_depth chunks are held, the oldest has waited
+reorder_timeout seconds, or flush() is called. Memory stays bounded by size
+and reorder_depth however long the session runs, unlike a set of every
+event_id seen.
+"""
+
+import time
+
+# Configuration
+WINDOW_SIZE = 256
+REORDER_DEPTH = 16
+REORDER_TIMEOUT = 0.25
+
+
+class SequenceWindow:
+    """Releases sequenced items once each and in order, dropping duplicates"""
+
+    def __init__(self, size=WINDOW_SIZE, reorder_depth=REORDER_DEPTH, reorder_timeout=REORDER_TIMEOUT):
+        self.size = size
+        self.reorder_depth = reorder_depth
+        self.reorder_timeout = reorder_timeout
+        self.next_seq = 0
+        # Bit i is set once seq low + i has arrived
+        self._low = 0
+        self._bits = 0
+        self.held = {}
+        self._held_since = None
+
+        # Metrics
+        self.duplicates = 0
+        self.gaps = 0
+        self.reordered = 0
+        self.late = 0
+        self.held_max = 0
+
+    def push(self, seq, item):
+        """Record an arrival; returns the items now ready, in seq order"""
+        next_seq = self.next_seq
+        if seq < next_seq:
+            offset = seq - self._low
+            if offset >= 0 and self._bits >> offset & 1:
+                self.duplicates += 1
+            else:
+                self.late += 1
+            return []
+        if seq in self.held:
+            self.duplicates += 1
+            return []
+
+        ready = []
+        if seq >= next_seq + self.size:
+            # Too far ahead to track: give up on everything before the window it starts
+            ready = self._skip_to(seq - self.size + 1)
+            self._slide()
+        self._bits |= 1 << (seq - self._low)
+        if self.held and seq < max(self.held):
+            self.reordered += 1
+        if seq == self.next_seq:
+            ready.append(item)
+            self.next_seq += 1
+            self._release(ready)
+        else:
+            if not self.held:
+                self._held_since = time.monotonic()
+            self.held[seq] = item
+            if len(self.held) > self.held_max:
+                self.held_max = len(self.held)
+            if len(self.held) > self.reorder_depth or \
+                    time.monotonic() - self._held_since > self.reorder_timeout:
+                ready += self._skip_to(min(self.held))
+                self._release(ready)
+        self._slide()
+        return ready
+
+    def flush(self):
+        """Give up on every missing seq; returns the held items in seq order"""
+        if not self.held:
+            return []
+        ready = self._skip_to(max(self.held) + 1)
+        self._slide()
+        return ready
+
+    def _release(self, ready):
+        """Append the held items that now follow on from next_seq"""
+        held = self.held
+        while self.next_seq in held:
+            ready.append(held.pop(self.next_seq))
+            self.next_seq += 1
+        self._held_since = time.monotonic() if held else None
+
+    def _skip_to(self, seq):
+        """Move next_seq up to seq, counting the missing seqs as gaps; returns the held items passed"""
+        passed = sorted(held_seq for held_seq in self.held if held_seq < seq)
+        self.gaps += seq - self.next_seq - len(passed)
+        self.next_seq = seq
+        return [self.held.pop(held_seq) for held_seq in passed]
+
+    def _slide(self):
+        """Drop the bits of seqs more than size behind next_seq"""
+        shift = self.next_seq - self.size - self._low
+        if shift > 0:
+            self._bits >>= shift
+            self._low += shift
+
+    def stats(self):
+        """Return sequencing metrics as a plain dict"""
+        return {
+            "duplicates": self.duplicates,
+            "gaps": self.gaps,
+            "reordered": self.reordered,
+            "late": self.late,
+            "held_max": self.held_max,
+        }
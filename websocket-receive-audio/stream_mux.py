@@ -0,0 +1,142 @@
+"""
+Fair scheduling for avatar streams multiplexed over one WebSocket.
+
+A gateway driving many agents can carry all of their streams on a single
+connection instead of one socket (and TLS handshake, keep-alive traffic and
+server task) per session. The connection's reader then only parses messages
+and queues them by stream_id. StreamScheduler hands them to the per-stream
+state by deficit round robin (DRR): each visit a stream earns QUANTUM_BYTES of
+credit, and its queued messages are processed while their size fits. A
+stream that bursts seconds of audio cannot hold back the next chunk of every
+other stream by more than one quantum each. Messages of one stream keep
+their order.
+
+The reader stops taking messages once MAX_BACKLOG_BYTES are queued, which
+pushes back on the sender through the socket instead of growing memory.
+
+Connections that are not multiplexed queue their own messages under the
+stream_id None, so their reader stays free to handle control messages too.
+"""
+
+import asyncio
+import collections
+import logging
+
+# Configuration
+QUANTUM_BYTES = 16 * 1024
+MAX_BACKLOG_BYTES = 8 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class StreamScheduler:
+    """Deficit round robin over per-stream message queues"""
+
+    def __init__(self, process, quantum_bytes=QUANTUM_BYTES, max_backlog_bytes=MAX_BACKLOG_BYTES):
+        # Awaited as process(stream_id, data) for each message, in per-stream order
+        self.process = process
+        self.quantum_bytes = quantum_bytes
+        self.max_backlog_bytes = max_backlog_bytes
+        self._queues = {}
+        self._deficits = {}
+        self._queued_bytes = {}
+        # Streams with queued messages, in round-robin order
+        self._active = collections.deque()
+        self._backlog_bytes = 0
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+        # Metrics
+        self.messages = 0
+        self.rounds = 0
+        self.backlog_max_bytes = 0
+        self.backpressure_waits = 0
+
+    async def put(self, stream_id, data, size):
+        """Queue a message for a stream, waiting while the backlog is full"""
+        if self._backlog_bytes >= self.max_backlog_bytes:
+            self.backpressure_waits += 1
+            self._space.clear()
+            await self._space.wait()
+        queue = self._queues.get(stream_id)
+        if queue is None:
+            queue = self._queues[stream_id] = collections.deque()
+            self._deficits[stream_id] = 0
+            self._queued_bytes[stream_id] = 0
+        if not queue:
+            self._active.append(stream_id)
+        queue.append((size, data))
+        self._queued_bytes[stream_id] += size
+        self._backlog_bytes += size
+        if self._backlog_bytes > self.backlog_max_bytes:
+            self.backlog_max_bytes = self._backlog_bytes
+        self._ready.set()
+
+    async def _run(self):
+        active = self._active
+        queued_bytes = self._queued_bytes
+        while True:
+            if not active:
+                if self._closing:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            self.rounds += 1
+            for _ in range(len(active)):
+                stream_id = active.popleft()
+                queue = self._queues[stream_id]
+                # Credit carries over, so a message larger than the quantum goes out within a few rounds
+                deficit = self._deficits[stream_id] + self.quantum_bytes
+                while queue and queue[0][0] <= deficit:
+                    size, data = queue.popleft()
+                    deficit -= size
+                    queued_bytes[stream_id] -= size
+                    self._backlog_bytes -= size
+                    self.messages += 1
+                    try:
+                        await self.process(stream_id, data)
+                    except Exception as e:
+                        logger.error(f"Error processing message for stream {stream_id}: {e}")
+                if queue:
+                    self._deficits[stream_id] = deficit
+                    active.append(stream_id)
+                else:
+                    self._deficits[stream_id] = 0
+
+            if self._backlog_bytes < self.max_backlog_bytes:
+                self._space.set()
+            # Let the reader queue what has arrived meanwhile
+            await asyncio.sleep(0)
+
+    async def close(self):
+        """Process everything queued, then stop"""
+        self._closing = True
+        self._ready.set()
+        self._space.set()
+        await self._task
+
+    def queued_bytes(self, stream_id):
+        """Bytes of messages queued for a stream"""
+        return self._queued_bytes.get(stream_id, 0)
+
+    def full(self):
+        """Whether put() is waiting for the backlog to drain"""
+        return not self._space.is_set()
+
+    def cancel(self):
+        self._task.cancel()
+
+    def stats(self):
+        """Return scheduler metrics as a plain dict"""
+        return {
+            "streams": len(self._queues),
+            "messages": self.messages,
+            "rounds": self.rounds,
+            "backlog_max_bytes": self.backlog_max_bytes,
+            "backpressure_waits": self.backpressure_waits,
+        }
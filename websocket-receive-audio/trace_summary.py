@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Summarise a trace written by tracing.py into time-to-first-frame breakdowns.
+
+For each session it lines up the milestones from every process on the
+critical path, from /session/start to the first published frame:
+
+    session.start -> ws.connect/ws.accept -> init -> avatar.load ->
+    first voice.send/voice.recv -> session.first_audio/first_video ->
+    publish.first_video
+
+and prints the slowest sessions stage by stage, followed by percentiles for
+the two SLOs: /session/start to first frame, and first voice chunk of each
+utterance to its first lip-synced frame (split into transport, from
+voice.send to voice.recv, and buffering plus rendering).
+
+Usage:
+    python trace_summary.py trace.json [--sessions 5] [--json]
+"""
+
+import argparse
+import collections
+import json
+
+# Milestones in critical-path order: (label, event name, use the event's end)
+MILESTONES = [
+    ("session.start", "session.start", False),
+    ("start response", "session.start", True),
+    ("ws.connect", "ws.connect", True),
+    ("ws.accept", "ws.accept", False),
+    ("init", "init", False),
+    ("avatar loaded", "avatar.load", True),
+    ("publisher connected", "publisher.connect", True),
+    ("first voice.send", "voice.send", False),
+    ("first voice.recv", "voice.recv", False),
+    ("first audio frame", "session.first_audio", False),
+    ("first video frame", "session.first_video", False),
+    ("first published video", "publish.first_video", False),
+]
+FIRST_FRAME_EVENTS = ("publish.first_video", "session.first_video")
+
+
+def load_events(path):
+    """Read the events of a trace file, tolerating the missing closing bracket and concurrent writers"""
+    events = []
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith("[") and text.endswith("]"):
+        try:
+            return [event for event in json.loads(text) if event.get("ph") != "M"]
+        except ValueError:
+            pass
+    for line in text.splitlines():
+        line = line.strip().rstrip(",")
+        if line in ("", "[", "]"):
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if event.get("ph") != "M":
+            events.append(event)
+    return events
+
+
+def group_by_session(events):
+    """Map session_id -> events; events without one are attached through their event_id"""
+    sessions = collections.defaultdict(list)
+    session_for_event = {}
+    orphans = []
+    for event in events:
+        args = event.get("args", {})
+        session_id = args.get("session_id")
+        if session_id is None:
+            orphans.append(event)
+            continue
+        sessions[session_id].append(event)
+        if "event_id" in args:
+            session_for_event[args["event_id"]] = session_id
+    for event in orphans:
+        session_id = session_for_event.get(event.get("args", {}).get("event_id"))
+        if session_id is not None:
+            sessions[session_id].append(event)
+    for session_events in sessions.values():
+        session_events.sort(key=lambda event: event["ts"])
+    return sessions
+
+
+def critical_path(session_events):
+    """Return [(label, time_us)] for the milestones present, in order of occurrence"""
+    first = {}
+    for event in session_events:
+        first.setdefault(event["name"], event)
+    path = []
+    for label, name, use_end in MILESTONES:
+        event = first.get(name)
+        if event is not None:
+            path.append((label, event["ts"] + (event.get("dur", 0) if use_end else 0)))
+    path.sort(key=lambda item: item[1])
+    return path
+
+
+def first_frame_us(session_events):
+    """Microseconds from the start of the session to its first video frame, or None"""
+    start = next((event["ts"] for event in session_events if event["name"] == "session.start"), None)
+    if start is None:
+        start = session_events[0]["ts"]
+    for name in FIRST_FRAME_EVENTS:
+        frame = next((event["ts"] for event in session_events if event["name"] == name), None)
+        if frame is not None:
+            return frame - start
+    return None
+
+
+def utterance_latencies(session_events):
+    """Per utterance: (total, transport, buffering + render) in microseconds"""
+    sent = {event["args"].get("event_id"): event["ts"] for event in session_events if event["name"] == "voice.send"}
+    results = []
+    for event in session_events:
+        if event["name"] not in ("utterance.first_video", "utterance.first_audio"):
+            continue
+        received = event["ts"]
+        total = event["dur"]
+        transport = None
+        send_ts = sent.get(event["args"].get("event_id"))
+        if send_ts is not None:
+            transport = received - send_ts
+            total += transport
+        results.append((total, transport, event["dur"]))
+    return results
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(fraction):
+        return values[min(len(values) - 1, int(fraction * len(values)))] / 1000
+
+    return {"count": len(values), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": values[-1] / 1000}
+
+
+def summarise(events):
+    sessions = group_by_session(events)
+    per_session = {}
+    start_to_frame = []
+    voice_to_frame, transport, render = [], [], []
+    for session_id, session_events in sessions.items():
+        ttff = first_frame_us(session_events)
+        if ttff is not None:
+            start_to_frame.append(ttff)
+        for total, network, local in utterance_latencies(session_events):
+            voice_to_frame.append(total)
+            render.append(local)
+            if network is not None:
+                transport.append(network)
+        per_session[session_id] = {"time_to_first_frame_us": ttff, "path": critical_path(session_events)}
+    return {
+        "sessions": per_session,
+        "start_to_first_frame": percentiles(start_to_frame),
+        "voice_to_first_frame": percentiles(voice_to_frame),
+        "voice_transport": percentiles(transport),
+        "voice_buffer_and_render": percentiles(render),
+    }
+
+
+def print_summary(summary, limit):
+    sessions = summary["sessions"]
+    slowest = sorted(sessions.items(), key=lambda item: -(item[1]["time_to_first_frame_us"] or 0))[:limit]
+    for session_id, info in slowest:
+        path = info["path"]
+        if not path:
+            continue
+        print(f"Session {session_id}")
+        origin = previous = path[0][1]
+        for label, ts in path:
+            print(f"  {label:<24} {(ts - origin) / 1000:>10.1f}ms  (+{(ts - previous) / 1000:.1f}ms)")
+            previous = ts
+        print()
+
+    print(f"{'metric':<26} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for key in ("start_to_first_frame", "voice_to_first_frame", "voice_transport", "voice_buffer_and_render"):
+        stats = summary[key]
+        if stats is None:
+            print(f"{key:<26} {0:>6} {'-':>9} {'-':>9} {'-':>9}")
+        else:
+            print(f"{key:<26} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+                  f"{stats['max_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise time-to-first-frame from a trace file")
+    parser.add_argument("trace")
+    parser.add_argument("--sessions", type=int, default=5, help="Print the critical path of the N slowest sessions")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    summary = summarise(load_events(args.trace))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print_summary(summary, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
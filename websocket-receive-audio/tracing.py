@@ -0,0 +1,156 @@
+"""
+Lightweight cross-process tracing in the Chrome Trace Event format.
+
+The time-to-first-frame SLOs span several processes: the /session/start
+server, the audio sender, the receiver and the publisher. Each of them
+appends events to one local trace file, which chrome://tracing or Perfetto
+(ui.perfetto.dev) can open directly, and trace_summary.py turns into
+critical-path breakdowns.
+
+Events carry session_id and, for voice chunks, event_id in their args, so a
+session can be followed across processes. The session_id comes from the
+/session/start response; the WebSocket side recovers it from the session
+token's claims (session_id_from_token). Timestamps are wall-clock
+microseconds, so events from different processes on a host line up.
+
+Tracing is off unless TRACE_FILE is set (or configure() is called). Each
+process opens the file itself with O_APPEND and writes one line per event,
+which keeps events from concurrent writers whole. The file is a JSON array
+without its closing bracket, which the format allows.
+"""
+
+import base64
+import json
+import os
+import sys
+import threading
+import time
+
+# Configuration
+TRACE_FILE_ENV = "TRACE_FILE"
+
+_path = os.environ.get(TRACE_FILE_ENV) or None
+_process_name = None
+_fd = None
+_pid = None
+_lock = threading.Lock()
+
+# Checked on hot paths before building any event
+enabled = _path is not None
+
+
+def configure(path, process_name=None):
+    """Send events to path (None turns tracing off); child processes inherit it through TRACE_FILE"""
+    global _path, _process_name, enabled, _fd
+    with _lock:
+        if _fd is not None and _pid == os.getpid():
+            os.close(_fd)
+        _fd = None
+        _path = path
+        _process_name = process_name
+        enabled = path is not None
+        if path is None:
+            os.environ.pop(TRACE_FILE_ENV, None)
+        else:
+            os.environ[TRACE_FILE_ENV] = path
+
+
+def now_us():
+    return time.time_ns() // 1000
+
+
+def _write(event):
+    global _fd, _pid
+    pid = os.getpid()
+    with _lock:
+        if _fd is None or _pid != pid:
+            # First event in this process (or in a forked child): open our own descriptor
+            _fd = os.open(_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            _pid = pid
+            if os.fstat(_fd).st_size == 0:
+                os.write(_fd, b"[\n")
+            name = _process_name or os.path.basename(sys.argv[0] or "python")
+            os.write(_fd, (json.dumps({"name": "process_name", "ph": "M", "pid": pid,
+                                       "args": {"name": name}}) + ",\n").encode("utf-8"))
+        event["pid"] = pid
+        event["tid"] = threading.get_ident() & 0xFFFFFFFF
+        os.write(_fd, (json.dumps(event, separators=(",", ":")) + ",\n").encode("utf-8"))
+
+
+def _args(session_id, fields):
+    args = {key: value for key, value in fields.items() if value is not None}
+    if session_id is not None:
+        args["session_id"] = session_id
+    return args
+
+
+def instant(name, session_id=None, category="session", **fields):
+    """Record a point in time"""
+    if not enabled:
+        return
+    _write({"name": name, "cat": category, "ph": "i", "s": "p", "ts": now_us(),
+            "args": _args(session_id, fields)})
+
+
+def complete(name, start_us, end_us=None, session_id=None, category="session", **fields):
+    """Record a span measured by the caller, e.g. across awaits or callbacks"""
+    if not enabled:
+        return
+    if end_us is None:
+        end_us = now_us()
+    _write({"name": name, "cat": category, "ph": "X", "ts": start_us, "dur": max(end_us - start_us, 0),
+            "args": _args(session_id, fields)})
+
+
+class _Span:
+    __slots__ = ("name", "session_id", "category", "fields", "start_us")
+
+    def __init__(self, name, session_id, category, fields):
+        self.name = name
+        self.session_id = session_id
+        self.category = category
+        self.fields = fields
+
+    def __enter__(self):
+        self.start_us = now_us()
+        return self
+
+    def __exit__(self, *exc):
+        complete(self.name, self.start_us, session_id=self.session_id, category=self.category, **self.fields)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, session_id=None, category="session", **fields):
+    """Context manager recording the enclosed block as a complete event"""
+    if not enabled:
+        return _NO_SPAN
+    return _Span(name, session_id, category, fields)
+
+
+def session_id_from_token(token):
+    """Return the session_id claim of a JWT-style session token ("Bearer " optional), or None"""
+    if not token:
+        return None
+    if token.startswith("Bearer "):
+        token = token[len("Bearer "):]
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4))
+        return json.loads(payload).get("session_id")
+    except (ValueError, AttributeError):
+        return None
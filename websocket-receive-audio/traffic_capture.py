@@ -0,0 +1,135 @@
+"""
+Binary capture log of inbound WebSocket traffic.
+
+With a TrafficCapture attached, WebSocketTestReceiver records every
+connection and every inbound message. Each entry has a monotonic timestamp
+and the connection's id. traffic_replay.py reads the log back and re-drives
+the sessions against a receiver, so production traffic shapes become
+repeatable load tests.
+
+File layout: the MAGIC line, then one record per event:
+
+    header   timestamp (ns since the capture started, u64), connection id
+             (u32), kind (u8), payload length (u32), little-endian
+    payload  OPEN: JSON with the authorization header and remote address
+             TEXT / BINARY: the message as received
+             CLOSE: empty
+
+Text messages are stored as their UTF-8 bytes, with no re-encoding or
+escaping. A path ending in .gz is gzip-compressed, which shrinks base64
+audio by at least a quarter.
+"""
+
+import gzip
+import json
+import logging
+import struct
+import time
+
+# Configuration
+MAGIC = b"WSCAP1\n"
+FLUSH_BYTES = 1024 * 1024
+
+OPEN = 0
+TEXT = 1
+BINARY = 2
+CLOSE = 3
+
+logger = logging.getLogger(__name__)
+
+# timestamp ns, connection id, kind, payload length
+_RECORD = struct.Struct("<QIBI")
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
+
+
+class TrafficCapture:
+    """Appends connections and inbound messages to a capture log"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = _open(path, "wb")
+        self._file.write(MAGIC)
+        self._start_ns = time.monotonic_ns()
+        self._pending = []
+        self._pending_bytes = 0
+
+        # Metrics
+        self.connections = 0
+        self.messages = 0
+        self.bytes_written = len(MAGIC)
+
+    def _record(self, connection_id, kind, payload):
+        if self._file is None:
+            # Closed on shutdown while connections were still finishing
+            return
+        self._pending.append(_RECORD.pack(time.monotonic_ns() - self._start_ns, connection_id, kind, len(payload)))
+        self._pending.append(payload)
+        self._pending_bytes += _RECORD.size + len(payload)
+        if self._pending_bytes >= FLUSH_BYTES:
+            self.flush()
+
+    def opened(self, connection_id, authorization="", remote_address=None):
+        self.connections += 1
+        self._record(connection_id, OPEN, json.dumps({
+            "authorization": authorization,
+            "remote_address": str(remote_address) if remote_address is not None else None,
+        }).encode("utf-8"))
+
+    def message(self, connection_id, message):
+        self.messages += 1
+        if isinstance(message, str):
+            self._record(connection_id, TEXT, message.encode("utf-8"))
+        else:
+            self._record(connection_id, BINARY, bytes(message))
+
+    def closed(self, connection_id):
+        self._record(connection_id, CLOSE, b"")
+
+    def flush(self):
+        if self._pending:
+            self._file.write(b"".join(self._pending))
+            self.bytes_written += self._pending_bytes
+            self._pending = []
+            self._pending_bytes = 0
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        logger.info(f"Captured {self.connections} connections and {self.messages} messages to {self.path}")
+
+    def stats(self):
+        """Return capture metrics as a plain dict"""
+        return {
+            "capture_connections": self.connections,
+            "capture_messages": self.messages,
+            "capture_bytes": self.bytes_written + self._pending_bytes,
+        }
+
+
+def read_capture(path):
+    """Yield (timestamp_ns, connection_id, kind, payload) for each record of a capture log"""
+    with _open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a traffic capture")
+        while True:
+            # A capture cut off mid-record (e.g. a terminated worker) ends at the last whole one
+            try:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    return
+                timestamp_ns, connection_id, kind, length = _RECORD.unpack(header)
+                payload = f.read(length)
+            except EOFError:
+                return
+            if len(payload) < length:
+                return
+            yield timestamp_ns, connection_id, kind, payload
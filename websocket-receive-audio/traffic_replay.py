@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Replay traffic captures (traffic_capture.py) against a WebSocket receiver.
+
+Every connection in each capture is opened again with its original
+authorization header. Its messages are sent on the captured timeline, at 1x,
+at N times speed (--speed 4) or as fast as the receiver takes them (--speed
+max). Connections keep their relative timing, so bursts and overlaps look
+the way they did in production. All captures, and --copies of each, run in
+parallel, optionally --stagger seconds apart, to scale a real traffic shape
+into a load test.
+
+Reports connections, messages and bytes sent, elapsed time and, unless at max
+speed, how late sends ran against the schedule (p50/p99/max). Lateness near
+zero means the replay reproduced the captured pacing.
+
+Usage:
+    python traffic_replay.py capture.wscap [more.wscap.gz ...] [--uri ws://localhost:8765] \\
+        [--speed 1|4|max] [--copies 10] [--stagger 0.5] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+
+import websockets
+
+from traffic_capture import OPEN, TEXT, BINARY, CLOSE, read_capture
+
+# Configuration
+DEFAULT_URI = "ws://localhost:8765"
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_sessions(path):
+    """Group a capture's records into connections: dicts with authorization, times and messages"""
+    sessions = {}
+    for timestamp_ns, connection_id, kind, payload in read_capture(path):
+        if kind == OPEN:
+            info = json.loads(payload)
+            sessions[connection_id] = {"authorization": info.get("authorization") or "",
+                                       "open_ns": timestamp_ns, "close_ns": None, "messages": []}
+            continue
+        session = sessions.get(connection_id)
+        if session is None:
+            continue
+        if kind == TEXT:
+            session["messages"].append((timestamp_ns, payload.decode("utf-8")))
+        elif kind == BINARY:
+            session["messages"].append((timestamp_ns, payload))
+        elif kind == CLOSE:
+            session["close_ns"] = timestamp_ns
+    return [session for _, session in sorted(sessions.items())]
+
+
+class ReplayStats:
+    def __init__(self):
+        self.connections = 0
+        self.failures = 0
+        self.messages = 0
+        self.bytes = 0
+        self.lateness_ms = []
+        self.elapsed = 0.0
+
+
+async def _drain(websocket):
+    """Read and discard what the receiver sends (e.g. voice_ack) so it never backs up"""
+    try:
+        async for _ in websocket:
+            pass
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def replay_connection(uri, session, start, speed, stats):
+    """Replay one captured connection; start is the loop time its captured open maps to"""
+    loop = asyncio.get_running_loop()
+
+    def due(timestamp_ns):
+        return start + (timestamp_ns - session["open_ns"]) / 1e9 / speed if speed else loop.time()
+
+    headers = {"authorization": session["authorization"]} if session["authorization"] else None
+    try:
+        websocket = await websockets.connect(uri, additional_headers=headers, max_size=None)
+    except (OSError, websockets.exceptions.InvalidHandshake) as e:
+        stats.failures += 1
+        logger.error(f"Could not connect to {uri}: {e}")
+        return
+    stats.connections += 1
+    drain = asyncio.create_task(_drain(websocket))
+    try:
+        for timestamp_ns, message in session["messages"]:
+            scheduled = due(timestamp_ns)
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if speed:
+                stats.lateness_ms.append(max(loop.time() - scheduled, 0.0) * 1000)
+            await websocket.send(message)
+            stats.messages += 1
+            stats.bytes += len(message)
+        if session["close_ns"] is not None:
+            delay = due(session["close_ns"]) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    except websockets.exceptions.ConnectionClosed as e:
+        stats.failures += 1
+        logger.error(f"Connection closed by the receiver during replay: {e}")
+    finally:
+        await websocket.close()
+        await drain
+
+
+async def _start_later(uri, session, start, speed, stats):
+    delay = start - asyncio.get_running_loop().time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    await replay_connection(uri, session, start, speed, stats)
+
+
+async def replay(uri, captures, speed, copies, stagger):
+    """Replay every connection of every capture, copies times each; returns ReplayStats"""
+    loop = asyncio.get_running_loop()
+    stats = ReplayStats()
+    origin = loop.time()
+    tasks = []
+    for copy in range(copies):
+        base = origin + copy * stagger
+        for sessions in captures:
+            if not sessions:
+                continue
+            first_ns = sessions[0]["open_ns"]
+            for session in sessions:
+                # Connections open at their captured offset from the capture's first connection
+                offset = (session["open_ns"] - first_ns) / 1e9 / speed if speed else 0.0
+                tasks.append(asyncio.create_task(_start_later(uri, session, base + offset, speed, stats)))
+    await asyncio.gather(*tasks)
+    stats.elapsed = loop.time() - origin
+    return stats
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured WebSocket traffic against a receiver")
+    parser.add_argument("captures", nargs="+", help="Capture files written with --capture-file")
+    parser.add_argument("--uri", default=DEFAULT_URI)
+    parser.add_argument("--speed", default="1", help="Playback speed multiplier, or 'max' for no pacing")
+    parser.add_argument("--copies", type=int, default=1, help="Replay each capture this many times in parallel")
+    parser.add_argument("--stagger", type=float, default=0.0, help="Seconds between the starts of copies")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    speed = None if args.speed == "max" else float(args.speed)
+    captures = [load_sessions(path) for path in args.captures]
+    logging.getLogger().setLevel(logging.WARNING)
+    stats = asyncio.run(replay(args.uri, captures, speed, args.copies, args.stagger))
+    result = {
+        "captures": len(captures),
+        "copies": args.copies,
+        "speed": args.speed,
+        "connections": stats.connections,
+        "failures": stats.failures,
+        "messages": stats.messages,
+        "bytes": stats.bytes,
+        "elapsed_s": stats.elapsed,
+        "lateness_p50_ms": percentile(stats.lateness_ms, 0.5),
+        "lateness_p99_ms": percentile(stats.lateness_ms, 0.99),
+        "lateness_max_ms": max(stats.lateness_ms) if stats.lateness_ms else None,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"Replayed {result['connections']} connections ({result['failures']} failed): "
+          f"{result['messages']} messages, {result['bytes'] / 1e6:.1f}MB in {result['elapsed_s']:.1f}s "
+          f"at speed {args.speed}")
+    if speed:
+        if stats.lateness_ms:
+            print(f"Send lateness against the captured schedule: p50 {result['lateness_p50_ms']:.1f}ms, "
+                  f"p99 {result['lateness_p99_ms']:.1f}ms, max {result['lateness_max_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Utterance-segmented audio state for the WebSocket receiver.
+
+Audio on a connection is split into segments, one per utterance: a segment
+opens with the first 'voice' chunk after a 'voice_end' or 'voice_interrupt'
+and closes on the next 'voice_end'. An interrupt bumps the tracker's epoch
+and cancels only the segments that have not been fully played out yet.
+Downstream work compares its segment against the epoch, so queued tasks are
+dropped lazily when they come up instead of being searched for on the
+interrupt path.
+"""
+
+import itertools
+
+ACTIVE = "active"
+ENDED = "ended"
+CANCELLED = "cancelled"
+
+
+class UtteranceSegment:
+    """Audio belonging to one utterance"""
+
+    __slots__ = ("index", "epoch", "first_event_id", "last_event_id", "state", "chunks",
+                 "bytes", "inflight", "start_offset", "end_offset", "received_us")
+
+    def __init__(self, index, epoch, event_id):
+        self.index = index
+        self.epoch = epoch
+        self.first_event_id = event_id
+        self.last_event_id = event_id
+        self.state = ACTIVE
+        self.chunks = []
+        self.bytes = 0
+        # Chunks submitted for processing but not yet applied
+        self.inflight = 0
+        # Jitter buffer write offsets before this segment's first byte and after its last
+        self.start_offset = None
+        self.end_offset = 0
+        # When the first chunk arrived (wall-clock microseconds), set while tracing
+        self.received_us = None
+
+    @property
+    def cancelled(self):
+        return self.state == CANCELLED
+
+
+class UtteranceTracker:
+    """Per-session list of utterance segments with O(1) interrupt"""
+
+    def __init__(self):
+        self.segments = []
+        self.active = None
+        self.epoch = 0
+        self._index = itertools.count()
+
+    def segment_for_chunk(self, event_id=None):
+        """Return the open segment, starting a new one if the previous utterance ended"""
+        segment = self.active
+        if segment is None:
+            segment = self.active = UtteranceSegment(next(self._index), self.epoch, event_id)
+            self.segments.append(segment)
+        else:
+            segment.last_event_id = event_id
+        return segment
+
+    def end(self):
+        """Close the open segment (voice_end)"""
+        segment, self.active = self.active, None
+        if segment is not None:
+            segment.state = ENDED
+        return segment
+
+    def interrupt(self, played_offset):
+        """Cancel the open segment and every ended segment not yet played past played_offset
+
+        Returns the cancelled segments. Only the newest segments can still be
+        pending, so the walk stops at the first fully played one.
+        """
+        self.epoch += 1
+        self.active = None
+        cancelled = []
+        for segment in reversed(self.segments):
+            if segment.state == CANCELLED:
+                break
+            if segment.state == ENDED and segment.inflight == 0 and segment.end_offset <= played_offset:
+                break
+            segment.state = CANCELLED
+            # Cancelled audio is never saved, so let it go now
+            segment.chunks = []
+            segment.bytes = 0
+            cancelled.append(segment)
+        return cancelled
+
+    def is_stale(self, segment):
+        """True if work for this segment should be dropped (untagged work never is)"""
+        if segment is None:
+            return False
+        return segment.state == CANCELLED or segment.epoch != self.epoch
+
+    def kept_chunks(self):
+        """Audio chunks from every segment that was not cancelled, in arrival order"""
+        return [chunk for segment in self.segments if segment.state != CANCELLED for chunk in segment.chunks]
+
+    def retained_bytes(self):
+        """Bytes of audio held for every segment not cancelled"""
+        return sum(segment.bytes for segment in self.segments)
+
+    def chunk_total(self):
+        return sum(len(segment.chunks) for segment in self.segments if segment.state != CANCELLED)
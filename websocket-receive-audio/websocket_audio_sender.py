@@ -5,9 +5,13 @@ import uuid
 import wave
 import websockets
 import logging
+import random
 import ssl
 import time
 
+import tracing
+from chunk_controller import ChunkSizeController
+
 # Configuration fields
 WEBSOCKET_ADDRESS = "ws://localhost:8765"  # For testing with local receiver
 # WEBSOCKET_ADDRESS = "wss://api.example.com/v1/websocket"  # Production URL
@@ -18,28 +22,107 @@ CHANNEL = "test"
 UID = "200"
 ENABLE_STRING_UID = False
 AVATAR_ID = "avatar123"
+VAD_THRESHOLD_DBFS = None  # e.g. -50 to send silent chunks as 'silence' markers
+VAD_FRAME_MS = 10  # A chunk is silent only if every frame of this length is below the threshold
+VAD_HANGOVER_MS = 200  # Keep sending this long after speech so quiet word endings are not cut
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def build_voice_message(chunk, sample_rate, stream_id=None, seq=None):
+    """Build one 'voice' message for a PCM16 chunk; returns (event_id, JSON text)"""
+    event_id = str(uuid.uuid4())
+    msg = {
+        "command": "voice",
+        "audio": base64.b64encode(chunk).decode('utf-8'),
+        "sampleRate": sample_rate,
+        "encoding": "PCM16",
+        "event_id": event_id
+    }
+    if stream_id is not None:
+        # Multiplexed connection: the stream declared in init this chunk belongs to
+        msg["stream_id"] = stream_id
+    if seq is not None:
+        # Per-session position, so the receiver can drop a retried chunk that already arrived
+        msg["seq"] = seq
+    return event_id, json.dumps(msg)
+
+
+def build_silence_message(duration_ms, sample_rate):
+    """Build a 'silence' message standing in for a silent chunk; returns (event_id, JSON text)"""
+    event_id = str(uuid.uuid4())
+    msg = {
+        "command": "silence",
+        "duration_ms": duration_ms,
+        "sampleRate": sample_rate,
+        "event_id": event_id
+    }
+    return event_id, json.dumps(msg)
+
+
+def is_silent(chunk, sample_rate, channels, threshold_dbfs):
+    """True if every VAD_FRAME_MS frame of a PCM16 chunk has an RMS level below threshold_dbfs"""
+    # Only the VAD gate needs NumPy, so the sender runs without it while the gate is off
+    import numpy as np
+
+    samples = np.frombuffer(chunk, dtype="<i2", count=len(chunk) // 2).astype(np.float32)
+    frame = max(1, sample_rate * VAD_FRAME_MS // 1000) * channels
+    count = -(-len(samples) // frame)
+    frames = np.zeros(count * frame, dtype=np.float32)
+    frames[:len(samples)] = samples
+    frames = frames.reshape(count, frame)
+    # Compare mean squares against the threshold's, so there is no sqrt or log per frame
+    limit = (32768.0 * 10 ** (threshold_dbfs / 20)) ** 2 * frame
+    return bool(np.einsum("ij,ij->i", frames, frames).max() < limit)
+
+
 class WebSocketAudioSender:
-    def __init__(self, wav_file="input.wav"):
+    def __init__(self, wav_file="input.wav", websocket_address=WEBSOCKET_ADDRESS, session_token=SESSION_TOKEN,
+                 avatar_id=AVATAR_ID, quality="high", chunk_seconds=0.5, chunk_delay=0.01, realtime=False,
+                 settle_delay=1.0, linger=2.0, interrupt_rate=0.0,
+                 vad_threshold_dbfs=VAD_THRESHOLD_DBFS, adaptive_chunks=False):
         self.wav_file = wav_file
+        self.websocket_address = websocket_address
+        self.session_token = session_token
+        self.avatar_id = avatar_id
+        self.quality = quality
+        self.chunk_seconds = chunk_seconds
+        # Pause between chunks, or with realtime=True send each chunk when its audio would start playing
+        self.chunk_delay = chunk_delay
+        self.realtime = realtime
+        # Wait after init before the first chunk, and after the last chunk before closing
+        self.settle_delay = settle_delay
+        self.linger = linger
+        # Chance per chunk of a barge-in: a voice_interrupt, after which a new utterance starts
+        self.interrupt_rate = interrupt_rate
+        # PCM16 chunks quieter than this are sent as 'silence' markers (None sends every chunk)
+        self.vad_threshold_dbfs = vad_threshold_dbfs
+        # With adaptive_chunks the chunk duration follows ack RTT and send time instead of chunk_seconds
+        self.chunk_controller = ChunkSizeController() if adaptive_chunks else None
         self.websocket = None
         self.stop_event = asyncio.Event()
+        self.chunks_sent = 0
+        self.interrupts_sent = 0
+        self.bytes_sent = 0
+        self.silent_chunks = 0
+        self.bytes_saved = 0
+        # seq of the next voice message; a retry re-sends the same message with the same seq
+        self.voice_seq = 0
+        # Tags trace events (TRACE_FILE) so they line up with the receiver's
+        self.session_id = tracing.session_id_from_token(session_token)
         
     async def connect(self):
         """Establish WebSocket connection and send initial payload"""
         headers = {
-            "authorization": f"Bearer {SESSION_TOKEN}"
+            "authorization": f"Bearer {self.session_token}"
         }
         
         payload = {
             "command": "init",  # Added missing command field as per documentation
-            "avatar_id": AVATAR_ID,
-            "quality": "high",
+            "avatar_id": self.avatar_id,
+            "quality": self.quality,
             "version": "v1",
             "video_encoding": "H264",
             "agora_settings": {
@@ -50,31 +133,35 @@ class WebSocketAudioSender:
                 "enable_string_uid": ENABLE_STRING_UID
             }
         }
+        if self.chunk_controller is not None:
+            payload["voice_ack"] = True
         
         try:
-            logger.info(f"Connecting to WebSocket: {WEBSOCKET_ADDRESS}")
-            self.websocket = await websockets.connect(
-                WEBSOCKET_ADDRESS,
-                additional_headers=headers
-            )
+            logger.info(f"Connecting to WebSocket: {self.websocket_address}")
+            with tracing.span("ws.connect", self.session_id):
+                self.websocket = await websockets.connect(
+                    self.websocket_address,
+                    additional_headers=headers
+                )
             logger.info("WebSocket connected successfully")
             
             # Send initial configuration payload
             await self.websocket.send(json.dumps(payload))
+            tracing.instant("init.send", self.session_id)
             logger.info("Sent initial configuration payload with 'init' command")
             
             # Start listening for messages in background
             asyncio.create_task(self.listen_for_messages())
             
             # Wait a moment for connection to be fully established
-            await asyncio.sleep(1)
+            await asyncio.sleep(self.settle_delay)
             
             # Send audio chunks
             await self.send_audio_chunks()
             
         except OSError as e:
             if "Connect call failed" in str(e) or "Connection refused" in str(e):
-                logger.error(f"Failed to connect to WebSocket server at {WEBSOCKET_ADDRESS}")
+                logger.error(f"Failed to connect to WebSocket server at {self.websocket_address}")
                 logger.error("Make sure the WebSocket server is running first.")
                 logger.error("For testing: python websocket_test_receiver.py")
             else:
@@ -89,6 +176,9 @@ class WebSocketAudioSender:
         try:
             async for message in self.websocket:
                 data = json.loads(message)
+                if data.get("command") == "voice_ack" and self.chunk_controller is not None:
+                    self.chunk_controller.on_ack(data.get("event_id"))
+                    continue
                 logger.info(f"Received message: {data}")
         except Exception as e:
             logger.error(f"Error listening to messages: {e}")
@@ -107,18 +197,25 @@ class WebSocketAudioSender:
                 # Read all frames
                 frames = wf.readframes(wf.getnframes())
                 
-                # Calculate chunk size (0.5 seconds of audio)
-                chunk_size = int(sr * 0.5)
+                # Calculate chunk size (0.5 seconds of audio by default)
+                chunk_size = int(sr * self.chunk_seconds)
                 sample_bytes = sw * ch
                 chunk_bytes = chunk_size * sample_bytes
                 
                 idx = 0
                 chunk_count = 0
+                start = time.monotonic()
+                gate = self.vad_threshold_dbfs is not None and sw == 2
+                hangover = 0
                 
+                controller = self.chunk_controller
                 while idx < len(frames):
                     if self.stop_event.is_set():
                         break
-                        
+
+                    if controller is not None:
+                        chunk_bytes = max(1, sr * controller.next_chunk_ms() // 1000) * sample_bytes
+
                     # Extract chunk
                     chunk = frames[idx : idx + chunk_bytes]
                     idx += chunk_bytes
@@ -126,24 +223,38 @@ class WebSocketAudioSender:
                     if not chunk:
                         break
                     
-                    # Encode chunk to base64
-                    base64_audio = base64.b64encode(chunk).decode('utf-8')
-                    event_id = str(uuid.uuid4())
-                    
-                    # Create message with specified format
-                    msg = {
-                        "command": "voice",
-                        "audio": base64_audio,
-                        "sampleRate": sr,  # Use actual sample rate from WAV file
-                        "encoding": "PCM16",
-                        "event_id": event_id
-                    }
+                    duration_ms = len(chunk) * 1000 / (sr * sample_bytes)
+                    silent = False
+                    if gate:
+                        if not is_silent(chunk, sr, ch, self.vad_threshold_dbfs):
+                            hangover = VAD_HANGOVER_MS
+                        elif hangover > 0:
+                            hangover -= duration_ms
+                        else:
+                            silent = True
+
+                    if silent:
+                        event_id, message = build_silence_message(duration_ms, sr)
+                        self.silent_chunks += 1
+                        # The base64 audio payload that was not sent
+                        self.bytes_saved += (len(chunk) + 2) // 3 * 4
+                    else:
+                        # Encode chunk to base64 and build the message (actual sample rate from the WAV file)
+                        event_id, message = build_voice_message(chunk, sr, seq=self.voice_seq)
+                        self.voice_seq += 1
                     
                     # Send chunk with retry logic
                     for attempt in range(3):
                         try:
-                            await self.websocket.send(json.dumps(msg))
+                            send_start = time.perf_counter()
+                            await self.websocket.send(message)
+                            if controller is not None and not silent:
+                                controller.on_sent(event_id, duration_ms, time.perf_counter() - send_start)
+                            tracing.instant("silence.send" if silent else "voice.send", self.session_id,
+                                            category="voice", event_id=event_id)
+                            self.bytes_sent += len(message)
                             chunk_count += 1
+                            self.chunks_sent += 1
                             logger.info(f"Sent audio chunk {chunk_count}, event_id: {event_id}")
                             break
                         except Exception as e:
@@ -152,11 +263,28 @@ class WebSocketAudioSender:
                             else:
                                 await asyncio.sleep(0.01)
                     
-                    # Small delay between chunks
-                    await asyncio.sleep(0.01)
+                    if self.interrupt_rate and random.random() < self.interrupt_rate:
+                        await self.websocket.send(json.dumps({"command": "voice_interrupt",
+                                                              "event_id": str(uuid.uuid4())}))
+                        self.interrupts_sent += 1
+                        logger.info(f"Sent voice_interrupt after chunk {chunk_count}")
+
+                    if self.realtime:
+                        # Pace chunks at the speed the audio plays
+                        await asyncio.sleep(max(0.0, start + idx / (sr * sample_bytes) - time.monotonic()))
+                    else:
+                        # Small delay between chunks
+                        await asyncio.sleep(self.chunk_delay)
                 
+                if gate:
+                    logger.info(f"VAD gate: {self.silent_chunks} of {chunk_count} chunks sent as silence, "
+                                f"{self.bytes_saved} bytes saved")
+
+                if controller is not None:
+                    logger.info(f"Adaptive chunks: {controller.stats()}")
+
                 # Wait before closing
-                await asyncio.sleep(2.0)
+                await asyncio.sleep(self.linger)
                 
         except Exception as e:
             logger.error(f"Error sending WAV: {e}")
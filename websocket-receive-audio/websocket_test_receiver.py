@@ -1,16 +1,37 @@
+import argparse
 import asyncio
-import base64
+import collections
 import json
 import logging
+import time
 import wave
 import io
+import os
 import socket
 from datetime import datetime
+from http import HTTPStatus
 import websockets
 
+from avatar_renderer import AvatarRenderer, DEFAULT_QUALITY, QUALITY_PRESETS, get_sprites
+from executor_stage import ChunkExecutor, LaneMarker, LoopLagMonitor, decode_voice_chunk, EXECUTOR_MODES
+from feature_extractor import StreamingFeatureExtractor
+from heartbeat import HeartbeatMonitor, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, IDLE_TIMEOUT
+from jitter_buffer import JitterBuffer, run_playout
+from load_governor import LoadGovernor
+from media_clock import MediaClock, audio_delay_frames
+from memory_accounting import MemoryAccountant, MemoryProfiler, MAX_SESSION_BYTES, MAX_NODE_BYTES, session_memory
+from resampler import AudioFormatTracker, TARGET_SAMPLE_RATE, TARGET_CHANNELS
+from sequence_window import SequenceWindow
+from stream_mux import StreamScheduler
+from traffic_capture import TrafficCapture
+import tracing
+from utterance import UtteranceTracker
+
 # Configuration
 WEBSOCKET_PORT = 8765
 OUTPUT_WAV_FILE = "received_audio.wav"
+# Handled as soon as they are read, ahead of the connection's queued audio
+PRIORITY_COMMANDS = ("init", "voice_interrupt")
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -29,25 +50,691 @@ def get_server_hostname():
         return "localhost"
 
 
+class AudioStage:
+    """A session's audio work that depends on earlier chunks: conversion to the target format and lip-sync features
+
+    With an executor it runs on the session's lane through run_audio_stage, so
+    the resampler and feature extractor never run on the event loop; otherwise
+    it runs inline.
+    """
+
+    def __init__(self, audio_format, extract_features=False):
+        self.audio_format = audio_format
+        self.extract_features = extract_features
+        # Created at the output rate by the first chunk
+        self.features = None
+
+    def convert(self, audio_bytes):
+        """Convert a chunk; returns (PCM16 at the output rate or None, output rate, features or None)"""
+        audio_bytes = self.audio_format.convert(audio_bytes)
+        output_rate = self.audio_format.output_rate
+        features = None
+        if audio_bytes and self.extract_features:
+            if self.features is None:
+                self.features = StreamingFeatureExtractor(output_rate)
+            features = self.features.process(audio_bytes)
+            if not len(features["rms"]):
+                features = None
+        return audio_bytes, output_rate, features
+
+
+def run_audio_stage(stage, value):
+    """OrderedLane stage: apply format changes, convert audio and extract features in chunk order, on the executor
+
+    Decoded chunks come out as (input bytes, PCM16, output rate, features); format and
+    silence markers come out carrying their outcome.
+    """
+    if isinstance(value, LaneMarker):
+        kind = value.value[0]
+        if kind == "format":
+            (sample_rate, encoding, channels), source = value.value[1:]
+            return stage, LaneMarker(("format", stage.audio_format.update(sample_rate, encoding, channels, source)))
+        if kind == "silence":
+            return stage, LaneMarker(("silence", *stage.convert(stage.audio_format.silence(value.value[1]))))
+        return stage, value
+    return stage, (len(value), *stage.convert(value))
+
+
+class ClientSession:
+    """Per-connection receiver state"""
+
+    def __init__(self, client_id, target_sample_rate=TARGET_SAMPLE_RATE, extract_features=False):
+        self.client_id = client_id
+        # From the session token when it carries one; ties trace events to /session/start
+        self.session_id = f"{client_id}@{os.getpid()}"
+        self.chunk_count = 0
+        self.utterances = UtteranceTracker()
+        self.initialized = False
+        self.quality = None
+        self.avatar_id = None
+        # From init; the load governor degrades lower priorities first
+        self.priority = 0
+        # Reply to each voice chunk with a voice_ack (requested by init, for adaptive chunk sizing)
+        self.voice_acks = False
+        # Format as declared by the most recent message, and the tracker that
+        # applies it (in chunk order) and converts audio to the target rate
+        self.declared_format = (None, None, None)
+        self.audio_format = AudioFormatTracker(target_sample_rate, TARGET_CHANNELS)
+        # Runs on the executor lane while there is one, which then owns it
+        self.audio_stage = AudioStage(self.audio_format, extract_features)
+        self.jitter_buffer = None
+        self.renderer = None
+        # Future of the avatar's SpriteSet while it loads from the avatar cache
+        self.avatar_assets = None
+        # Shared audio/video timeline, created with the playout task
+        self.media_clock = None
+        self.playout_stop = asyncio.Event()
+        self.playout_task = None
+        # Ordered executor lane and the task applying its results (executor mode only)
+        self.lane = None
+        self.result_task = None
+        # Tracing: frame kinds whose first frame has been traced, and utterance segments done
+        self.traced_firsts = set()
+        self.traced_segments = 0
+        # The connection's session holds the scheduler its audio is queued on and, when
+        # multiplexed, stream_id -> ClientSession; a stream's session has its stream_id
+        self.websocket = None
+        self.stream_id = None
+        self.streams = None
+        self.scheduler = None
+        # Queued audio read before a voice_interrupt was handled, dropped unprocessed
+        self.chunks_preempted = 0
+        # Duplicate and reorder window over voice seq numbers, from the first sequenced chunk
+        self.sequence = None
+        # Bytes held per stage as of the last memory check; the connection's reader
+        # waits on memory_ok while the accountant has it paused
+        self.memory = None
+        self.memory_bytes = 0
+        self.memory_ok = None
+        self.memory_paused_at = None
+        # Heartbeat state of the connection: when its last message arrived and ping round trips
+        self.last_message_at = None
+        self.rtt_ms = None
+        self.rtt_ms_avg = None
+        self.rtt_ms_max = None
+
+
 class WebSocketTestReceiver:
-    def __init__(self):
+    def __init__(self, audio_frame_sink=None, output_wav_file=OUTPUT_WAV_FILE,
+                 executor=None, chunk_processor=decode_voice_chunk, interrupt_sink=None,
+                 target_sample_rate=TARGET_SAMPLE_RATE, video_frame_sink=None, feature_sink=None,
+                 avatar_cache=None, capture=None, priority_control=True,
+                 max_session_bytes=MAX_SESSION_BYTES, max_node_bytes=MAX_NODE_BYTES, memory_profile=False,
+                 renderer_pool=None, load_governor=True, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 heartbeat_timeout=HEARTBEAT_TIMEOUT, idle_timeout=IDLE_TIMEOUT):
         self.audio_chunks = []
         self.connection_count = 0
+        self.active_connections = 0
+        self.messages_received = 0
+        self.audio_bytes_received = 0
+        self.silence_ms_received = 0
+        self.streams_opened = 0
+        self.streams_active = 0
+        self.chunks_preempted = 0
         self.session_data = {}
-        
+        self.output_wav_file = output_wav_file
+        # Called as audio_frame_sink(client_id, frame_bytes, timestamp_unix_nano) for every 10ms frame
+        self.audio_frame_sink = audio_frame_sink
+        # Called as video_frame_sink(client_id, i420_frame, timestamp_unix_nano) for every rendered frame;
+        # the frame is a memoryview into a reused buffer, so copy it if it must outlive the call.
+        # Both timestamps come from the session's MediaClock, so they share one timeline.
+        self.video_frame_sink = video_frame_sink
+        self.frames_rendered = 0
+        self.av_sync_stats = {}
+        # Optional avatar_cache.AvatarCache; init starts loading the session's avatar from it
+        self.avatar_cache = avatar_cache
+        # Optional renderer_pool.RendererPool; sessions render on its worker processes instead of the loop
+        self.renderer_pool = renderer_pool
+        # Optional traffic_capture.TrafficCapture recording every inbound message for replay
+        self.capture = capture
+        # Handle PRIORITY_COMMANDS as they are read instead of in turn behind queued audio
+        self.priority_commands = frozenset(PRIORITY_COMMANDS) if priority_control else frozenset()
+        # Called as feature_sink(client_id, features) with per-10ms-hop lip-sync features
+        # (see feature_extractor.StreamingFeatureExtractor.process) as audio arrives
+        self.feature_sink = feature_sink
+        # Called as interrupt_sink(client_id, event_id) as soon as a voice_interrupt is handled
+        self.interrupt_sink = interrupt_sink
+        self.jitter_stats = {}
+        self.sequence_stats = {}
+        # Rate every session is converted to (None keeps each sender's rate)
+        self.target_sample_rate = target_sample_rate
+        self.format_changes = 0
+        # Optional ChunkExecutor; chunk_processor(audio_base64) -> PCM bytes runs on it
+        self.executor = executor
+        self.chunk_processor = chunk_processor
+        self.loop_lag = LoopLagMonitor()
+        # Per-session byte accounting with caps (None disables one); optional tracemalloc attribution
+        self.memory_accountant = MemoryAccountant(max_session_bytes, max_node_bytes)
+        # Steps rendering sessions down quality tiers under CPU pressure, and back up
+        self.governor = LoadGovernor(self._set_quality, self.loop_lag, renderer_pool) if load_governor else None
+        # Pings every connection and reaps dead or idle ones (None disables pings or idle reaping)
+        self.heartbeat = None
+        if heartbeat_interval is not None or idle_timeout is not None:
+            self.heartbeat = HeartbeatMonitor(self._reap, self._reader_blocked, heartbeat_interval,
+                                              heartbeat_timeout, idle_timeout)
+        # Tasks closing reaped connections that have no transport to abort
+        self._reaping = set()
+        # quality -> future of its built-in sprites, built off the loop the first time a session switches to it
+        self._tier_sprites = {}
+        self.memory_profiler = None
+        if memory_profile:
+            self.memory_profiler = MemoryProfiler()
+            self.memory_profiler.start()
+
+        # Dispatch table for everything except 'voice', which takes the fast path
+        # in handle_client. A missing command maps to the legacy config format.
+        self.handlers = {
+            "init": self.handle_init,
+            "voice_end": self.handle_voice_end,
+            "silence": self.handle_silence,
+            "voice_interrupt": self.handle_voice_interrupt,
+            None: self.handle_legacy_config,
+        }
+
+    def _start_playout(self, session):
+        """Start the steady-clock playout task feeding 10ms frames to the publisher sink"""
+        client_id = session.client_id
+        renderer = session.renderer
+        video_frame_sink = self.video_frame_sink
+        governor = self.governor
+        fps = renderer.fps if renderer is not None else QUALITY_PRESETS[DEFAULT_QUALITY][2]
+        clock = session.media_clock = MediaClock(fps)
+        # A video frame is only rendered once all its audio has played out, so
+        # hold audio back by one video frame to send the two together
+        delayed = collections.deque()
+        delay_frames = audio_delay_frames(fps, session.jitter_buffer.frame_ms) if renderer is not None else 0
+        remote = renderer is not None and self.renderer_pool is not None
+
+        def send_video(frame, pts_ns):
+            self.frames_rendered += 1
+            sent = False
+            for video_timestamp in clock.video_timestamps(pts_ns):
+                video_frame_sink(client_id, frame, video_timestamp)
+                sent = True
+            if sent and tracing.enabled:
+                self._trace_frame(session, "video", True)
+
+        if remote:
+            # Pool workers render as the audio reaches them; frames come back on the loop
+            renderer.on_frame = send_video
+
+        def emit(frame, timestamp_ns):
+            clock.tick(timestamp_ns)
+            if renderer is not None:
+                # Render on the audio clock so lips stay in step with the published audio.
+                # The governor may have switched the session to another tier's renderer.
+                current = session.renderer
+                current.feed(frame)
+                if not remote:
+                    start = time.perf_counter()
+                    while (rendered := current.render_next()) is not None:
+                        send_video(*rendered)
+                    if governor is not None:
+                        governor.render_seconds += time.perf_counter() - start
+                delayed.append((frame, timestamp_ns))
+                if len(delayed) <= delay_frames:
+                    return
+                frame, timestamp_ns = delayed.popleft()
+            audio_timestamp = clock.stamp_audio(timestamp_ns)
+            if tracing.enabled and (renderer is None or "audio" not in session.traced_firsts):
+                self._trace_frame(session, "audio", renderer is None)
+            if self.audio_frame_sink is not None:
+                return self.audio_frame_sink(client_id, frame, audio_timestamp)
+        session.playout_task = asyncio.create_task(
+            run_playout(session.jitter_buffer, emit, session.playout_stop)
+        )
+
+    def _set_quality(self, session, quality):
+        """Switch a rendering session to another quality tier; False if it cannot switch yet"""
+        if self.renderer_pool is not None:
+            if not session.renderer.set_quality(quality):
+                return False
+        else:
+            if self.avatar_cache is not None and session.avatar_id is not None:
+                assets = self.avatar_cache.warm(session.avatar_id, quality)
+            else:
+                assets = self._tier_sprites.get(quality)
+                if assets is None:
+                    width, height, _ = QUALITY_PRESETS[quality]
+                    assets = self._tier_sprites[quality] = asyncio.get_running_loop().run_in_executor(
+                        None, get_sprites, width, height)
+            if not assets.done():
+                # Switch on a later check, once the tier's sprites are ready
+                return False
+            sprites = assets.result() if assets.exception() is None else None
+            session.renderer = session.renderer.with_quality(quality, sprites)
+        # Audio stays held back by the starting frame rate's delay, so it is never interrupted
+        session.media_clock.set_fps(session.renderer.fps)
+        return True
+
+    def _trace_frame(self, session, kind, per_utterance):
+        """Trace the session's first frame of a kind and, if per_utterance, each utterance's first frame"""
+        if kind not in session.traced_firsts:
+            session.traced_firsts.add(kind)
+            tracing.instant(f"session.first_{kind}", session.session_id, client_id=session.client_id)
+        if not per_utterance:
+            return
+
+        # The frame just sent covers audio up to the playout read offset
+        read_offset = session.jitter_buffer.read_offset
+        segments = session.utterances.segments
+        while session.traced_segments < len(segments):
+            segment = segments[session.traced_segments]
+            if not segment.cancelled:
+                if segment.start_offset is None or read_offset <= segment.start_offset:
+                    break
+                if segment.received_us is not None:
+                    tracing.complete(f"utterance.first_{kind}", segment.received_us,
+                                     session_id=session.session_id, category="voice",
+                                     event_id=segment.first_event_id, utterance=segment.index)
+            session.traced_segments += 1
+
+    def _warm_avatar(self, session, avatar_id):
+        """Start loading the session's avatar assets so the renderer has them by the first audio"""
+        if self.avatar_cache is None or self.video_frame_sink is None:
+            return
+        quality = session.quality if session.quality in QUALITY_PRESETS else DEFAULT_QUALITY
+        session.avatar_assets = self.avatar_cache.warm(avatar_id, quality)
+        if tracing.enabled:
+            start_us = tracing.now_us()
+            session.avatar_assets.add_done_callback(
+                lambda _: tracing.complete("avatar.load", start_us, session_id=session.session_id,
+                                           avatar_id=avatar_id, quality=quality))
+
+    def _avatar_sprites(self, session):
+        """The session's cached avatar sprites, or None to use the built-in ones
+
+        Never waits for them: while they are still loading the renderer starts
+        with the built-in sprites and switches once the load finishes.
+        """
+        assets = session.avatar_assets
+        if assets is None:
+            return None
+        if not assets.done():
+            logger.info(f"Avatar assets for {session.client_id} are still loading; starting with the built-in sprites")
+            asyncio.wrap_future(assets).add_done_callback(lambda _: self._swap_sprites(session, assets))
+            return None
+        return self._loaded_sprites(session, assets)
+
+    def _loaded_sprites(self, session, assets):
+        if assets.exception() is not None:
+            logger.error(f"Failed to load avatar assets for {session.client_id}: {assets.exception()}")
+            return None
+        return assets.result()
+
+    def _swap_sprites(self, session, assets):
+        """Switch a renderer that started with the built-in sprites to the avatar's, once they have loaded"""
+        sprites = self._loaded_sprites(session, assets)
+        renderer = session.renderer
+        if sprites is None or renderer is None or session.playout_stop.is_set():
+            return
+        # The governor may have moved the session to another tier meanwhile; it loads that tier's sprites itself
+        if (renderer.width, renderer.height) != (sprites.width, sprites.height):
+            return
+        quality = session.quality if session.quality in QUALITY_PRESETS else DEFAULT_QUALITY
+        session.renderer = renderer.with_quality(quality, sprites)
+
+    def handle_init(self, session, data):
+        """Handle initialization command"""
+        if "streams" in data:
+            self._open_declared_streams(session, data)
+            return
+        client_id = session.client_id
+        logger.info(f"Received INIT command from {client_id}:")
+        logger.info(f"  Avatar ID: {data.get('avatar_id')}")
+        logger.info(f"  Quality: {data.get('quality')}")
+        logger.info(f"  Version: {data.get('version')}")
+        logger.info(f"  Video Encoding: {data.get('video_encoding')}")
+
+        if 'agora_settings' in data:
+            agora = data['agora_settings']
+            logger.info(f"  Agora Settings:")
+            logger.info(f"    App ID: {agora.get('app_id')}")
+            logger.info(f"    Channel: {agora.get('channel')}")
+            logger.info(f"    UID: {agora.get('uid')}")
+            logger.info(f"    Enable String UID: {agora.get('enable_string_uid')}")
+
+        # init may declare the audio format up front; voice messages can refine it
+        if any(key in data for key in ("sampleRate", "encoding", "channels")):
+            self._declare_format(session, None, data.get("sampleRate"), data.get("encoding"),
+                                 data.get("channels"), "init")
+
+        # Mark session as initialized
+        session.voice_acks = bool(data.get('voice_ack'))
+        session.quality = data.get('quality')
+        session.avatar_id = data.get('avatar_id')
+        if isinstance(data.get('priority'), int):
+            session.priority = data['priority']
+        self._warm_avatar(session, session.avatar_id)
+        session.initialized = True
+        tracing.instant("init", session.session_id, avatar_id=data.get('avatar_id'), quality=session.quality)
+        logger.info(f"Session initialized for {client_id}")
+
+    def _open_declared_streams(self, session, data):
+        """Open and initialise each stream a multiplexed init declares; top-level fields are shared defaults"""
+        shared = {key: value for key, value in data.items() if key != "streams"}
+        for declared in data["streams"]:
+            stream_data = dict(shared, **declared)
+            stream_id = stream_data.get("stream_id")
+            if stream_id is None or (session.streams and stream_id in session.streams):
+                logger.warning(f"Ignoring stream without a new stream_id from {session.client_id}: {declared}")
+                continue
+            self.handle_init(self._open_stream(session, stream_id), stream_data)
+
+    def _open_stream(self, session, stream_id):
+        """Create the state of one stream on a multiplexed connection"""
+        if session.streams is None:
+            session.streams = {}
+            logger.info(f"Connection {session.client_id} is multiplexed")
+        stream = self._open_session(f"{session.client_id}/{stream_id}")
+        stream.websocket = session.websocket
+        stream.scheduler = session.scheduler
+        stream.stream_id = stream_id
+        stream.session_id = f"{session.session_id}/{stream_id}"
+        session.streams[stream_id] = stream
+        self.streams_opened += 1
+        self.streams_active += 1
+        return stream
+
+    def _stream_for(self, session, stream_id, command):
+        """The session of the stream a message is for, opening it on init; None if unknown"""
+        streams = session.streams
+        if streams is None or stream_id not in streams:
+            if command != "init":
+                logger.warning(f"Received '{command}' for unknown stream {stream_id} from {session.client_id}")
+                return None
+            return self._open_stream(session, stream_id)
+        return streams[stream_id]
+
+    async def _process_queued(self, session, stream_id, item):
+        """Process a message in its turn; audio queued before a voice_interrupt is dropped"""
+        epoch, data = item
+        stream = session if stream_id is None else session.streams[stream_id]
+        command = data.get("command")
+        preempted = epoch != stream.utterances.epoch
+        if command == "voice":
+            if preempted:
+                self._drop_voice(stream, data)
+            else:
+                self.handle_voice(stream, data)
+            await self._ack_voice(stream, stream_id, data)
+            return
+        if preempted and command in ("silence", "voice_end"):
+            # Part of an utterance the interrupt already cancelled
+            return
+        handler = self.handlers.get(command)
+        if handler is not None:
+            handler(stream, data)
+        else:
+            logger.info(f"Received unknown command '{command}' from {stream.client_id}: {data}")
+
+    def _drop_voice(self, session, data):
+        """Skip a chunk of an interrupted utterance, keeping any format change it declares"""
+        session.chunk_count += 1
+        session.chunks_preempted += 1
+        self.chunks_preempted += 1
+        sample_rate = data.get("sampleRate")
+        encoding = data.get("encoding")
+        declared_rate, declared_encoding, declared_channels = session.declared_format
+        if (sample_rate and sample_rate != declared_rate) or (encoding and encoding != declared_encoding):
+            self._declare_format(session, None, sample_rate, encoding, declared_channels, "voice")
+
+    async def _ack_voice(self, stream, stream_id, data):
+        """Send the voice_ack for a chunk if the stream asked for acks"""
+        if stream.voice_acks:
+            ack = {"command": "voice_ack", "event_id": data.get("event_id")}
+            if stream_id is not None:
+                ack["stream_id"] = stream_id
+            await self._send_ack(stream.websocket, ack)
+
+    async def _send_ack(self, websocket, ack):
+        try:
+            await websocket.send(json.dumps(ack))
+        except websockets.exceptions.ConnectionClosed:
+            # The client has closed; the messages it sent before that are still processed
+            pass
+
+    def handle_voice(self, session, data):
+        """Handle an audio chunk (hot path: no per-chunk formatting unless DEBUG is enabled)"""
+        if not session.initialized:
+            logger.warning(f"Received voice command before initialization from {session.client_id}")
+            return
+
+        session.chunk_count += 1
+        audio_base64 = data.get("audio")
+        if not audio_base64:
+            return
+
+        segment = session.utterances.segment_for_chunk(data.get("event_id"))
+        if tracing.enabled:
+            tracing.instant("voice.recv", session.session_id, category="voice", event_id=data.get("event_id"))
+            if segment.received_us is None:
+                segment.received_us = tracing.now_us()
+
+        sample_rate = data.get("sampleRate")
+        encoding = data.get("encoding")
+        declared_rate, declared_encoding, declared_channels = session.declared_format
+        if (sample_rate and sample_rate != declared_rate) or (encoding and encoding != declared_encoding):
+            self._declare_format(session, segment, sample_rate, encoding, declared_channels, "voice")
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Received audio chunk {session.chunk_count} from {session.client_id}: "
+                f"event_id={data.get('event_id', 'unknown')} sampleRate={data.get('sampleRate')} "
+                f"encoding={data.get('encoding')} size={len(audio_base64)} base64 chars"
+            )
+
+        # Decode off the event loop when an executor is configured
+        lane = session.lane
+        if lane is not None:
+            segment.inflight += 1
+            lane.submit(segment, self.chunk_processor, audio_base64, size=len(audio_base64))
+        else:
+            self._apply_audio(session, segment, self.chunk_processor(audio_base64))
+
+    def handle_silence(self, session, data):
+        """Handle a silence marker the sender sent in place of a silent chunk"""
+        if not session.initialized:
+            logger.warning(f"Received silence command before initialization from {session.client_id}")
+            return
+        duration_ms = data.get("duration_ms")
+        if not duration_ms or duration_ms <= 0:
+            return
+
+        session.chunk_count += 1
+        self.silence_ms_received += duration_ms
+        segment = session.utterances.segment_for_chunk(data.get("event_id"))
+        sample_rate = data.get("sampleRate")
+        declared_rate, declared_encoding, declared_channels = session.declared_format
+        if sample_rate and sample_rate != declared_rate:
+            self._declare_format(session, segment, sample_rate, declared_encoding, declared_channels, "silence")
+
+        # Synthesised when it is applied, so it plays out in order with the chunks around it
+        if session.lane is not None:
+            session.lane.put_marker(segment, ("silence", duration_ms))
+        else:
+            self._store_audio(session, segment, *session.audio_stage.convert(
+                session.audio_format.silence(duration_ms)))
+
+    def _declare_format(self, session, segment, sample_rate, encoding, channels, source):
+        """Record a declared format; it takes effect in order with the chunks around it"""
+        declared_rate, declared_encoding, declared_channels = session.declared_format
+        session.declared_format = (sample_rate or declared_rate, encoding or declared_encoding,
+                                   channels or declared_channels)
+        if session.lane is not None:
+            session.lane.put_marker(None, ("format", session.declared_format, source))
+        else:
+            self._apply_format(session, session.declared_format, source)
+
+    def _apply_format(self, session, declared_format, source):
+        sample_rate, encoding, channels = declared_format
+        if session.audio_format.update(sample_rate, encoding, channels, source):
+            self.format_changes += 1
+
+    def _apply_audio(self, session, segment, audio_bytes):
+        """Convert and apply a decoded voice chunk (inline mode)"""
+        if segment.cancelled:
+            return
+        self.audio_bytes_received += len(audio_bytes)
+        self._store_audio(session, segment, *session.audio_stage.convert(audio_bytes))
+
+    def _store_audio(self, session, segment, audio_bytes, output_rate, features):
+        """Store converted audio in its utterance segment, deliver its features and feed the
+        session's jitter buffer"""
+        if segment.cancelled or not audio_bytes:
+            return
+        segment.chunks.append(audio_bytes)
+        segment.bytes += len(audio_bytes)
+
+        if features is not None:
+            self.feature_sink(session.client_id, features)
+
+        # Reframe into steady 10ms frames for the publisher
+        jitter_buffer = session.jitter_buffer
+        if jitter_buffer is None:
+            jitter_buffer = session.jitter_buffer = JitterBuffer(
+                sample_rate=output_rate, channels=TARGET_CHANNELS
+            )
+            if self.video_frame_sink is not None and self.renderer_pool is not None:
+                session.renderer = self.renderer_pool.open(session.quality, output_rate, session.avatar_id)
+            elif self.video_frame_sink is not None:
+                session.renderer = AvatarRenderer.for_quality(session.quality, output_rate,
+                                                              self._avatar_sprites(session))
+            self._start_playout(session)
+            if self.governor is not None and session.renderer is not None:
+                self.governor.add(session)
+        if segment.start_offset is None:
+            segment.start_offset = jitter_buffer.write_offset
+        jitter_buffer.push(audio_bytes)
+        segment.end_offset = jitter_buffer.write_offset
+
+    async def _consume_results(self, session, lane):
+        """Apply executor results for one session, in the order the chunks arrived"""
+        results = lane.results
+        while True:
+            item = await results.get()
+            if item is None:
+                return
+            segment, value = item
+            if isinstance(value, LaneMarker):
+                kind = value.value[0]
+                if kind == "voice_end":
+                    self._end_voice(session, segment)
+                elif kind == "format":
+                    # Applied by the lane's stage; True if an established format changed
+                    self.format_changes += value.value[1]
+                elif kind == "silence":
+                    self._store_audio(session, segment, *value.value[1:])
+                continue
+            # None: the chunk was dropped as stale or failed to decode
+            segment.inflight -= 1
+            if value is None or segment.cancelled:
+                continue
+            input_bytes, *converted = value
+            self.audio_bytes_received += input_bytes
+            self._store_audio(session, segment, *converted)
+
+    async def _close_lane(self, session):
+        """Wait for queued chunk work to finish and be applied"""
+        if session.lane is None:
+            return
+        lane, session.lane = session.lane, None
+        await lane.close()
+        await session.result_task
+        # In process mode the stage's state came back from the pool as a copy
+        session.audio_stage = lane.state
+        session.audio_format = lane.state.audio_format
+
+    def handle_voice_end(self, session, data):
+        """Handle voice end command"""
+        event_id = data.get("event_id", "unknown")
+        logger.info(f"✅ Received VOICE_END command from {session.client_id}, event_id: {event_id}")
+
+        # Later chunks start a new utterance; the end of this one applies after
+        # any of its chunks still being processed
+        segment = session.utterances.end()
+        if segment is None:
+            return
+        if session.lane is not None:
+            session.lane.put_marker(segment, ("voice_end",))
+        else:
+            self._end_voice(session, segment)
+
+    def _end_voice(self, session, segment):
+        """Play out the tail of the current utterance"""
+        # Optional: Save accumulated audio when voice ends
+        logger.info(f"Voice session ended, saving {len(segment.chunks)} audio chunks of utterance {segment.index}")
+        if session.jitter_buffer is not None:
+            session.jitter_buffer.mark_end()
+
+    def handle_voice_interrupt(self, session, data):
+        """Handle voice interrupt command"""
+        event_id = data.get("event_id", "unknown")
+        logger.info(f"🛑 Received VOICE_INTERRUPT command from {session.client_id}, event_id: {event_id}")
+
+        interrupted_at = time.monotonic()
+
+        # Cancel the open utterance and any not yet played out. Queued executor
+        # work for them is dropped lazily by the lane, so this is O(1) in the
+        # amount of queued audio.
+        jitter_buffer = session.jitter_buffer
+        played_offset = jitter_buffer.read_offset if jitter_buffer is not None else 0
+        cancelled = session.utterances.interrupt(played_offset)
+        dropped = jitter_buffer.flush(interrupted_at) if jitter_buffer is not None else 0
+
+        if self.interrupt_sink is not None:
+            self.interrupt_sink(session.client_id, event_id)
+
+        if cancelled:
+            logger.info(f"Voice interrupted, discarding {len(cancelled)} utterance(s) "
+                        f"and {dropped} buffered frames")
+
+    def handle_legacy_config(self, session, data):
+        """Handle the legacy config format (no command field) for backward compatibility"""
+        if "avatar_id" not in data:
+            logger.info(f"Received unknown command 'None' from {session.client_id}: {data}")
+            return
+
+        client_id = session.client_id
+        logger.info(f"Received legacy config from {client_id} (missing command field):")
+        logger.info(f"  Avatar ID: {data.get('avatar_id')}")
+        logger.info(f"  Quality: {data.get('quality')}")
+        logger.info(f"  Version: {data.get('version')}")
+
+        # Send legacy acknowledgment
+        session.quality = data.get('quality')
+        session.avatar_id = data.get('avatar_id')
+        if isinstance(data.get('priority'), int):
+            session.priority = data['priority']
+        self._warm_avatar(session, session.avatar_id)
+        session.initialized = True
+        tracing.instant("init", session.session_id, avatar_id=data.get('avatar_id'), quality=session.quality)
+        logger.info(f"Session initialized with legacy format for {client_id}")
+
     async def handle_client(self, websocket):
         """Handle incoming WebSocket connections"""
-        client_id = f"client_{self.connection_count}"
+        connection_index = self.connection_count
+        client_id = f"client_{connection_index}"
         self.connection_count += 1
+        self.active_connections += 1
         remote_address = websocket.remote_address if hasattr(websocket, 'remote_address') else 'unknown'
         logger.info(f"New connection: {client_id} from {remote_address}")
-        
-        chunk_count = 0
-        audio_data_buffer = []
-        session_initialized = False
-        
+
+        session = self._open_session(client_id)
+        session.websocket = websocket
+        # Audio and in-order commands queue here, so the reader keeps reading while they are
+        # processed and sees a voice_interrupt behind them (multiplexed streams take fair turns)
+        scheduler = session.scheduler = StreamScheduler(
+            lambda stream_id, item: self._process_queued(session, stream_id, item))
+        self.memory_accountant.add(session, self._sessions_of)
+        heartbeat = self.heartbeat
+        if heartbeat is not None:
+            heartbeat.add(session)
+        self.loop_lag.start()
+
         try:
             # Try to get headers if available
+            auth_header = ""
             try:
                 if hasattr(websocket, 'request_headers'):
                     headers = websocket.request_headers
@@ -61,105 +748,171 @@ class WebSocketTestReceiver:
                     logger.info("Headers not accessible in this websockets version")
             except Exception as e:
                 logger.info(f"Could not access headers: {e}")
-            
+            session.session_id = tracing.session_id_from_token(auth_header) or session.session_id
+            tracing.instant("ws.accept", session.session_id, client_id=client_id)
+            capture = self.capture
+            if capture is not None:
+                capture.opened(connection_index, auth_header, remote_address)
+
+            # Bind hot-path lookups once per connection
+            loads = json.loads
+            put = scheduler.put
+            priority_commands = self.priority_commands
+            handlers = self.handlers
+            memory_ok = session.memory_ok
+            monotonic = time.monotonic
+
             async for message in websocket:
+                session.last_message_at = monotonic()
+                if not memory_ok.is_set():
+                    # Over a memory cap: stop reading until the queues drain
+                    await memory_ok.wait()
+                self.messages_received += 1
+                if capture is not None:
+                    capture.message(connection_index, message)
                 try:
-                    data = json.loads(message)
+                    data = loads(message)
                     command = data.get("command")
-                    
-                    if command == "init":
-                        # Handle initialization command
-                        logger.info(f"Received INIT command from {client_id}:")
-                        logger.info(f"  Avatar ID: {data.get('avatar_id')}")
-                        logger.info(f"  Quality: {data.get('quality')}")
-                        logger.info(f"  Version: {data.get('version')}")
-                        logger.info(f"  Video Encoding: {data.get('video_encoding')}")
-                        
-                        if 'agora_settings' in data:
-                            agora = data['agora_settings']
-                            logger.info(f"  Agora Settings:")
-                            logger.info(f"    App ID: {agora.get('app_id')}")
-                            logger.info(f"    Channel: {agora.get('channel')}")
-                            logger.info(f"    UID: {agora.get('uid')}")
-                            logger.info(f"    Enable String UID: {agora.get('enable_string_uid')}")
-                        
-                        # Mark session as initialized
-                        session_initialized = True
-                        logger.info(f"Session initialized for {client_id}")
-                        
-                    elif command == "voice":
-                        # Audio chunk message
-                        if not session_initialized:
-                            logger.warning(f"Received voice command before initialization from {client_id}")
-                            continue
-                        
-                        chunk_count += 1
-                        event_id = data.get("event_id", "unknown")
-                        sample_rate = data.get("sampleRate", 24000)
-                        encoding = data.get("encoding", "PCM16")
-                        
-                        logger.info(f"Received audio chunk {chunk_count} from {client_id}")
-                        logger.info(f"  Event ID: {event_id}")
-                        logger.info(f"  Sample Rate: {sample_rate}")
-                        logger.info(f"  Encoding: {encoding}")
-                        
-                        # Decode and store audio data
-                        audio_base64 = data.get("audio", "")
-                        if audio_base64:
-                            audio_bytes = base64.b64decode(audio_base64)
-                            audio_data_buffer.append(audio_bytes)
-                            logger.info(f"  Audio size: {len(audio_bytes)} bytes")
-                    
-                    elif command == "voice_end":
-                        # Handle voice end command
-                        event_id = data.get("event_id", "unknown")
-                        logger.info(f"✅ Received VOICE_END command from {client_id}, event_id: {event_id}")
-                        
-                        # Optional: Save accumulated audio when voice ends
-                        if audio_data_buffer:
-                            logger.info(f"Voice session ended, saving {len(audio_data_buffer)} audio chunks")
-                    
-                    elif command == "voice_interrupt":
-                        # Handle voice interrupt command
-                        event_id = data.get("event_id", "unknown")
-                        logger.info(f"🛑 Received VOICE_INTERRUPT command from {client_id}, event_id: {event_id}")
-                        
-                        # Optional: Clear audio buffer on interrupt
-                        if audio_data_buffer:
-                            logger.info(f"Voice interrupted, discarding {len(audio_data_buffer)} audio chunks")
-                            audio_data_buffer.clear()
-                        
-                    elif "avatar_id" in data and not command:
-                        # Legacy format - handle for backward compatibility
-                        logger.info(f"Received legacy config from {client_id} (missing command field):")
-                        logger.info(f"  Avatar ID: {data.get('avatar_id')}")
-                        logger.info(f"  Quality: {data.get('quality')}")
-                        logger.info(f"  Version: {data.get('version')}")
-                        
-                        # Send legacy acknowledgment
-                        session_initialized = True
-                        logger.info(f"Session initialized with legacy format for {client_id}")
-                        
-                    else:
-                        logger.info(f"Received unknown command '{command}' from {client_id}: {data}")
-                        
+                    stream_id = data.get("stream_id")
+                    target = session if stream_id is None else self._stream_for(session, stream_id, command)
+                    if target is None:
+                        continue
+
+                    # Control takes effect now; an interrupt moves the epoch past the queued audio
+                    if command in priority_commands:
+                        handlers[command](target, data)
+                        if command == "voice_interrupt" and target.sequence is not None:
+                            # Chunks held for a missing seq are stale now; queue them to be dropped
+                            await self._queue_held(target)
+                        continue
+
+                    # Stamped with the epoch it was read in, to tell whether an interrupt overtook it
+                    item = (target.utterances.epoch, data)
+                    seq = data.get("seq") if command == "voice" else None
+                    if type(seq) is int:
+                        sequence = target.sequence
+                        if sequence is None:
+                            sequence = target.sequence = SequenceWindow()
+                        # Duplicates are dropped here; chunks ahead of a missing seq wait for it
+                        dropped = sequence.duplicates + sequence.late
+                        for ready, size in sequence.push(seq, (item, len(message))):
+                            await put(stream_id, ready, size)
+                        if sequence.duplicates + sequence.late != dropped:
+                            # Still ack it, or the sender waits on it forever
+                            await self._ack_voice(target, stream_id, data)
+                        continue
+                    if target.sequence is not None:
+                        # Anything else queued in order ends the wait for a missing seq
+                        await self._queue_held(target)
+                    await put(stream_id, item, len(message))
+
                 except json.JSONDecodeError as e:
                     logger.error(f"Failed to parse JSON from {client_id}: {e}")
                 except Exception as e:
                     logger.error(f"Error processing message from {client_id}: {e}")
-            
-            # Save received audio if any
-            if audio_data_buffer:
-                self.save_audio(audio_data_buffer, sample_rate=24000)
-                logger.info(f"Saved {len(audio_data_buffer)} audio chunks to {OUTPUT_WAV_FILE}")
-                
+
+            for stream in self._sessions_of(session):
+                if stream.sequence is not None:
+                    await self._queue_held(stream)
+            await scheduler.close()
+            for stream in self._sessions_of(session):
+                await self._close_lane(stream)
+
+                # Save received audio if any
+                audio_chunks = stream.utterances.kept_chunks()
+                if audio_chunks:
+                    self.save_audio(audio_chunks, sample_rate=stream.audio_format.output_rate)
+                    logger.info(f"Saved {len(audio_chunks)} audio chunks to {self.output_wav_file}")
+
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"Connection closed: {client_id}")
         except Exception as e:
             logger.error(f"Error handling client {client_id}: {e}")
         finally:
-            logger.info(f"Client {client_id} disconnected. Total chunks received: {chunk_count}")
-    
+            self.active_connections -= 1
+            self.memory_accountant.remove(session)
+            if heartbeat is not None:
+                heartbeat.remove(session)
+            if self.capture is not None:
+                self.capture.closed(connection_index)
+                self.capture.flush()
+            scheduler.cancel()
+            if session.streams is not None:
+                logger.info(f"Stream scheduler stats for {client_id}: {scheduler.stats()}")
+                self.streams_active -= len(session.streams)
+            for stream in self._sessions_of(session):
+                await self._finish_session(stream)
+
+    def _open_session(self, client_id):
+        """Create the receiver state for a connection or one of its streams"""
+        session = ClientSession(client_id, self.target_sample_rate, extract_features=self.feature_sink is not None)
+        if self.executor is not None:
+            session.lane = self.executor.open_lane(is_stale=session.utterances.is_stale, stage=run_audio_stage,
+                                                   state=session.audio_stage)
+            session.result_task = asyncio.create_task(self._consume_results(session, session.lane))
+        return session
+
+    def _sessions_of(self, session):
+        """A connection's own session followed by its streams' sessions"""
+        if session.streams is None:
+            return [session]
+        return [session] + list(session.streams.values())
+
+    async def _queue_held(self, session):
+        """Queue the chunks a session's sequence window holds, giving up on the seqs missing before them"""
+        for item, size in session.sequence.flush():
+            await session.scheduler.put(session.stream_id, item, size)
+
+    def _reader_blocked(self, session):
+        """Whether the connection's reader has stopped taking messages (memory cap or full backlog)"""
+        return session.memory_paused_at is not None or session.scheduler.full()
+
+    def _reap(self, session, reason):
+        """Drop a connection that failed its heartbeat; returns (sessions, bytes) its cleanup releases"""
+        sessions = self._sessions_of(session)
+        reclaimed = sum(sum(session_memory(stream).values()) for stream in sessions)
+        logger.warning(f"Reaping {session.client_id} ({reason}); releasing {len(sessions)} sessions "
+                       f"holding {reclaimed} bytes")
+        websocket = session.websocket
+        transport = getattr(websocket, "transport", None)
+        if transport is not None:
+            # A half-open peer would never complete a closing handshake
+            transport.abort()
+        else:
+            task = asyncio.create_task(websocket.close(1001, "heartbeat failed"))
+            self._reaping.add(task)
+            task.add_done_callback(self._reaping.discard)
+        # A reader paused by the memory cap wakes up to see the connection closed
+        session.memory_ok.set()
+        return len(sessions), reclaimed
+
+    async def _finish_session(self, session):
+        """Stop a session's work and record its stats"""
+        client_id = session.client_id
+        await self._close_lane(session)
+        session.playout_stop.set()
+        if session.playout_task is not None:
+            await session.playout_task
+        if self.governor is not None:
+            self.governor.remove(session)
+        if self.renderer_pool is not None and session.renderer is not None:
+            session.renderer.close()
+        if session.jitter_buffer is not None:
+            self.jitter_stats[client_id] = session.jitter_buffer.stats()
+            logger.info(f"Jitter buffer stats for {client_id}: {self.jitter_stats[client_id]}")
+        if session.sequence is not None:
+            self.sequence_stats[client_id] = session.sequence.stats()
+            if any(self.sequence_stats[client_id].values()):
+                logger.info(f"Voice sequence stats for {client_id}: {self.sequence_stats[client_id]}")
+        if session.media_clock is not None:
+            self.av_sync_stats[client_id] = session.media_clock.stats()
+            logger.info(f"A/V sync stats for {client_id}: {self.av_sync_stats[client_id]}")
+        if session.audio_format.sample_rate is not None:
+            logger.info(f"Audio format for {client_id}: {session.audio_format.stats()}")
+        tracing.instant("ws.close", session.session_id, client_id=client_id, chunks=session.chunk_count)
+        preempted = f" ({session.chunks_preempted} dropped after interrupts)" if session.chunks_preempted else ""
+        logger.info(f"Client {client_id} disconnected. Total chunks received: {session.chunk_count}{preempted}")
+
     def save_audio(self, audio_chunks, sample_rate=24000):
         """Save received audio chunks to a WAV file"""
         try:
@@ -167,57 +920,210 @@ class WebSocketTestReceiver:
             combined_audio = b''.join(audio_chunks)
             
             # Write to WAV file (assuming PCM16, mono)
-            with wave.open(OUTPUT_WAV_FILE, 'wb') as wf:
+            with wave.open(self.output_wav_file, 'wb') as wf:
                 wf.setnchannels(1)  # Mono
                 wf.setsampwidth(2)  # 16-bit PCM
                 wf.setframerate(sample_rate)
                 wf.writeframes(combined_audio)
             
-            logger.info(f"Audio saved to {OUTPUT_WAV_FILE}")
+            logger.info(f"Audio saved to {self.output_wav_file}")
             logger.info(f"Total audio size: {len(combined_audio)} bytes")
             logger.info(f"Duration: {len(combined_audio) / (sample_rate * 2):.2f} seconds")
             
         except Exception as e:
             logger.error(f"Error saving audio: {e}")
     
-    async def start_server(self):
+    def stats(self):
+        """Return receiver-wide counters as a plain dict"""
+        stats = {
+            "connections_total": self.connection_count,
+            "connections_active": self.active_connections,
+            "streams_total": self.streams_opened,
+            "streams_active": self.streams_active,
+            "messages_received": self.messages_received,
+            "audio_bytes_received": self.audio_bytes_received,
+            "silence_ms_received": self.silence_ms_received,
+            "chunks_preempted": self.chunks_preempted,
+            "voice_duplicates": sum(s["duplicates"] for s in self.sequence_stats.values()),
+            "voice_gaps": sum(s["gaps"] for s in self.sequence_stats.values()),
+            "voice_reordered": sum(s["reordered"] for s in self.sequence_stats.values()),
+            "voice_late": sum(s["late"] for s in self.sequence_stats.values()),
+            "jitter_underruns": sum(s["underruns"] for s in self.jitter_stats.values()),
+            "format_changes": self.format_changes,
+            "frames_rendered": self.frames_rendered,
+            "video_frames_dropped": sum(s["video_frames_dropped"] for s in self.av_sync_stats.values()),
+            "video_frames_duplicated": sum(s["video_frames_duplicated"] for s in self.av_sync_stats.values()),
+        }
+        stats.update(self.loop_lag.stats())
+        stats.update(self.memory_accountant.stats())
+        if self.avatar_cache is not None:
+            stats.update(self.avatar_cache.stats())
+        if self.renderer_pool is not None:
+            stats.update(self.renderer_pool.stats())
+        if self.governor is not None:
+            stats.update(self.governor.stats())
+        if self.heartbeat is not None:
+            stats.update(self.heartbeat.stats())
+        if self.capture is not None:
+            stats.update(self.capture.stats())
+        if self.executor is not None:
+            stats.update(self.executor.stats())
+        return stats
+
+    async def stats_report(self):
+        """stats() plus per-session memory, per-connection round trips, per renderer worker load,
+        recent tier changes, and allocations per stage when profiling"""
+        report = dict(self.stats(), pid=os.getpid(), sessions=self.memory_accountant.sessions())
+        if self.heartbeat is not None:
+            report["connections"] = self.heartbeat.connections()
+        if self.renderer_pool is not None:
+            report["renderer_workers"] = self.renderer_pool.worker_stats()
+        if self.governor is not None:
+            report["governor_decisions"] = self.governor.decisions()
+        if self.memory_profiler is not None:
+            # A snapshot takes seconds on a busy node; keep it off the event loop
+            report["memory_profile"] = await asyncio.to_thread(self.memory_profiler.stage_bytes)
+        return report
+
+    async def process_request(self, connection, request):
+        """Answer GET /stats with stats_report() as JSON; anything else goes on to the WebSocket handshake"""
+        if request.path.split("?")[0] != "/stats":
+            return None
+        report = await self.stats_report()
+        response = connection.respond(HTTPStatus.OK, json.dumps(report, indent=2) + "\n")
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    def serve_options(self):
+        """Extra websockets.serve() arguments: our heartbeat replaces the library's keepalive pings"""
+        if self.heartbeat is not None and self.heartbeat.interval is not None:
+            return {"ping_interval": None}
+        return {}
+
+    async def start_server(self, port=WEBSOCKET_PORT):
         """Start the WebSocket server"""
         hostname = get_server_hostname()
         
         logger.info("=" * 60)
         logger.info("WEBSOCKET TEST RECEIVER")
         logger.info("=" * 60)
-        logger.info(f"Starting WebSocket test receiver on port {WEBSOCKET_PORT}")
+        logger.info(f"Starting WebSocket test receiver on port {port}")
         logger.info(f"Server hostname: {hostname}")
         logger.info("")
         logger.info("WebSocket URLs:")
-        logger.info(f"  ws://{hostname}:{WEBSOCKET_PORT}")
-        logger.info(f"  ws://localhost:{WEBSOCKET_PORT}")
+        logger.info(f"  ws://{hostname}:{port}")
+        logger.info(f"  ws://localhost:{port}")
         logger.info("")
         logger.info("Expecting messages with commands:")
         logger.info("  - 'init': Session initialization")
         logger.info("  - 'voice': Audio data chunks") 
         logger.info("  - 'voice_end': End of voice transmission")
+        logger.info("  - 'silence': Silence in place of a voice chunk")
         logger.info("  - 'voice_interrupt': Voice interruption")
         logger.info("")
-        logger.info("Audio will be saved to: " + OUTPUT_WAV_FILE)
+        logger.info("Audio will be saved to: " + self.output_wav_file)
+        logger.info(f"Stats: http://localhost:{port}/stats")
         logger.info("Press Ctrl+C to stop")
         logger.info("=" * 60)
         
         # Bind to all interfaces (0.0.0.0) so it can be accessed via any hostname
-        async with websockets.serve(self.handle_client, "0.0.0.0", WEBSOCKET_PORT):
-            logger.info(f"✅ WebSocket server started successfully on 0.0.0.0:{WEBSOCKET_PORT}")
+        async with websockets.serve(self.handle_client, "0.0.0.0", port, process_request=self.process_request,
+                                    **self.serve_options()):
+            logger.info(f"✅ WebSocket server started successfully on 0.0.0.0:{port}")
             logger.info("Waiting for connections...")
             await asyncio.Future()  # Run forever
 
 
-async def main():
-    receiver = WebSocketTestReceiver()
-    await receiver.start_server()
+def create_executor(mode, max_workers=None):
+    """Build the chunk executor for the given mode ('inline' runs on the event loop)"""
+    if mode == "inline":
+        return None
+    return ChunkExecutor(mode, max_workers=max_workers)
+
+
+async def main(port=WEBSOCKET_PORT, executor_mode="inline", executor_workers=None,
+               target_sample_rate=TARGET_SAMPLE_RATE, capture_file=None,
+               max_session_bytes=MAX_SESSION_BYTES, max_node_bytes=MAX_NODE_BYTES, memory_profile=False,
+               heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT, idle_timeout=IDLE_TIMEOUT):
+    capture = TrafficCapture(capture_file) if capture_file else None
+    receiver = WebSocketTestReceiver(executor=create_executor(executor_mode, executor_workers),
+                                     target_sample_rate=target_sample_rate, capture=capture,
+                                     max_session_bytes=max_session_bytes, max_node_bytes=max_node_bytes,
+                                     memory_profile=memory_profile, heartbeat_interval=heartbeat_interval,
+                                     heartbeat_timeout=heartbeat_timeout, idle_timeout=idle_timeout)
+    try:
+        await receiver.start_server(port)
+    finally:
+        if capture is not None:
+            capture.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="WebSocket test receiver")
+    parser.add_argument("--port", type=int, default=WEBSOCKET_PORT, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes sharing the port via SO_REUSEPORT")
+    parser.add_argument("--executor", choices=EXECUTOR_MODES, default="inline",
+                        help="Where per-chunk decoding and processing runs")
+    parser.add_argument("--executor-workers", type=int, default=None,
+                        help="Pool size for the thread/process executor")
+    parser.add_argument("--target-sample-rate", type=int, default=TARGET_SAMPLE_RATE,
+                        help="Sample rate audio is converted to for the publisher (0 keeps the sender's rate)")
+    parser.add_argument("--trace-file", default=None,
+                        help="Append Chrome trace events to this file (also set by TRACE_FILE)")
+    parser.add_argument("--capture-file", default=None,
+                        help="Record inbound traffic to this file for traffic_replay.py (.gz to compress; "
+                             "with --workers, one file per worker)")
+    parser.add_argument("--max-session-mb", type=float, default=MAX_SESSION_BYTES / 1024 / 1024,
+                        help="Memory cap per session before backpressure and disconnection (0 for none)")
+    parser.add_argument("--max-node-mb", type=float, default=MAX_NODE_BYTES / 1024 / 1024,
+                        help="Memory cap for all sessions together, shared out across --workers (0 for none)")
+    parser.add_argument("--memory-profile", action="store_true",
+                        help="Attribute allocations to pipeline stages with tracemalloc (slow); see /stats")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL,
+                        help="Seconds between pings to each connection (0 disables them)")
+    parser.add_argument("--heartbeat-timeout", type=float, default=HEARTBEAT_TIMEOUT,
+                        help="Seconds to wait for a pong before reaping the connection as dead")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT or 0,
+                        help="Seconds without a message before reaping the connection as idle "
+                             "(default 0: never; the heartbeat reaps dead connections)")
+    return parser.parse_args()
+
+
+def megabytes_to_bytes(megabytes):
+    """Cap in bytes from a --max-*-mb flag; 0 means no cap"""
+    return int(megabytes * 1024 * 1024) if megabytes > 0 else None
+
+
+def seconds_or_none(seconds):
+    """Interval from a seconds flag; 0 means disabled"""
+    return seconds if seconds > 0 else None
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.trace_file:
+        # Workers inherit it through the environment
+        tracing.configure(args.trace_file, "websocket_test_receiver")
     try:
-        asyncio.run(main())
+        if args.workers > 1:
+            from receiver_supervisor import ReceiverSupervisor
+            ReceiverSupervisor(args.workers, port=args.port, executor_mode=args.executor,
+                               executor_workers=args.executor_workers,
+                               target_sample_rate=args.target_sample_rate or None,
+                               capture_file=args.capture_file,
+                               max_session_bytes=megabytes_to_bytes(args.max_session_mb),
+                               max_node_bytes=megabytes_to_bytes(args.max_node_mb),
+                               memory_profile=args.memory_profile,
+                               heartbeat_interval=seconds_or_none(args.heartbeat_interval),
+                               heartbeat_timeout=args.heartbeat_timeout,
+                               idle_timeout=seconds_or_none(args.idle_timeout)).run()
+        else:
+            asyncio.run(main(args.port, args.executor, args.executor_workers, args.target_sample_rate or None,
+                             args.capture_file, megabytes_to_bytes(args.max_session_mb),
+                             megabytes_to_bytes(args.max_node_mb), args.memory_profile,
+                             seconds_or_none(args.heartbeat_interval), args.heartbeat_timeout,
+                             seconds_or_none(args.idle_timeout)))
     except KeyboardInterrupt:
         logger.info("\n🛑 WebSocket server stopped by user")